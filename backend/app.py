@@ -1,9 +1,15 @@
 from flask import Flask, request, jsonify, make_response, Response, send_file
-from pytorch_trainer import train_model, load_temp_model, test_model, train_generator, test_model_custom_image, download_model, plot_confusion_matrix, TEMP_MODEL_PATH
+from pytorch_trainer import load_model_entry, test_model, train_generator, stream_job_events, test_model_custom_image, download_model, plot_confusion_matrix, confusion_matrix_etag, get_confusion_matrix_data, TEMP_MODEL_PATH, INFERENCE_BATCHER
 import os
 from io import BytesIO
 import shutil
 import plotly.graph_objects as go
+from jobs import SCHEDULER
+from sweep import start_sweep, get_sweep
+from metrics import REQUEST_SECONDS, render_metrics
+from profiling import list_profile_artifacts
+from thread_budget import THREAD_BUDGET
+import time
 
 CUSTOM_DATASET_PATH = './custom_data'
 
@@ -12,47 +18,169 @@ CUSTOM_DATASET_PATH = './custom_data'
 
 app = Flask(__name__)
 
-@app.route('/train', methods=['POST'])
-def train_model_endpoint():
-    data = request.get_json()
-    model_layers = data.get('model_layers', [])
+@app.before_request
+def start_request_timer():
+    request.environ['neuralforge.start'] = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = request.environ.get('neuralforge.start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
 
-    default_config = {
-        "epochs": 5,
-        "batchSize": 64,
-        "optimizer": "Adam"
-    }
-    training_config = data.get('training_config', default_config)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics (phase timings, request latencies, jobs, cache sizes)."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
-    output, final_loss, final_accuracy = train_model(model_layers, training_config)
+DEFAULT_TRAINING_CONFIG = {
+    "epochs": 5,
+    "batchSize": 64,
+    "optimizer": "Adam"
+}
 
-    return jsonify({
+def training_result(job):
+    """(body, status code) of /train for a finished job (shared with the async server in asgi.py)."""
+    if job.result is None:
+        return {
+            "status": "error",
+            "job_id": job.id,
+            "message": f"Training {job.status}: {job.error or ''}"
+        }, 500
+
+    output, final_loss, final_accuracy = job.result
+
+    return {
         "status": "success",
+        "job_id": job.id,
         "output": output,
         "loss": final_loss,
         "accuracy": final_accuracy
-    })
+    }, 200
 
-@app.route('/confusion_matrix')
-def get_confusion_matrix():
-    """Returns the confusion matrix as a PNG image response with caching."""
+@app.route('/train', methods=['POST'])
+def train_model_endpoint():
+    data = request.get_json()
+    model_layers = data.get('model_layers', [])
+    training_config = data.get('training_config', DEFAULT_TRAINING_CONFIG)
+
+    # Runs through the job queue so concurrent requests don't oversubscribe the box
+    job = SCHEDULER.submit(model_layers, training_config, priority=data.get('priority', 0))
+    job.wait()
+
+    body, status = training_result(job)
+    return jsonify(body), status
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues a training job and returns its ID immediately."""
+    data = request.get_json() or {}
+    model_layers = data.get('model_layers', [])
+    training_config = data.get('training_config', {"epochs": 5, "batchSize": 64, "optimizer": "Adam"})
+    job = SCHEDULER.submit(model_layers, training_config, priority=data.get('priority', 0))
+    return jsonify({"status": "success", "job_id": job.id, "job_status": job.status}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": SCHEDULER.list(), **SCHEDULER.stats()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = SCHEDULER.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """SSE stream of a job's progress (recent events are replayed first); any number of clients may watch."""
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return Response(stream_job_events(job), mimetype='text/event-stream')
+
+@app.route('/jobs/<job_id>/profile', methods=['GET'])
+def job_profile(job_id):
+    """Lists the profiler artifacts of a job run with training_config.profile set."""
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"job_id": job.id, "files": list_profile_artifacts(job.profile_dir)})
+
+@app.route('/jobs/<job_id>/profile/<filename>', methods=['GET'])
+def download_job_profile(job_id, filename):
+    """Chrome trace (open in chrome://tracing or Perfetto) or top-ops table of a profiled job."""
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if filename not in list_profile_artifacts(job.profile_dir):
+        return jsonify({"error": "No such profile file"}), 404
+    return send_file(os.path.abspath(os.path.join(job.profile_dir, filename)), as_attachment=True,
+                     download_name=f"{job.id}_{filename}")
+
+@app.route('/jobs/<job_id>/model', methods=['GET'])
+def download_job_model(job_id):
+    """Checkpoint written by one specific job."""
+    job = SCHEDULER.get(job_id)
+    if job is None or not os.path.exists(job.checkpoint_path):
+        return Response("Model not found", status=404)
+    return send_file(job.checkpoint_path, as_attachment=True, download_name=f"model_{job_id}.pth",
+                     mimetype="application/octet-stream")
+
+@app.route('/sweeps', methods=['POST'])
+def create_sweep():
+    """Starts a hyperparameter sweep with successive halving; returns its ID.
+
+    Body: {"search_space": {"model_layers": [...], "training_config": {...}},
+           "mode": "grid"|"random", "num_samples": 8, "parallel": 2,
+           "min_epochs": 1, "eta": 3}
+    """
+    data = request.get_json() or {}
     try:
-        img_bytes = plot_confusion_matrix()
-        
-        # Check if we got valid image bytes
-        if not img_bytes or len(img_bytes) == 0:
-            raise ValueError("No confusion matrix data available - train a model first")
-            
-        response = Response(img_bytes, mimetype='image/png')
-        # Add caching headers to prevent unnecessary regeneration
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-        
-    except Exception as e:
-        print(f"Error in confusion matrix route: {str(e)}")  # Debug print
-        # Return a proper error image
+        sweep = start_sweep(
+            data.get('search_space', {}),
+            mode=data.get('mode', 'grid'),
+            num_samples=int(data.get('num_samples', 8)),
+            parallel=data.get('parallel'),
+            min_epochs=data.get('min_epochs', 1),
+            eta=data.get('eta', 3),
+            seed=data.get('seed')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid sweep: {e}"}), 400
+    return jsonify({"status": "success", "sweep_id": sweep.id, "trials": len(sweep.trials)}), 202
+
+@app.route('/sweeps/<sweep_id>', methods=['GET'])
+def sweep_status(sweep_id):
+    """Sweep status and the ranked leaderboard (accuracy + wall time per trial)."""
+    sweep = get_sweep(sweep_id)
+    if sweep is None:
+        return jsonify({"status": "error", "message": "Sweep not found"}), 404
+    return jsonify(sweep.to_dict())
+
+@app.route('/sweeps/<sweep_id>/cancel', methods=['POST'])
+def cancel_sweep(sweep_id):
+    sweep = get_sweep(sweep_id)
+    if sweep is None:
+        return jsonify({"status": "error", "message": "Sweep not found"}), 404
+    sweep.cancel()
+    return jsonify(sweep.to_dict())
+
+# The fallback image never changes, so it is rendered at most once per process
+_CONFUSION_MATRIX_ERROR_IMAGE = None
+
+def confusion_matrix_error_image():
+    global _CONFUSION_MATRIX_ERROR_IMAGE
+    if _CONFUSION_MATRIX_ERROR_IMAGE is None:
         fig = go.Figure()
         fig.update_layout(
             title=f"No Confusion Matrix Available<br>Train a model first",
@@ -70,20 +198,50 @@ def get_confusion_matrix():
             showarrow=False,
             font=dict(size=14)
         )
-        img_bytes = fig.to_image(format="png")
-        return Response(img_bytes, mimetype='image/png')
+        _CONFUSION_MATRIX_ERROR_IMAGE = fig.to_image(format="png")
+    return _CONFUSION_MATRIX_ERROR_IMAGE
+
+@app.route('/confusion_matrix')
+def get_confusion_matrix():
+    """Returns the confusion matrix as a PNG image response with caching."""
+    # The image only changes when a training run finishes, so browsers can revalidate with the ETag
+    etag = confusion_matrix_etag()
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    try:
+        img_bytes = plot_confusion_matrix()
+        
+        # Check if we got valid image bytes
+        if not img_bytes or len(img_bytes) == 0:
+            raise ValueError("No confusion matrix data available - train a model first")
+            
+        response = Response(img_bytes, mimetype='image/png')
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        print(f"Error in confusion matrix route: {str(e)}")  # Debug print
+        # Return a proper error image
+        return Response(confusion_matrix_error_image(), mimetype='image/png')
+
+@app.route('/confusion_matrix.json')
+def get_confusion_matrix_json():
+    """Raw confusion matrix counts (rows = true label, columns = prediction)."""
+    data = get_confusion_matrix_data()
+    if data is None:
+        return jsonify({"error": "No confusion matrix data available - train a model first"}), 404
+    return jsonify(data)
 
 @app.route('/train_stream', methods=['POST'])
 def train_stream():
     data = request.get_json() or {}
     model_layers = data.get('model_layers', [])
-
-    default_config = {
-        "epochs": 5,
-        "batchSize": 64,
-        "optimizer": "Adam"
-    }
-    training_config = data.get('training_config', default_config)
+    training_config = data.get('training_config', DEFAULT_TRAINING_CONFIG)
     print(f"DEBUG: Received training config: {training_config}")
 
     def generate():
@@ -94,16 +252,20 @@ def train_stream():
 
 @app.route('/test', methods=['POST'])
 def test_endpoint():
-    model = load_temp_model()
+    entry = load_model_entry()
 
-    if model is None:
+    if entry is None:
         return jsonify({
             "status": "error",
             "message": "No trained model found. Please train a model first."
         }), 400
     
     try:
-        image_bytes = test_model(model)
+        # ?format=json skips rendering: just the prediction and the probability vector
+        if request.args.get('format') == 'json':
+            return jsonify(test_model(entry, response_format='json'))
+
+        image_bytes = test_model(entry)
         
         # used to delete the model so you could only test it once, fix later.
         # if os.path.exists(TEMP_MODEL_PATH):
@@ -138,15 +300,18 @@ def test_custom():
             return jsonify({'error': 'No file selected'}), 400
         
         # Load the trained model
-        model = load_temp_model()
-        if model is None:
+        entry = load_model_entry()
+        if entry is None:
             return jsonify({'error': 'No trained model found. Please train a model first.'}), 404
         
         # Open the image from the uploaded file
         image = Image.open(file.stream)
         
+        if request.args.get('format') == 'json':
+            return jsonify(test_model_custom_image(entry, image, response_format='json'))
+
         # Test the model with the custom image
-        image_bytes = test_model_custom_image(model, image)
+        image_bytes = test_model_custom_image(entry, image)
         
         # Return the visualization as PNG (consistent with /test endpoint)
         response = make_response(image_bytes)
@@ -158,17 +323,54 @@ def test_custom():
         return jsonify({'error': f'Error processing image: {str(e)}'}), 500
 
 
+@app.route('/inference_stats', methods=['GET'])
+def inference_stats():
+    """Queue depth and batch-size histograms for the /test_custom micro-batcher, eager vs compiled latency,
+    and how many requests each backend ('int8', 'eager', 'torchscript', ...) actually served."""
+    return jsonify({**INFERENCE_BATCHER.stats(), "int8_model": INFERENCE_BATCHER.int8_status(load_model_entry())})
+
+@app.route('/thread_budget', methods=['GET'])
+def thread_budget():
+    """How the CPU thread budget is currently split between training runs, inference and input pipelines."""
+    return jsonify(THREAD_BUDGET.stats())
+
+@app.route('/inference_config', methods=['POST'])
+def inference_config():
+    """Tune the micro-batching window (ms), max batch size, precision ('fp32'/'bf16'), channels_last
+    backend ('eager'/'torchscript'/'compile'/'onnx'), int8 and int8_tolerance at runtime."""
+    data = request.get_json() or {}
+    try:
+        INFERENCE_BATCHER.configure(
+            window_ms=data.get('window_ms'),
+            max_batch_size=data.get('max_batch_size'),
+            precision=data.get('precision'),
+            channels_last=data.get('channels_last'),
+            backend=data.get('backend'),
+            int8=data.get('int8'),
+            int8_tolerance=data.get('int8_tolerance')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid batching config: {e}"}), 400
+    return jsonify({"status": "success", **INFERENCE_BATCHER.stats()})
+
+
+DOWNLOAD_NAMES = {'fp32': "model.pth", 'int8': "model_int8.pt", 'onnx': "model.onnx"}
+
 @app.route('/download_model', methods=['GET'])
 def download_model_route():
-    """Flask route to send the model file for download."""
-    model_bytes = download_model()
+    """Flask route to send the model file for download (?variant=int8 for the quantized TorchScript model,
+    ?variant=onnx for the ONNX export)."""
+    variant = request.args.get('variant', 'fp32')
+    if variant not in DOWNLOAD_NAMES:
+        return Response(f"variant must be one of {', '.join(DOWNLOAD_NAMES)}", status=400)
+    model_bytes = download_model(variant)
     if model_bytes is None:
         return Response("Model not found", status=404)
     
     return send_file(
         BytesIO(model_bytes),
         as_attachment=True,
-        download_name="model.pth",  # name shown in browser download
+        download_name=DOWNLOAD_NAMES[variant],  # name shown in browser download
         mimetype="application/octet-stream"
     )
 
@@ -0,0 +1,241 @@
+"""Asyncio serving mode for the backend.
+
+    python asgi.py --port 5000            (or: uvicorn asgi:app --port 5000)
+
+/train_stream, /jobs/<id>/events and /train are served on the event loop:
+a watcher waiting for progress is a suspended coroutine, not a blocked
+thread, so hundreds of idle streams cost almost nothing. Every other route
+runs the Flask app on a thread pool (WSGI_WORKERS), which keeps inference,
+rendering and uploads off the loop; training itself runs on the job
+scheduler's threads. Run a single process: jobs, the model registry and the
+progress hub live in memory.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+from contextlib import suppress
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, DEFAULT_TRAINING_CONFIG, training_result
+from jobs import SCHEDULER
+from pytorch_trainer import sse_message, job_summary
+from metrics import REQUEST_SECONDS, Gauge
+
+# Threads running the (blocking) Flask routes
+WSGI_WORKERS = int(os.environ.get('WSGI_WORKERS', 16))
+# A comment line is sent on streams idle this long; it also notices clients that went away
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+
+JOB_EVENTS_ROUTE = re.compile(r'^/jobs/([^/]+)/events$')
+SSE_HEADERS = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+               (b'x-accel-buffering', b'no')]
+
+_open_streams = 0
+SSE_STREAMS_GAUGE = Gauge('neuralforge_sse_streams', 'Open Server-Sent Events streams (async server).',
+                          lambda: _open_streams)
+
+
+async def job_events(job, keepalive=None):
+    """Async generator of a job's progress events (replay first), ending when the job finishes.
+
+    Reads the same progress hub subscription as pytorch_trainer.stream_job_events;
+    the publishing thread wakes the loop instead of a reader thread. Yields None
+    after `keepalive` seconds without events.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    subscription = job.subscribe()
+    subscription.set_waker(lambda: loop.call_soon_threadsafe(ready.set))
+    try:
+        while True:
+            ready.clear()
+            try:
+                event = subscription.get(timeout=0)
+            except TimeoutError:
+                try:
+                    await asyncio.wait_for(ready.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                continue
+            if event is None:
+                return
+            yield event
+    finally:
+        job.unsubscribe(subscription)
+
+
+async def job_stream(job, first=None):
+    """SSE messages: optional `first` event, the job's events, then its done=True summary."""
+    if first is not None:
+        yield sse_message(first)
+    async for event in job_events(job, SSE_KEEPALIVE_SECONDS):
+        yield ': keepalive\n\n' if event is None else sse_message(event)
+    yield sse_message(job_summary(job))
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def until_disconnect(receive, coro):
+    """Runs `coro` unless the client disconnects first, in which case it is cancelled.
+
+    Returns True if `coro` finished.
+    """
+    task = asyncio.ensure_future(coro)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for future in (task, disconnect):
+            if not future.done():
+                future.cancel()
+                with suppress(asyncio.CancelledError):
+                    await future
+    return task.done() and not task.cancelled()
+
+
+async def send_stream(receive, send, messages, route, method, start):
+    """Streams `messages` until they end or the client disconnects.
+
+    One message is read from the generator only after the previous one was
+    handed to the transport (send() waits while the socket buffer is full),
+    so a slow client just falls behind in its bounded hub queue, where
+    per-batch events are dropped first.
+    """
+    global _open_streams
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+    REQUEST_SECONDS.observe(time.perf_counter() - start, route, method, '200')
+    _open_streams += 1
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            next_message = asyncio.ensure_future(messages.__anext__())
+            await asyncio.wait({next_message, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_message.done():
+                next_message.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await next_message
+                return
+            try:
+                message = next_message.result()
+            except StopAsyncIteration:
+                break
+            await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        _open_streams -= 1
+        disconnect.cancel()
+        await messages.aclose()
+
+
+async def send_json(send, body, status=200):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def read_json(receive):
+    """Request body as JSON ({} if empty), None if the client went away; raises ValueError if malformed."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body = b''.join(chunks)
+    return json.loads(body) if body else {}
+
+
+async def train_stream(scope, receive, send, start):
+    """Async /train_stream: submits a job and streams it (same messages as the Flask route)."""
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        return await send_json(send, {"error": "Invalid JSON body"}, 400)
+    if data is None:
+        return
+    training_config = data.get('training_config', DEFAULT_TRAINING_CONFIG)
+    job = SCHEDULER.submit(data.get('model_layers', []), training_config,
+                           priority=training_config.get('priority', 0))
+    first = {'job_id': job.id, 'status': job.status}
+    await send_stream(receive, send, job_stream(job, first), '/train_stream', 'POST', start)
+
+
+async def stream_job(scope, receive, send, start, job_id):
+    """Async /jobs/<id>/events."""
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        await send_json(send, {"error": "Unknown job"}, 404)
+        return
+    await send_stream(receive, send, job_stream(job), '/jobs/<job_id>/events', 'GET', start)
+
+
+async def train(scope, receive, send, start):
+    """Async /train: waits for the job on the loop instead of holding a thread for the whole run.
+
+    Stops waiting (and unsubscribes) as soon as the client disconnects.
+    """
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        return await send_json(send, {"error": "Invalid JSON body"}, 400)
+    if data is None:
+        return
+    job = SCHEDULER.submit(data.get('model_layers', []), data.get('training_config', DEFAULT_TRAINING_CONFIG),
+                           priority=data.get('priority', 0))
+    async def wait_for_job():
+        async for _ in job_events(job):
+            pass
+
+    # Like the Flask route, a client hanging up doesn't cancel the job (see /jobs/<id>/cancel)
+    if not await until_disconnect(receive, wait_for_job()):
+        return
+    body, status = training_result(job)
+    await send_json(send, body, status)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, '/train', 'POST', str(status))
+
+
+wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_WORKERS)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            await send({'type': message['type'] + '.complete'})
+            if message['type'] == 'lifespan.shutdown':
+                return
+
+    if scope['type'] == 'http':
+        start = time.perf_counter()
+        path, method = scope['path'], scope['method']
+        if path == '/train_stream' and method == 'POST':
+            return await train_stream(scope, receive, send, start)
+        if path == '/train' and method == 'POST':
+            return await train(scope, receive, send, start)
+        match = JOB_EVENTS_ROUTE.match(path)
+        if match and method == 'GET':
+            return await stream_job(scope, receive, send, start, match.group(1))
+
+    await wsgi_app(scope, receive, send)
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args(argv)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Microbenchmarks for the trainer's hot paths.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --baseline bench.json --threshold 0.15
+
+Every result is {"value", "unit", "higher_is_better"} under a flat key like
+"train_steps_per_sec/conv2_fc1/bs128". With --baseline, results that got worse
+by more than --threshold (a fraction) are listed and the exit code is 1.
+Runs on CPU with fixed seeds and synthetic data, so no dataset download is needed.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import statistics
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+
+import pytorch_trainer
+from pytorch_trainer import build_dynamic_cnn, load_custom_zip_dataset, plot_confusion_matrix
+from classification_view import render_classification, denormalize_image
+from checkpoint_writer import atomic_save, snapshot_state_dict
+from dataset_cache import NORMALIZATION
+
+LAYER_CONFIGS = {
+    'fc1': [{'type': 'Fully Connected', 'units': 128}],
+    'conv1_fc1': [{'type': 'Convolutional', 'outputChannels': 16, 'kernelSize': 3},
+                  {'type': 'Fully Connected', 'units': 64}],
+    'conv2_fc1': [{'type': 'Convolutional', 'outputChannels': 32, 'kernelSize': 3},
+                  {'type': 'Convolutional', 'outputChannels': 64, 'kernelSize': 3},
+                  {'type': 'Fully Connected', 'units': 128}],
+}
+BATCH_SIZES = (32, 128)
+INPUT_CHANNELS, INPUT_SIZE, NUM_CLASSES = 1, 28, 10
+
+
+def _result(value, unit, higher_is_better=False, **extra):
+    return dict(value=value, unit=unit, higher_is_better=higher_is_better, **extra)
+
+
+def _timed(fn, repeats):
+    """Per-call wall times in seconds (one untimed warmup call first)."""
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _percentile(values, q):
+    return float(np.percentile(np.asarray(values), q))
+
+
+def bench_build(results, repeats):
+    for name, layers in LAYER_CONFIGS.items():
+        times = _timed(lambda: build_dynamic_cnn(layers, INPUT_CHANNELS, INPUT_SIZE, NUM_CLASSES), repeats)
+        results[f'build_seconds/{name}'] = _result(statistics.median(times), 's')
+
+
+def bench_train(results, steps):
+    for name, layers in LAYER_CONFIGS.items():
+        for batch_size in BATCH_SIZES:
+            model = build_dynamic_cnn(layers, INPUT_CHANNELS, INPUT_SIZE, NUM_CLASSES)
+            model.train()
+            optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+            criterion = nn.CrossEntropyLoss()
+            images = torch.randn(batch_size, INPUT_CHANNELS, INPUT_SIZE, INPUT_SIZE)
+            labels = torch.randint(0, NUM_CLASSES, (batch_size,))
+
+            def step():
+                optimizer.zero_grad()
+                loss = criterion(model(images), labels)
+                loss.backward()
+                optimizer.step()
+                loss.item()
+
+            for _ in range(3):
+                step()
+            start = time.perf_counter()
+            for _ in range(steps):
+                step()
+            elapsed = time.perf_counter() - start
+            results[f'train_steps_per_sec/{name}/bs{batch_size}'] = _result(steps / elapsed, 'steps/s', True)
+            results[f'train_samples_per_sec/{name}/bs{batch_size}'] = _result(
+                steps * batch_size / elapsed, 'samples/s', True)
+
+
+def bench_inference(results, repeats):
+    for name, layers in LAYER_CONFIGS.items():
+        model = build_dynamic_cnn(layers, INPUT_CHANNELS, INPUT_SIZE, NUM_CLASSES).eval()
+        for batch_size in (1,) + BATCH_SIZES:
+            images = torch.randn(batch_size, INPUT_CHANNELS, INPUT_SIZE, INPUT_SIZE)
+            with torch.no_grad():
+                times = _timed(lambda: model(images), repeats)
+            key = f'inference/{name}/bs{batch_size}'
+            results[f'{key}/p50'] = _result(_percentile(times, 50), 's')
+            results[f'{key}/p99'] = _result(_percentile(times, 99), 's')
+
+
+def _write_synthetic_zip(path, num_images, image_size=28, num_classes=NUM_CLASSES, seed=0):
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(num_images):
+            split = 'test' if i % 5 == 0 else 'train'
+            pixels = rng.integers(0, 256, (image_size, image_size), dtype=np.uint8)
+            buf = io.BytesIO()
+            Image.fromarray(pixels, mode='L').save(buf, format='PNG')
+            zf.writestr(f'{split}/class_{(i // 5) % num_classes}/img_{i}.png', buf.getvalue())
+
+
+def bench_ingest(results, num_images):
+    """load_custom_zip_dataset on a synthetic ZIP: cold (decode + cache write) and warm (cache hit)."""
+    workdir = tempfile.mkdtemp(prefix='neuralforge_bench_')
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)  # the dataset cache lives under ./dataset_cache
+        os.makedirs('custom_data')
+        _write_synthetic_zip(os.path.join('custom_data', 'bench.zip'), num_images)
+
+        start = time.perf_counter()
+        load_custom_zip_dataset('custom_data')
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        load_custom_zip_dataset('custom_data')
+        warm = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    results['ingest_images_per_sec/cold'] = _result(num_images / cold, 'images/s', True)
+    results['ingest_seconds/warm'] = _result(warm, 's')
+
+
+def bench_render(results, repeats):
+    probabilities = np.full(NUM_CLASSES, 1.0 / NUM_CLASSES, dtype=np.float32)
+    class_names = [str(i) for i in range(NUM_CLASSES)]
+    mean, std = NORMALIZATION[INPUT_CHANNELS]
+    image = denormalize_image(torch.randn(INPUT_CHANNELS, INPUT_SIZE, INPUT_SIZE), mean, std)
+    times = _timed(lambda: render_classification(image, probabilities, class_names, 'Predicted: 0'), repeats)
+    results['render_seconds/classification'] = _result(statistics.median(times), 's')
+
+    rng = np.random.default_rng(0)
+
+    def render_confusion():
+        # New run_id every call, so the per-run PNG cache doesn't hide the render cost
+        pytorch_trainer.CONFUSION_MATRIX_DATA = {
+            'matrix': rng.integers(0, 100, (NUM_CLASSES, NUM_CLASSES)),
+            'num_classes': NUM_CLASSES,
+            'class_names': class_names,
+            'run_id': time.perf_counter_ns(),
+        }
+        plot_confusion_matrix()
+
+    try:
+        times = _timed(render_confusion, max(1, repeats // 4))
+        results['render_seconds/confusion_matrix'] = _result(statistics.median(times), 's')
+    except Exception as e:
+        # Plotly image export needs kaleido, which isn't a hard dependency
+        print(f"Skipping confusion matrix render: {str(e).strip().splitlines()[0]}")
+    finally:
+        pytorch_trainer.CONFUSION_MATRIX_DATA = None
+
+
+def bench_checkpoint(results, repeats):
+    workdir = tempfile.mkdtemp(prefix='neuralforge_bench_')
+    try:
+        for name, layers in LAYER_CONFIGS.items():
+            model = build_dynamic_cnn(layers, INPUT_CHANNELS, INPUT_SIZE, NUM_CLASSES)
+            optimizer = torch.optim.Adam(model.parameters())
+            save_data = {
+                'state_dict': snapshot_state_dict(model.state_dict()),
+                'layers': layers,
+                'input_channels': INPUT_CHANNELS,
+                'input_size': INPUT_SIZE,
+                'num_classes': NUM_CLASSES,
+                'optimizer_state': optimizer.state_dict(),
+            }
+            path = os.path.join(workdir, f'{name}.pth')
+            save_times = _timed(lambda: atomic_save(save_data, path), repeats)
+            load_times = _timed(lambda: torch.load(path, map_location='cpu', weights_only=True), repeats)
+            results[f'checkpoint_save_seconds/{name}'] = _result(
+                statistics.median(save_times), 's', size_bytes=os.path.getsize(path))
+            results[f'checkpoint_load_seconds/{name}'] = _result(statistics.median(load_times), 's')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'build': lambda results, args: bench_build(results, args.repeats),
+    'train': lambda results, args: bench_train(results, args.train_steps),
+    'inference': lambda results, args: bench_inference(results, args.repeats),
+    'ingest': lambda results, args: bench_ingest(results, args.ingest_images),
+    'render': lambda results, args: bench_render(results, args.repeats),
+    'checkpoint': lambda results, args: bench_checkpoint(results, args.repeats),
+}
+
+
+def run_benchmarks(args):
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name} benchmarks...", flush=True)
+        start = time.perf_counter()
+        BENCHMARKS[name](results, args)
+        print(f"  {name} done in {time.perf_counter() - start:.1f}s", flush=True)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Returns (rows, regressions); a row is (key, baseline, current, relative change)."""
+    rows, regressions = [], []
+    for key, result in sorted(current['results'].items()):
+        base = baseline.get('results', {}).get(key)
+        if base is None or not base['value']:
+            continue
+        change = (result['value'] - base['value']) / base['value']
+        rows.append((key, base['value'], result['value'], change))
+        worse = -change if result['higher_is_better'] else change
+        if worse > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown that counts as a regression (default 0.10)')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run a subset of the benchmarks')
+    parser.add_argument('--repeats', type=int, default=50, help='timed calls per latency measurement')
+    parser.add_argument('--train-steps', type=int, default=30, help='timed steps per training measurement')
+    parser.add_argument('--ingest-images', type=int, default=3000, help='images in the synthetic ZIP')
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0 = torch default)')
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"Wrote {len(current['results'])} results to {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(current, baseline, args.threshold)
+    for key, base_value, value, change in rows:
+        marker = '  REGRESSION' if key in regressions else ''
+        print(f"{key:55s} {base_value:12.6g} -> {value:12.6g} ({change:+.1%}){marker}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict
+import torch
+from metrics import PHASE_SECONDS
+
+# How train_model decides which epochs get written:
+#   'last'  - every epoch overwrites the checkpoint (the original behaviour)
+#   'best'  - the checkpoint only changes when test accuracy improves
+#   'final' - only the last epoch is written
+RETENTION_POLICIES = ('last', 'best', 'final')
+
+
+def snapshot_state_dict(state_dict):
+    """Detached CPU copy of a state dict, safe to write while training keeps going."""
+    return OrderedDict((k, v.detach().to('cpu', copy=True)) for k, v in state_dict.items())
+
+
+def snapshot_optimizer_state(state):
+    """Deep CPU copy of optimizer.state_dict() (tensors cloned, containers rebuilt)."""
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {k: snapshot_optimizer_state(v) for k, v in state.items()}
+    if isinstance(state, list):
+        return [snapshot_optimizer_state(v) for v in state]
+    return state
+
+
+def atomic_save(obj, path):
+    """torch.save to a temp file in the same folder, then rename over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class CheckpointWriter:
+    """Background thread that writes checkpoints so training never waits on disk.
+
+    Saves for a path that hasn't started writing yet are coalesced: only the
+    newest data is written. Each write is atomic (temp file + rename), so
+    readers never see a torn checkpoint.
+    """
+    def __init__(self):
+        self._pending = OrderedDict()
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.last_error = None
+        self.writes = 0
+        self.coalesced = 0
+
+    def submit(self, path, save_data, on_written=None):
+        """Queues `save_data` for `path`; on_written(save_data) runs on the writer thread after the rename."""
+        with self._cond:
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = (save_data, on_written)
+            self._pending.move_to_end(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def remove(self, path):
+        """Deletes `path` after any queued write to it (used to prune old checkpoints)."""
+        self.submit(path, None)
+
+    def flush(self, path=None, timeout=None):
+        """Blocks until `path` (or every path) has no queued or in-flight writes."""
+        def idle():
+            if path is None:
+                return not self._pending and not self._in_flight
+            return path not in self._pending and path not in self._in_flight
+        with self._cond:
+            return self._cond.wait_for(idle, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                path, (save_data, on_written) = self._pending.popitem(last=False)
+                self._in_flight.add(path)
+
+            try:
+                if save_data is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    with PHASE_SECONDS.time('checkpoint_save'):
+                        atomic_save(save_data, path)
+                    self.writes += 1
+                    if on_written is not None:
+                        on_written(save_data)
+            except Exception as e:
+                self.last_error = f"{path}: {e}"
+                print(f"Warning: Could not write checkpoint {path}: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight.discard(path)
+                    self._cond.notify_all()
+
+
+CHECKPOINT_WRITER = CheckpointWriter()
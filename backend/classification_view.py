@@ -0,0 +1,87 @@
+import io
+import threading
+from collections import OrderedDict
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from metrics import PHASE_SECONDS
+
+# Figure templates kept around, one per (class names, image shape) combination
+MAX_TEMPLATES = 8
+
+_TEMPLATES = OrderedDict()
+# Matplotlib artists aren't thread-safe; one render at a time is still far cheaper than a new figure
+_RENDER_LOCK = threading.Lock()
+
+
+class _ClassificationTemplate:
+    """Pre-built image + probability-bar figure; each render only updates the artists.
+
+    The layout (tight_layout and the tight crop) is computed once when the
+    template is built, so a render is set_data/set_width/set_text plus one PNG encode.
+    """
+    def __init__(self, class_names, image_shape):
+        self.figure = Figure(figsize=(8, 6))
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax1, ax2 = self.figure.subplots(ncols=2)
+
+        blank = np.zeros(image_shape, dtype=np.float32)
+        if len(image_shape) == 2:
+            self.image = ax1.imshow(blank, cmap='gray')
+        else:
+            self.image = ax1.imshow(blank)
+        ax1.axis('off')
+        # Measured with the tallest title we render (two lines) so the crop never clips it
+        longest = max(class_names, key=len) if class_names else ''
+        self.title = ax1.set_title(f'Actual: {longest}\nPredicted: {longest}', fontsize=12)
+
+        positions = np.arange(len(class_names))
+        self.bars = ax2.barh(positions, np.zeros(len(class_names)))
+        ax2.set_aspect(0.1)
+        ax2.set_yticks(positions)
+        ax2.set_yticklabels(class_names)
+        ax2.set_title('Class Probability')
+        ax2.set_xlim(0, 1.1)
+        self.figure.tight_layout()
+        # Same crop as savefig(bbox_inches='tight'), measured once instead of on every save
+        self.bbox = self.figure.get_tightbbox(self.canvas.get_renderer()).padded(0.1)
+
+    def render(self, image, probabilities, title):
+        self.image.set_data(image)
+        if image.ndim == 2:
+            # imshow autoscales grayscale data; keep doing that for every image
+            self.image.set_clim(float(image.min()), float(image.max()))
+        for bar, probability in zip(self.bars, probabilities):
+            bar.set_width(float(probability))
+        self.title.set_text(title)
+
+        buf = io.BytesIO()
+        self.figure.savefig(buf, format='png', dpi=100, bbox_inches=self.bbox)
+        return buf.getvalue()
+
+
+def denormalize_image(image, mean, std):
+    """Normalized (C, H, W) tensor -> numpy image for display ((H, W) for grayscale)."""
+    image = image.detach().cpu().float()
+    mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1, 1)
+    std = np.asarray(std, dtype=np.float32).reshape(-1, 1, 1)
+    image = image.numpy() * std + mean
+    if image.shape[0] == 1:
+        return image[0]
+    return np.clip(image.transpose(1, 2, 0), 0.0, 1.0)
+
+
+def render_classification(image, probabilities, class_names, title):
+    """PNG bytes showing `image` (numpy, from denormalize_image) next to the class probabilities."""
+    probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1)
+    key = (tuple(class_names), image.shape)
+    with _RENDER_LOCK, PHASE_SECONDS.time('render'):
+        template = _TEMPLATES.get(key)
+        if template is None:
+            template = _ClassificationTemplate(class_names, image.shape)
+            _TEMPLATES[key] = template
+            while len(_TEMPLATES) > MAX_TEMPLATES:
+                _TEMPLATES.popitem(last=False)
+        else:
+            _TEMPLATES.move_to_end(key)
+        return template.render(image, probabilities, title)
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import copy
+import warnings
+import torch
+from precision import autocast, to_channels_last, apply_memory_format
+from onnx_export import onnx_path_for, export_onnx, check_parity
+from onnx_inference import OnnxPredictor
+
+# 'eager' runs the nn.Sequential as is; 'torchscript' traces + freezes it once per checkpoint
+# (saved next to the checkpoint); 'compile' uses torch.compile, whose kernels persist in
+# inductor's own on-disk cache (TORCHINDUCTOR_CACHE_DIR); 'onnx' runs the checkpoint's
+# ONNX export (fp32) through onnxruntime
+INFERENCE_BACKENDS = ('eager', 'torchscript', 'compile', 'onnx')
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'eager')
+LATENCY_RUNS = 20
+
+
+def compiled_cache_path(checkpoint_path, precision, channels_last):
+    """TorchScript artifact for a checkpoint + inference settings, e.g. temp_model_state.fp32.torchscript.pt."""
+    layout = '_cl' if channels_last else ''
+    return f"{os.path.splitext(checkpoint_path)[0]}.{precision}{layout}.torchscript.pt"
+
+
+def _artifact_meta(entry, precision, channels_last):
+    return {
+        'checkpoint_version': list(entry.version),
+        'torch': torch.__version__,
+        'precision': precision,
+        'channels_last': channels_last,
+    }
+
+
+def _median_latency(fn, example):
+    times = []
+    with torch.no_grad():
+        fn(example)
+        for _ in range(LATENCY_RUNS):
+            start = time.perf_counter()
+            fn(example)
+            times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def _build_torchscript(model, example, precision, path, meta):
+    """Traces under the inference autocast/layout, freezes, and saves atomically with `meta` inside."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # torch.jit deprecation notices
+        with torch.no_grad(), autocast(precision, example.device):
+            module = torch.jit.freeze(torch.jit.trace(model, example))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.jit.save(module, tmp_path, _extra_files={'meta.json': json.dumps(meta)})
+    os.replace(tmp_path, path)
+    return module
+
+
+def _load_torchscript(path, device, meta):
+    """Cached artifact if it exists and was built from the same checkpoint/settings, else None."""
+    if not os.path.exists(path):
+        return None
+    extra_files = {'meta.json': ''}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        if json.loads(extra_files['meta.json']) != meta:
+            return None
+        return module
+    except Exception as e:
+        print(f"Compiled inference: ignoring unreadable artifact {path}: {e}")
+        return None
+
+
+class CompiledModel:
+    """Callable used in place of entry.model by the inference batcher.
+
+    `info` records which backend is actually in use ('fallback' to eager if
+    compilation failed), where the artifact lives and eager vs compiled
+    single-image latency.
+    """
+    def __init__(self, entry, backend, precision, channels_last, device):
+        self.entry = entry
+        self.backend = backend
+        self.precision = precision
+        self.channels_last = channels_last
+        self.info = {'backend': backend, 'precision': precision, 'channels_last': channels_last}
+
+        # Own copy without grads: freezing folds (autocast-cast) weights into constants
+        eager = apply_memory_format(copy.deepcopy(entry.model), channels_last).requires_grad_(False)
+        self._eager = eager
+        self._module = None
+
+        example = torch.zeros(1, entry.input_channels, entry.input_size, entry.input_size, device=device)
+        if channels_last:
+            example = to_channels_last(example)
+
+        start = time.perf_counter()
+        try:
+            self._module = self._compile(eager, example, device)
+            self._check_parity(example)
+        except Exception as e:
+            print(f"Compiled inference: {backend} failed, falling back to eager: {e}")
+            self._module = None
+            self.info.update({'status': 'fallback', 'error': str(e).strip().splitlines()[0]})
+        self.info['compile_seconds'] = time.perf_counter() - start
+
+        self.info['eager_ms'] = _median_latency(self._run_eager, example) * 1000
+        if self._module is not None:
+            self.info['compiled_ms'] = _median_latency(self._run_compiled, example) * 1000
+            self.info['speedup'] = self.info['eager_ms'] / self.info['compiled_ms']
+            print(f"Compiled inference ({backend}, {self.info['status']}): "
+                  f"{self.info['eager_ms']:.3f}ms eager vs {self.info['compiled_ms']:.3f}ms compiled per image")
+
+    def _compile(self, eager, example, device):
+        if self.backend == 'torchscript':
+            path = compiled_cache_path(self.entry.checkpoint_path, self.precision, self.channels_last)
+            meta = _artifact_meta(self.entry, self.precision, self.channels_last)
+            self.info['artifact'] = path
+            module = _load_torchscript(path, device, meta)
+            if module is not None:
+                self.info['status'] = 'loaded'
+                return module
+            self.info['status'] = 'compiled'
+            return _build_torchscript(eager, example, self.precision, path, meta)
+
+        if self.backend == 'compile':
+            self.info['status'] = 'compiled'
+            module = torch.compile(eager, dynamic=True)
+            with torch.no_grad(), autocast(self.precision, device):
+                module(example)  # compile now instead of on the first request
+            self.info['artifact'] = os.environ.get('TORCHINDUCTOR_CACHE_DIR')
+            return module
+
+        if self.backend == 'onnx':
+            path = onnx_path_for(self.entry.checkpoint_path)
+            self.info['artifact'] = path
+            batch = torch.randn(2, *example.shape[1:])
+            if os.path.exists(path):
+                # The trainer's export, unless it belongs to other weights (e.g. not promoted yet)
+                try:
+                    check_parity(path, self.entry.model, batch)
+                    self.info['status'] = 'loaded'
+                    return OnnxPredictor(path)
+                except RuntimeError:
+                    pass
+            export_onnx(self.entry.model, path, self.entry.input_channels, self.entry.input_size,
+                        self.entry.class_names or [], {'checkpoint_version': list(self.entry.version)})
+            self.info['status'] = 'compiled'
+            return OnnxPredictor(path)
+
+        raise ValueError(f"Unknown inference backend '{self.backend}'")
+
+    @property
+    def serving_backend(self):
+        """Backend that actually runs requests: self.backend, or 'eager' after a fallback."""
+        return self.backend if self._module is not None else 'eager'
+
+    def _check_parity(self, example):
+        # Batch of 2 also checks the graph didn't bake in batch size 1
+        batch = torch.cat([example, torch.randn_like(example)])
+        if self.channels_last:
+            batch = to_channels_last(batch)
+        with torch.no_grad():
+            expected = self._run_eager(batch).float()
+            actual = self._run_compiled(batch).float()
+        tolerance = 1e-2 if self.precision == 'bf16' else 1e-4
+        if actual.shape != expected.shape or not torch.allclose(actual, expected, atol=tolerance):
+            raise RuntimeError("compiled outputs don't match eager outputs")
+
+    def _run_eager(self, images):
+        with autocast(self.precision, images.device):
+            return self._eager(images)
+
+    def _run_compiled(self, images):
+        if self.backend == 'onnx':
+            return torch.from_numpy(self._module.run(images.cpu().numpy())).to(images.device)
+        if self.backend == 'torchscript':
+            return self._module(images)  # autocast is baked into the traced graph
+        with autocast(self.precision, images.device):
+            return self._module(images)
+
+    def __call__(self, images):
+        if self.channels_last:
+            images = to_channels_last(images)
+        if self._module is None:
+            return self._run_eager(images)
+        return self._run_compiled(images)
@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from dataset_cache import CachedArrayDataset, normalize_batch, NORMALIZATION
+
+# Datasets whose normalized float32 copy would be bigger than this stay on the DataLoader path
+TENSOR_DATASET_MAX_BYTES = int(os.environ.get('TENSOR_DATASET_MAX_MB', 2048)) * 1024 * 1024
+
+# Normalized MNIST tensors, built once per process
+_MNIST_TENSOR_CACHE = {}
+_MNIST_TENSOR_LOCK = threading.Lock()
+
+
+def _mnist_to_tensors(dataset):
+    key = (os.path.abspath(dataset.root), dataset.train)
+    with _MNIST_TENSOR_LOCK:
+        if key not in _MNIST_TENSOR_CACHE:
+            # Same math as ToTensor + Normalize((0.1307,), (0.3081,)), on the whole set at once
+            mean, std = NORMALIZATION[1]
+            images = dataset.data.unsqueeze(1).float().div_(255.0).sub_(mean[0]).div_(std[0])
+            _MNIST_TENSOR_CACHE[key] = (images, dataset.targets.long())
+        return _MNIST_TENSOR_CACHE[key]
+
+
+def tensor_cache_bytes():
+    """Memory held by the process-wide MNIST tensor cache."""
+    with _MNIST_TENSOR_LOCK:
+        return sum(images.numel() * images.element_size() + labels.numel() * labels.element_size()
+                   for images, labels in _MNIST_TENSOR_CACHE.values())
+
+
+def dataset_to_tensors(dataset):
+    """Returns (images, labels) tensors for the whole dataset, or None if it can't be held in memory.
+
+    Supports torchvision MNIST and the packed-array custom datasets; anything
+    else (e.g. LazyZipDataset) stays on the DataLoader path.
+    """
+    if isinstance(dataset, datasets.MNIST):
+        num_bytes = dataset.data.numel() * 4
+        if num_bytes > TENSOR_DATASET_MAX_BYTES:
+            return None
+        return _mnist_to_tensors(dataset)
+
+    if isinstance(dataset, CachedArrayDataset):
+        num_bytes = dataset.images.size * 4
+        if num_bytes > TENSOR_DATASET_MAX_BYTES:
+            return None
+        images = normalize_batch(dataset.images, dataset.mean, dataset.std)
+        labels = torch.as_tensor(dataset.labels, dtype=torch.long)
+        return images, labels
+
+    return None
+
+
+def dataset_labels(dataset):
+    """All labels of a dataset as a tensor, without loading any images (None if unknown)."""
+    for attr in ('targets', 'labels'):
+        labels = getattr(dataset, attr, None)
+        if labels is not None:
+            return torch.as_tensor(labels, dtype=torch.long)
+    return None
+
+
+def stratified_subsample(labels, size, seed=0):
+    """Fixed (seeded) subset of indices with the same class proportions as `labels`.
+
+    `size` is a fraction (0 < size < 1) or a sample count. Every class keeps at
+    least one sample.
+    """
+    num_samples = len(labels)
+    fraction = size if 0 < size < 1 else min(1.0, float(size) / max(1, num_samples))
+    generator = torch.Generator().manual_seed(seed)
+
+    chosen = []
+    for cls in torch.unique(labels):
+        cls_indices = torch.nonzero(labels == cls, as_tuple=True)[0]
+        count = max(1, int(round(len(cls_indices) * fraction)))
+        perm = torch.randperm(len(cls_indices), generator=generator)[:count]
+        chosen.append(cls_indices[perm])
+    return torch.sort(torch.cat(chosen)).values
+
+
+class TensorBatchLoader:
+    """DataLoader replacement for datasets that already live in memory as tensors.
+
+    Batches are taken by indexing the full tensors with a (shuffled)
+    permutation, so there is no per-sample Python work or collation.
+    `indices` restricts iteration to a subset (e.g. demo mode).
+    """
+    def __init__(self, images, labels, batch_size, shuffle=False, indices=None):
+        self.images = images
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.indices = indices
+
+    @property
+    def num_samples(self):
+        return len(self.indices) if self.indices is not None else len(self.labels)
+
+    def __len__(self):
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(self.num_samples)
+            if self.indices is not None:
+                order = self.indices[order]
+        elif self.indices is not None:
+            order = self.indices
+        else:
+            order = None
+
+        for start in range(0, self.num_samples, self.batch_size):
+            if order is None:
+                # Contiguous slices are views, no copy needed
+                yield self.images[start:start + self.batch_size], self.labels[start:start + self.batch_size]
+            else:
+                batch_idx = order[start:start + self.batch_size]
+                yield self.images[batch_idx], self.labels[batch_idx]
+
+
+def resolve_loader_settings(config, device, cpu_count=None):
+    """Input-pipeline settings from training_config, with defaults picked from the CPU count.
+
+    Keys: num_workers, prefetch_factor, persistent_workers, pin_memory and
+    prefetch_thread (background batch assembly for tensor-resident datasets).
+    cpu_count is the run's share of the thread budget (default: all CPUs).
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    num_workers = config.get('num_workers')
+    if num_workers is None:
+        # Leave at least half the cores for the model's intra-op threads
+        num_workers = min(4, cpu_count // 2)
+    num_workers = max(0, int(num_workers))
+
+    prefetch_factor = config.get('prefetch_factor')
+    if prefetch_factor is None:
+        prefetch_factor = 2
+    prefetch_factor = max(1, int(prefetch_factor))
+
+    persistent_workers = config.get('persistent_workers')
+    if persistent_workers is None:
+        persistent_workers = num_workers > 0
+
+    pin_memory = config.get('pin_memory')
+    if pin_memory is None:
+        pin_memory = device.type == 'cuda'
+
+    prefetch_thread = config.get('prefetch_thread')
+    if prefetch_thread is None:
+        prefetch_thread = cpu_count > 1
+
+    return {
+        'num_workers': num_workers,
+        'prefetch_factor': prefetch_factor,
+        'persistent_workers': bool(persistent_workers) and num_workers > 0,
+        'pin_memory': bool(pin_memory) and torch.cuda.is_available(),
+        'prefetch_thread': bool(prefetch_thread),
+    }
+
+
+def build_data_loader(dataset, batch_size, shuffle, settings):
+    """DataLoader configured from resolve_loader_settings()."""
+    kwargs = {
+        'batch_size': batch_size,
+        'shuffle': shuffle,
+        'num_workers': settings['num_workers'],
+        'pin_memory': settings['pin_memory'],
+    }
+    if settings['num_workers'] > 0:
+        kwargs['prefetch_factor'] = settings['prefetch_factor']
+        kwargs['persistent_workers'] = settings['persistent_workers']
+    return DataLoader(dataset, **kwargs)
+
+
+def build_tensor_loader(images, labels, batch_size, shuffle, settings, indices=None):
+    """TensorBatchLoader, optionally pinned and wrapped in a BackgroundPrefetcher."""
+    if settings['pin_memory']:
+        images, labels = images.pin_memory(), labels.pin_memory()
+    loader = TensorBatchLoader(images, labels, batch_size=batch_size, shuffle=shuffle, indices=indices)
+    if settings['prefetch_thread']:
+        loader = BackgroundPrefetcher(loader, depth=settings['prefetch_factor'])
+    return loader
+
+
+class BackgroundPrefetcher:
+    """Assembles the next `depth` batches of `loader` on a background thread.
+
+    Tensor indexing releases the GIL, so gathering the next batch overlaps
+    with the forward/backward pass of the current one.
+    """
+    def __init__(self, loader, depth=2):
+        self.loader = loader
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        q = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        sentinel = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            try:
+                for batch in self.loader:
+                    if not put(batch):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(sentinel)
+
+        thread = threading.Thread(target=producer, name='batch-prefetcher', daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = q.get()
+                if item is sentinel:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumer stopped early (break/exception): let the producer exit
+            stop.set()
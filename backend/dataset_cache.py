@@ -0,0 +1,235 @@
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from zip_ingest import decode_image, image_to_array
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are only serialized within one process
+    fcntl = None
+
+# Preprocessed custom datasets, keyed by the SHA-256 of the uploaded ZIP.
+# Lives outside ./custom_data so re-uploading the same archive still hits.
+DATASET_CACHE_PATH = './dataset_cache'
+CACHE_FORMAT_VERSION = 1
+_BUILD_LOCK = threading.Lock()
+
+# Archives that would decode to more than this are streamed with LazyZipDataset
+LAZY_DATASET_THRESHOLD_BYTES = int(os.environ.get('LAZY_DATASET_THRESHOLD_MB', 2048)) * 1024 * 1024
+# Decoded-image LRU budget per process for LazyZipDataset
+LAZY_CACHE_BYTES = int(os.environ.get('LAZY_DATASET_CACHE_MB', 256)) * 1024 * 1024
+
+# Same constants as the ToTensor + Normalize transforms used for training
+NORMALIZATION = {
+    1: ((0.1307,), (0.3081,)),
+    3: ((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
+}
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir_for(zip_hash):
+    return os.path.join(DATASET_CACHE_PATH, zip_hash)
+
+
+@contextmanager
+def cache_build_lock(zip_hash):
+    """Held while checking for / building the cache of `zip_hash`.
+
+    An flock on <cache>/<hash>.lock, so concurrent jobs and sweep worker
+    processes decode a ZIP once; whoever waited re-checks load_cached_arrays.
+    """
+    os.makedirs(DATASET_CACHE_PATH, exist_ok=True)
+    with _BUILD_LOCK, open(os.path.join(DATASET_CACHE_PATH, f'{zip_hash}.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_cached_arrays(zip_hash, train_images, train_labels, test_images, test_labels, class_to_label):
+    """Writes the packed arrays + metadata for `zip_hash`; the directory appears atomically.
+
+    A valid cache that is already there is kept (another writer got there
+    first and may be reading it). Call with cache_build_lock(zip_hash) held.
+    """
+    if load_cached_arrays(zip_hash) is not None:
+        return
+    final_dir = cache_dir_for(zip_hash)
+    tmp_dir = final_dir + f'.tmp{os.getpid()}'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, 'train_images.npy'), train_images)
+    np.save(os.path.join(tmp_dir, 'train_labels.npy'), np.asarray(train_labels, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'test_images.npy'), test_images)
+    np.save(os.path.join(tmp_dir, 'test_labels.npy'), np.asarray(test_labels, dtype=np.int64))
+
+    meta = {
+        'version': CACHE_FORMAT_VERSION,
+        'class_to_label': class_to_label,
+        'num_train': int(len(train_images)),
+        'num_test': int(len(test_images)),
+        'image_size': int(train_images.shape[2]),
+        'channels': int(train_images.shape[3]),
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(final_dir):
+        # Unusable (older format, missing arrays), so nothing is reading it
+        shutil.rmtree(final_dir)
+    os.replace(tmp_dir, final_dir)
+
+
+def load_cached_arrays(zip_hash):
+    """Returns the memory-mapped cache for `zip_hash`, or None if there isn't a valid one."""
+    cache_dir = cache_dir_for(zip_hash)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_FORMAT_VERSION:
+            return None
+
+        return {
+            'meta': meta,
+            'train_images': np.load(os.path.join(cache_dir, 'train_images.npy'), mmap_mode='r'),
+            'train_labels': np.load(os.path.join(cache_dir, 'train_labels.npy')),
+            'test_images': np.load(os.path.join(cache_dir, 'test_images.npy'), mmap_mode='r'),
+            'test_labels': np.load(os.path.join(cache_dir, 'test_labels.npy')),
+        }
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable dataset cache {cache_dir}: {e}")
+        return None
+
+
+def normalize_batch(images, mean, std):
+    """uint8 (N, H, W, C) array -> normalized float32 (N, C, H, W) tensor in one op."""
+    batch = torch.from_numpy(np.ascontiguousarray(images)).permute(0, 3, 1, 2).float().div_(255.0)
+    mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+    std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+    return batch.sub_(mean).div_(std)
+
+
+class CachedArrayDataset(Dataset):
+    """Dataset over packed uint8 images (possibly memory-mapped) that normalizes per batch."""
+    def __init__(self, images, labels, mean, std):
+        self.images = images
+        self.labels = labels
+        self.mean = mean
+        self.std = std
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, idx):
+        image = normalize_batch(self.images[idx:idx + 1], self.mean, self.std)[0]
+        return image, int(self.labels[idx])
+
+    def __getitems__(self, indices):
+        # Called by DataLoader with a whole batch of indices
+        indices = np.asarray(indices)
+        images = normalize_batch(self.images[indices], self.mean, self.std)
+        labels = self.labels[indices]
+        return [(images[i], int(labels[i])) for i in range(len(indices))]
+
+
+class LazyZipDataset(Dataset):
+    """Decodes ZIP members on demand; only the member index is held in memory.
+
+    Decoded uint8 arrays go into an LRU bounded by `cache_bytes`. Each
+    DataLoader worker process opens its own ZIP handle and keeps its own cache.
+    Images that fail to decode come back blank (with a warning) so indices
+    stay stable.
+    """
+    def __init__(self, zip_path, entries, image_size, channels, mean, std, cache_bytes=LAZY_CACHE_BYTES):
+        self.zip_path = zip_path
+        self.members = [e[0] for e in entries]
+        self.labels = np.array([e[1] for e in entries], dtype=np.int64)
+        self.image_size = image_size
+        self.channels = channels
+        self.mean = mean
+        self.std = std
+        self.cache_bytes = cache_bytes
+        self._reset_process_state()
+
+    def _reset_process_state(self):
+        self._zip = None
+        self._zip_pid = None
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # ZIP handles and caches don't travel to DataLoader workers
+        state = self.__dict__.copy()
+        for key in ('_zip', '_zip_pid', '_cache', '_cache_size', '_lock'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_process_state()
+
+    def __len__(self):
+        return len(self.members)
+
+    def _load_array(self, idx):
+        cached = self._cache.get(idx)
+        if cached is not None:
+            self._cache.move_to_end(idx)
+            return cached
+
+        if self._zip is None or self._zip_pid != os.getpid():
+            self._zip = zipfile.ZipFile(self.zip_path, 'r')
+            self._zip_pid = os.getpid()
+
+        try:
+            image = decode_image(self._zip.read(self.members[idx]))
+            array = image_to_array(image, self.image_size, self.channels)
+        except Exception as e:
+            print(f"Warning: Could not load {self.members[idx]}: {e}")
+            array = np.zeros((self.image_size[1], self.image_size[0], self.channels), dtype=np.uint8)
+
+        if array.nbytes <= self.cache_bytes:
+            self._cache[idx] = array
+            self._cache_size += array.nbytes
+            while self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= evicted.nbytes
+        return array
+
+    def __getitem__(self, idx):
+        with self._lock:
+            array = self._load_array(idx)
+        image = normalize_batch(array[None], self.mean, self.std)[0]
+        return image, int(self.labels[idx])
+
+    def __getitems__(self, indices):
+        with self._lock:
+            arrays = np.stack([self._load_array(idx) for idx in indices])
+        images = normalize_batch(arrays, self.mean, self.std)
+        return [(images[i], int(self.labels[idx])) for i, idx in enumerate(indices)]
@@ -0,0 +1,232 @@
+import os
+import threading
+import queue
+import time
+import copy
+from concurrent.futures import Future
+import torch
+from precision import PRECISIONS, INFERENCE_PRECISION, INFERENCE_CHANNELS_LAST, autocast, to_channels_last, apply_memory_format
+from compiled_inference import INFERENCE_BACKENDS, INFERENCE_BACKEND, CompiledModel
+from quantization import INT8_ACCURACY_TOLERANCE, within_tolerance
+from thread_budget import THREAD_BUDGET, INFERENCE_IDLE_SECONDS
+
+# Defaults can be overridden with env vars or at runtime via configure()
+BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 5))
+MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 32))
+# With the eager backend, serve a checkpoint's int8 model (CPU only) when its accuracy drop is within int8_tolerance
+INFERENCE_INT8 = os.environ.get('INFERENCE_INT8', '1') != '0'
+
+
+class InferenceBatcher:
+    """Collects single-image inference requests and runs them as one batch.
+
+    Requests that arrive within `window_ms` of the first one (up to
+    `max_batch_size`) share a single forward pass; each caller gets back its
+    own row of the model output. Requests for different model versions are
+    never mixed in the same batch. With the eager backend, a checkpoint's
+    int8 model (trained with quantize=True) replaces the precision /
+    channels_last settings when it is within int8_tolerance; an explicitly
+    configured compiled backend is never overridden.
+    """
+    def __init__(self, device, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE,
+                 precision=INFERENCE_PRECISION, channels_last=INFERENCE_CHANNELS_LAST, backend=INFERENCE_BACKEND,
+                 int8=INFERENCE_INT8, int8_tolerance=INT8_ACCURACY_TOLERANCE):
+        self.device = device
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.precision = precision if precision in PRECISIONS else 'fp32'
+        self.channels_last = channels_last
+        self.backend = backend if backend in INFERENCE_BACKENDS else 'eager'
+        self.int8 = int8
+        self.int8_tolerance = int8_tolerance
+        # (entry, channels_last copy of entry.model); the registry's model itself is left untouched
+        self._channels_last_model = (None, None)
+        # ((entry, backend, precision, channels_last), CompiledModel) for the non-eager backends
+        self._compiled_model = (None, None)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_size_counts = {}
+        self._queue_depth_counts = {}
+        self._total_requests = 0
+        self._total_batches = 0
+        # Requests per backend that actually ran them ('int8', 'eager', or a compiled backend)
+        self._served_by_counts = {}
+        self._last_served_by = None
+
+    def configure(self, window_ms=None, max_batch_size=None, precision=None, channels_last=None, backend=None,
+                  int8=None, int8_tolerance=None):
+        if window_ms is not None:
+            self.window_ms = max(0.0, float(window_ms))
+        if max_batch_size is not None:
+            self.max_batch_size = max(1, int(max_batch_size))
+        if precision is not None:
+            if precision not in PRECISIONS:
+                raise ValueError(f"precision must be one of {PRECISIONS}")
+            self.precision = precision
+        if channels_last is not None:
+            self.channels_last = bool(channels_last)
+        if backend is not None:
+            if backend not in INFERENCE_BACKENDS:
+                raise ValueError(f"backend must be one of {INFERENCE_BACKENDS}")
+            if backend != self.backend:
+                # Drops the old backend's compiled copy (and its stats entry); the next batch builds the new one
+                self._compiled_model = (None, None)
+            self.backend = backend
+        if int8 is not None:
+            self.int8 = bool(int8)
+        if int8_tolerance is not None:
+            self.int8_tolerance = max(0.0, float(int8_tolerance))
+
+    def submit(self, entry, image_tensor):
+        """Queues one preprocessed CHW tensor for `entry.model`; returns a Future."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((entry, image_tensor, future))
+        return future
+
+    def predict(self, entry, image_tensor, timeout=None):
+        """Blocking helper: returns the model output row for `image_tensor`."""
+        return self.submit(entry, image_tensor).result(timeout=timeout)
+
+    def stats(self):
+        compiled = self._compiled_model[1] if self.backend != 'eager' else None
+        with self._stats_lock:
+            return {
+                "window_ms": self.window_ms,
+                "max_batch_size": self.max_batch_size,
+                "precision": self.precision,
+                "channels_last": self.channels_last,
+                "backend": self.backend,
+                "int8": self.int8,
+                "int8_tolerance": self.int8_tolerance,
+                # Backend actually in use for the last compiled model, eager vs compiled latency (None when eager)
+                "compiled": dict(compiled.info) if compiled is not None else None,
+                "queue_depth": self._queue.qsize(),
+                "total_requests": self._total_requests,
+                "total_batches": self._total_batches,
+                "served_by": dict(sorted(self._served_by_counts.items())),
+                "last_served_by": self._last_served_by,
+                "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+                "queue_depth_histogram": dict(sorted(self._queue_depth_counts.items())),
+            }
+
+    def serves_int8(self, entry):
+        """True if requests for `entry` run on its int8 model."""
+        return (self.int8 and self.backend == 'eager' and self.device.type == 'cpu' and entry.int8_model is not None
+                and within_tolerance(entry.int8, self.int8_tolerance))
+
+    def int8_status(self, entry):
+        """Recorded int8 vs fp32 accuracy of `entry` and whether it is being served."""
+        if entry is None or entry.int8 is None:
+            return None
+        return {
+            "accuracy": entry.int8['accuracy'],
+            "fp32_accuracy": entry.int8['fp32_accuracy'],
+            "size_bytes": len(entry.int8['model']),
+            "in_use": self.serves_int8(entry),
+        }
+
+    def _model_channels_last(self, entry):
+        # Only called from the batching thread
+        cached_entry, model = self._channels_last_model
+        if cached_entry is not entry:
+            model = apply_memory_format(copy.deepcopy(entry.model), True)
+            self._channels_last_model = (entry, model)
+        return model
+
+    def _model_compiled(self, entry):
+        # Only called from the batching thread; the first batch after a new
+        # checkpoint or config change pays for the compile (or artifact load)
+        key = (entry, self.backend, self.precision, self.channels_last)
+        cached_key, model = self._compiled_model
+        if cached_key != key:
+            model = CompiledModel(entry, self.backend, self.precision, self.channels_last, self.device)
+            self._compiled_model = (key, model)
+        return model
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                self._thread.start()
+
+    def _next_request(self):
+        try:
+            return self._queue.get(timeout=INFERENCE_IDLE_SECONDS)
+        except queue.Empty:
+            # Idle: give inference's share of the thread budget back to training
+            THREAD_BUDGET.set_inference_active(False)
+            return self._queue.get()
+
+    def _run(self):
+        pending = None
+        while True:
+            first = pending if pending is not None else self._next_request()
+            pending = None
+            batch = [first]
+            deadline = time.monotonic() + self.window_ms / 1000.0
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] is not first[0]:
+                    # Different checkpoint, run it in the next batch
+                    pending = item
+                    break
+                batch.append(item)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        entry = batch[0][0]
+        THREAD_BUDGET.set_inference_active(True)
+        with self._stats_lock:
+            size = len(batch)
+            depth = self._queue.qsize()
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._queue_depth_counts[depth] = self._queue_depth_counts.get(depth, 0) + 1
+            self._total_requests += size
+            self._total_batches += 1
+
+        try:
+            images = torch.stack([item[1] for item in batch])
+            if self.serves_int8(entry):
+                served_by = 'int8'
+                with torch.no_grad():
+                    outputs = entry.int8_model(images).float()
+            elif self.backend != 'eager':
+                images = images.to(self.device)
+                compiled = self._model_compiled(entry)
+                served_by = compiled.serving_backend
+                with torch.no_grad():
+                    outputs = compiled(images).float().cpu()
+            else:
+                served_by = 'eager'
+                images = images.to(self.device)
+                model = entry.model
+                if self.channels_last:
+                    model = self._model_channels_last(entry)
+                    images = to_channels_last(images)
+                with torch.no_grad(), autocast(self.precision, self.device):
+                    outputs = model(images).float().cpu()
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._served_by_counts[served_by] = self._served_by_counts.get(served_by, 0) + len(batch)
+            self._last_served_by = served_by
+
+        for i, (_, _, future) in enumerate(batch):
+            future.set_result(outputs[i])
@@ -0,0 +1,238 @@
+import os
+import json
+import uuid
+import time
+import heapq
+import shutil
+import itertools
+import threading
+from pytorch_trainer import train_model, publish_run_results, TrainingCancelled, TEMP_MODEL_PATH
+from progress_hub import PROGRESS_HUB
+from metrics import Gauge
+from profiling import profile_dir_for, list_profile_artifacts
+from onnx_export import onnx_path_for
+
+JOBS_PATH = './jobs'
+MAX_CONCURRENT_JOBS = int(os.environ.get('TRAINING_MAX_CONCURRENT_JOBS', 1))
+# 'fifo' or 'priority' (higher priority first, FIFO within a priority)
+QUEUE_POLICY = os.environ.get('TRAINING_QUEUE_POLICY', 'fifo')
+# Finished jobs (and their artifact folders) kept around for status/download
+MAX_FINISHED_JOBS = int(os.environ.get('TRAINING_MAX_FINISHED_JOBS', 50))
+
+
+class TrainingJob:
+    """One queued/running/finished train_model call and its artifacts."""
+    def __init__(self, layers, config, priority=0):
+        self.id = uuid.uuid4().hex
+        self.layers = layers
+        self.config = config
+        self.priority = priority
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.artifact_dir = os.path.join(JOBS_PATH, self.id)
+        self.checkpoint_path = os.path.join(self.artifact_dir, 'model.pth')
+        # Where train_model writes torch.profiler output when training_config['profile'] is set
+        self.profile_dir = profile_dir_for(self.checkpoint_path)
+        # This run's confusion matrix and test set; published server-wide when its checkpoint is promoted
+        self.run_results = {}
+        self.cancel_event = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def publish(self, event):
+        """Progress callback for train_model: broadcasts to every watcher of this job."""
+        if event.get('epoch') is not None or event.get('stage') is not None:
+            self.progress = event
+        PROGRESS_HUB.publish(self.id, event)
+
+    def subscribe(self):
+        """Subscription replaying this job's events, then following it; get() returns None once it finishes."""
+        return PROGRESS_HUB.subscribe(self.id)
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        self._done.set()
+        PROGRESS_HUB.close(self.id)
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "has_model": os.path.exists(self.checkpoint_path),
+            "profile": list_profile_artifacts(self.profile_dir),
+        }
+        if self.error:
+            data["error"] = self.error
+        if self.result is not None:
+            output, final_loss, final_accuracy = self.result
+            data.update({"output": output, "loss": final_loss, "accuracy": final_accuracy})
+        return data
+
+
+class JobScheduler:
+    """Runs training jobs on a fixed number of worker threads, queueing the rest.
+
+    Each job trains into its own artifact folder; when it completes, its
+    checkpoint is atomically promoted to TEMP_MODEL_PATH so /test picks it up.
+    Cancellation is cooperative: train_model checks the job's event between batches.
+    """
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, policy=QUEUE_POLICY):
+        self.max_concurrent = max(1, max_concurrent)
+        self.policy = policy
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._finished_order = []
+        self._running = 0
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(target=self._worker_loop, name=f'training-worker-{len(self._workers)}', daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, layers, config, priority=0):
+        job = TrainingJob(layers, config, priority)
+        sort_key = -priority if self.policy == 'priority' else 0
+        with self._cond:
+            self._ensure_workers()
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (sort_key, next(self._counter), job))
+            self._cond.notify()
+        print(f"Queued training job {job.id} (priority={priority}, queue={len(self._heap)})")
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._cond:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "policy": self.policy,
+                "running": self._running,
+                "queued": len(self._heap),
+            }
+
+    def cancel(self, job_id):
+        """Cancels a queued job immediately, or asks a running one to stop."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_event.set()
+            if job.status == 'queued':
+                self._heap = [item for item in self._heap if item[2] is not job]
+                heapq.heapify(self._heap)
+                job._finish('cancelled')
+                self._record_finished(job)
+        return job
+
+    def _record_finished(self, job):
+        # Called with self._cond held
+        self._finished_order.append(job.id)
+        while len(self._finished_order) > MAX_FINISHED_JOBS:
+            old = self._jobs.pop(self._finished_order.pop(0), None)
+            if old is not None:
+                shutil.rmtree(old.artifact_dir, ignore_errors=True)
+                PROGRESS_HUB.discard(old.id)
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                job.status = 'running'
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._record_finished(job)
+
+    def _run(self, job):
+        job.started_at = time.time()
+        os.makedirs(job.artifact_dir, exist_ok=True)
+        print(f"Starting training job {job.id}")
+
+        try:
+            job.result = train_model(job.layers, job.config, progress_callback=job.publish,
+                                     cancel_event=job.cancel_event, checkpoint_path=job.checkpoint_path,
+                                     run_results=job.run_results)
+        except TrainingCancelled:
+            print(f"Training job {job.id} cancelled")
+            job._finish('cancelled')
+            return
+        except Exception as e:
+            print(f"Training job {job.id} failed: {e}")
+            job.error = str(e)
+            job._finish('failed')
+            return
+
+        output, final_loss, final_accuracy = job.result
+        with open(os.path.join(job.artifact_dir, 'result.json'), 'w') as f:
+            json.dump({"output": output, "loss": final_loss, "accuracy": final_accuracy,
+                       "config": job.config, "layers": job.layers}, f)
+
+        if os.path.exists(job.checkpoint_path):
+            promote_checkpoint(job.checkpoint_path, job.run_results)
+        job._finish('completed')
+        print(f"Training job {job.id} completed")
+
+
+def promote_checkpoint(path, run_results=None):
+    """Atomically replaces TEMP_MODEL_PATH with `path` (the registry reloads on the next request).
+
+    The run's confusion matrix and test set (see train_model's run_results)
+    are published along with it.
+    """
+    tmp_path = f"{TEMP_MODEL_PATH}.tmp{os.getpid()}"
+    shutil.copyfile(path, tmp_path)
+    os.replace(tmp_path, TEMP_MODEL_PATH)
+
+    # The run's ONNX export goes along; an export of the previous model would no longer match
+    onnx_source, onnx_target = onnx_path_for(path), onnx_path_for(TEMP_MODEL_PATH)
+    if os.path.exists(onnx_source):
+        tmp_path = f"{onnx_target}.tmp{os.getpid()}"
+        shutil.copyfile(onnx_source, tmp_path)
+        os.replace(tmp_path, onnx_target)
+    elif os.path.exists(onnx_target):
+        os.remove(onnx_target)
+
+    if run_results is not None:
+        publish_run_results(run_results)
+
+
+SCHEDULER = JobScheduler()
+
+JOBS_GAUGE = Gauge('neuralforge_training_jobs', 'Training jobs currently running or waiting in the queue.',
+                   lambda: {(state,): SCHEDULER.stats()[state] for state in ('running', 'queued')}, ['state'])
@@ -0,0 +1,114 @@
+import os
+import threading
+import torch
+from metrics import PHASE_SECONDS
+from quantization import load_int8
+
+
+class ModelEntry:
+    """A built, eval-mode model plus the metadata saved alongside its checkpoint."""
+    def __init__(self, model, version, input_channels, input_size, num_classes, class_names, layers,
+                 test_predictions=None, checkpoint_path=None, int8=None, int8_model=None):
+        self.model = model
+        self.version = version
+        self.input_channels = input_channels
+        self.input_size = input_size
+        self.num_classes = num_classes
+        self.class_names = class_names
+        self.layers = layers
+        # {'source', 'outputs', 'predictions', 'labels'} over the training run's test set, if saved
+        self.test_predictions = test_predictions
+        # Compiled inference artifacts are cached next to this file
+        self.checkpoint_path = checkpoint_path
+        # {'model', 'accuracy', 'fp32_accuracy'} as saved, and the loaded int8 TorchScript module (CPU)
+        self.int8 = int8
+        self.int8_model = int8_model
+
+
+class ModelRegistry:
+    """Process-wide cache of the model stored at `checkpoint_path`.
+
+    The entry is keyed by the checkpoint version (mtime + size of the file), so
+    inference only pays for torch.load + rebuild once per checkpoint. Training
+    calls publish() after it writes a new checkpoint to hot-swap the model
+    without going back to disk.
+    """
+    def __init__(self, checkpoint_path, build_fn, device, class_names_fn=None):
+        self.checkpoint_path = checkpoint_path
+        self.build_fn = build_fn
+        self.device = device
+        self.class_names_fn = class_names_fn
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.checkpoint_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _build_entry(self, saved_data, version):
+        input_channels = saved_data.get('input_channels', 1)
+        input_size = saved_data.get('input_size', 28)
+        num_classes = saved_data.get('num_classes', 10)
+
+        model = self.build_fn(saved_data['layers'], input_channels, input_size, num_classes).to(self.device)
+        model.load_state_dict(saved_data['state_dict'])
+        model.eval()
+
+        class_names = saved_data.get('class_names')
+        if not class_names and self.class_names_fn is not None:
+            class_names = self.class_names_fn(input_channels, num_classes)
+
+        int8, int8_model = saved_data.get('int8'), None
+        if int8 is not None:
+            try:
+                int8_model = load_int8(int8['model'].numpy().tobytes())
+            except Exception as e:
+                print(f"Model registry: int8 model not loaded: {e}")
+
+        return ModelEntry(model, version, input_channels, input_size, num_classes,
+                          class_names, saved_data['layers'], saved_data.get('test_predictions'),
+                          checkpoint_path=self.checkpoint_path, int8=int8, int8_model=int8_model)
+
+    def get(self):
+        """Returns the current ModelEntry, reloading only if the checkpoint changed."""
+        version = self._file_version()
+        if version is None:
+            return None
+
+        entry = self._entry
+        if entry is not None and entry.version == version:
+            return entry
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._entry is not None and self._entry.version == version:
+                return self._entry
+
+            with PHASE_SECONDS.time('model_load'):
+                saved_data = torch.load(self.checkpoint_path, map_location=self.device, weights_only=True)
+                self._entry = self._build_entry(saved_data, version)
+            print(f"Model registry: loaded checkpoint version {version}")
+            return self._entry
+
+    def publish(self, saved_data):
+        """Swaps in a model built from `saved_data`, which was just written to disk."""
+        version = self._file_version()
+        if version is None:
+            return None
+
+        entry = self._build_entry(saved_data, version)
+        with self._lock:
+            self._entry = entry
+        return entry
+
+    @property
+    def loaded_entry(self):
+        """The entry currently in memory (no checkpoint stat), or None."""
+        return self._entry
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
@@ -0,0 +1,78 @@
+import os
+import copy
+import json
+import warnings
+import numpy as np
+import torch
+from dataset_cache import NORMALIZATION
+from onnx_inference import OnnxPredictor, ort
+
+# Export each finished checkpoint unless the run sets training_config['export_onnx'] = False
+EXPORT_ONNX = os.environ.get('EXPORT_ONNX', '1') != '0'
+# Largest |onnxruntime - torch| difference accepted on the export parity check
+ONNX_PARITY_ATOL = 1e-4
+INPUT_NAME, OUTPUT_NAME = 'image', 'probabilities'
+
+
+def onnx_path_for(checkpoint_path):
+    """ONNX file of a checkpoint, e.g. ./temp_model_state.onnx or jobs/<id>/model.onnx."""
+    return f"{os.path.splitext(checkpoint_path)[0]}.onnx"
+
+
+def export_onnx(model, path, input_channels, input_size, class_names, metadata=None):
+    """Exports `model` (dynamic batch axis) to `path` atomically; returns the parity max abs difference.
+
+    The input shape, normalization constants and class names are stored as
+    ONNX metadata so onnx_inference.py can preprocess uploads without torch.
+    The exported graph is run through onnxruntime and compared with PyTorch
+    on a random batch; a mismatch above ONNX_PARITY_ATOL raises. The parity
+    difference is None if onnxruntime isn't installed.
+    """
+    import onnx
+
+    model = copy.deepcopy(model).cpu().float().to(memory_format=torch.contiguous_format).eval()
+    example = torch.randn(2, input_channels, input_size, input_size)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        program = torch.onnx.export(model, (example,), input_names=[INPUT_NAME], output_names=[OUTPUT_NAME],
+                                    dynamo=True, verbose=False,
+                                    dynamic_shapes=({0: torch.export.Dim('batch')},))
+    proto = program.model_proto
+
+    mean, std = NORMALIZATION[input_channels]
+    props = {
+        'input_channels': str(input_channels),
+        'input_size': str(input_size),
+        'mean': json.dumps(list(mean)),
+        'std': json.dumps(list(std)),
+        'class_names': json.dumps(list(class_names)),
+        'torch': torch.__version__,
+    }
+    props.update({k: str(v) for k, v in (metadata or {}).items()})
+
+    max_diff = check_parity(proto.SerializeToString(), model, example)
+    if max_diff is not None:
+        props['parity_max_abs_diff'] = f"{max_diff:.3g}"
+    onnx.helper.set_model_props(proto, props)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    onnx.save(proto, tmp_path)
+    os.replace(tmp_path, path)
+    return max_diff
+
+
+def check_parity(onnx_model, model, example):
+    """Max |onnxruntime - torch| over `example` for an ONNX path or bytes.
+
+    Raises above ONNX_PARITY_ATOL; returns None without onnxruntime.
+    """
+    if ort is None:
+        return None
+    device = next(model.parameters()).device
+    with torch.no_grad():
+        expected = model(example.to(device)).float().cpu().numpy()
+    actual = OnnxPredictor(onnx_model).run(example.numpy())
+    max_diff = float(np.abs(actual - expected).max())
+    if actual.shape != expected.shape or max_diff > ONNX_PARITY_ATOL:
+        raise RuntimeError(f"ONNX outputs differ from PyTorch (max abs diff {max_diff:.3g})")
+    return max_diff
@@ -0,0 +1,121 @@
+"""ONNX Runtime inference for exported models, without PyTorch.
+
+    python onnx_inference.py --model temp_model_state.onnx --port 5001
+
+Serves POST /test_custom (multipart 'image', same JSON as the main server's
+/test_custom?format=json) and GET /health. Only needs the packages in
+requirements-inference.txt (numpy, Pillow, Flask, onnxruntime), so replicas
+start fast and stay small. Preprocessing uses the input size, normalization
+constants and class names that onnx_export.py stores in the model metadata.
+"""
+import os
+import json
+import argparse
+import numpy as np
+from PIL import Image
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# onnxruntime intra-op threads (0 = onnxruntime default)
+ONNX_THREADS = int(os.environ.get('ONNX_THREADS', 0))
+
+
+class OnnxPredictor:
+    """onnxruntime CPU session plus the preprocessing described by the model metadata.
+
+    `model` is a path or the serialized model bytes.
+    """
+    def __init__(self, model, threads=ONNX_THREADS):
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed")
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.metadata = self.session.get_modelmeta().custom_metadata_map
+
+    @property
+    def input_channels(self):
+        return int(self.metadata['input_channels'])
+
+    @property
+    def input_size(self):
+        return int(self.metadata['input_size'])
+
+    @property
+    def class_names(self):
+        return json.loads(self.metadata['class_names'])
+
+    def run(self, images):
+        """Model outputs for an (N, C, H, W) float32 batch."""
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        return self.session.run(None, {self.input_name: images})[0]
+
+    def preprocess(self, image):
+        """PIL image -> normalized (C, H, W) float32 array, as the main server does it."""
+        image = image.convert('L' if self.input_channels == 1 else 'RGB')
+        image = image.resize((self.input_size, self.input_size), Image.BILINEAR)
+        pixels = np.asarray(image, dtype=np.float32) / 255.0
+        pixels = pixels[None] if pixels.ndim == 2 else pixels.transpose(2, 0, 1)
+        mean = np.asarray(json.loads(self.metadata['mean']), dtype=np.float32).reshape(-1, 1, 1)
+        std = np.asarray(json.loads(self.metadata['std']), dtype=np.float32).reshape(-1, 1, 1)
+        return (pixels - mean) / std
+
+    def predict(self, image):
+        """Classifies one PIL image; returns the /test_custom?format=json result dict."""
+        outputs = self.run(self.preprocess(image)[None])[0]
+        # Same softmax over the model's (already softmaxed) outputs as the main server
+        exp = np.exp(outputs - outputs.max())
+        probabilities = exp / exp.sum()
+        index = int(probabilities.argmax())
+        class_names = self.class_names
+        return {
+            'predicted_class': class_names[index],
+            'predicted_index': index,
+            'probabilities': [float(p) for p in probabilities],
+            'class_names': class_names,
+        }
+
+
+def create_app(predictor):
+    from flask import Flask, request, jsonify
+
+    app = Flask(__name__)
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({"status": "ok", "metadata": predictor.metadata})
+
+    @app.route('/test_custom', methods=['POST'])
+    def test_custom():
+        if 'image' not in request.files or request.files['image'].filename == '':
+            return jsonify({'error': 'No image file provided'}), 400
+        try:
+            image = Image.open(request.files['image'].stream)
+            return jsonify(predictor.predict(image))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='temp_model_state.onnx', help='exported .onnx file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--threads', type=int, default=ONNX_THREADS, help='onnxruntime intra-op threads')
+    args = parser.parse_args(argv)
+
+    predictor = OnnxPredictor(args.model, threads=args.threads)
+    print(f"Loaded {args.model}: {predictor.input_channels}x{predictor.input_size}x{predictor.input_size}, "
+          f"{len(predictor.class_names)} classes")
+    create_app(predictor).run(host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import os
+import copy
+import time
+from contextlib import nullcontext
+import torch
+
+# 'fp32' runs everything in float32; 'bf16' runs matmuls/convs under bfloat16 autocast
+PRECISIONS = ('fp32', 'bf16')
+# Defaults for the inference paths (can also be changed through /inference_config)
+INFERENCE_PRECISION = os.environ.get('INFERENCE_PRECISION', 'fp32')
+INFERENCE_CHANNELS_LAST = os.environ.get('INFERENCE_CHANNELS_LAST', '0') == '1'
+
+
+def resolve_precision(config):
+    """(precision, channels_last) from training_config; unknown precisions fall back to fp32."""
+    precision = config.get('precision', 'fp32')
+    if precision not in PRECISIONS:
+        precision = 'fp32'
+    return precision, bool(config.get('channels_last', False))
+
+
+def bf16_supported():
+    """True if oneDNN has native bf16 kernels on this CPU (bf16 still runs elsewhere, just slower)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def autocast(precision, device):
+    """Autocast context for `precision`.
+
+    Under bf16 autocast PyTorch keeps its numerically sensitive ops (softmax,
+    log_softmax, cross entropy, norms, reductions) in fp32; weights and the
+    optimizer state stay fp32 as well.
+    """
+    if precision == 'bf16':
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def to_channels_last(tensor):
+    """NHWC memory layout for 4-D image batches; other tensors are returned unchanged."""
+    if tensor.dim() == 4:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
+
+
+def apply_memory_format(model, channels_last):
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+
+def describe(precision, channels_last):
+    layout = 'channels_last' if channels_last else 'contiguous'
+    return f"{'bf16 autocast' if precision == 'bf16' else 'fp32'}, {layout}"
+
+
+def measure_step_time(model, images, labels, criterion, precision, channels_last, device, steps=5):
+    """Median seconds per forward+backward step on a throwaway copy of `model`."""
+    model = apply_memory_format(copy.deepcopy(model), channels_last).train()
+    images = to_channels_last(images) if channels_last else images.contiguous()
+    times = []
+    for i in range(steps + 1):
+        start = time.perf_counter()
+        with autocast(precision, device):
+            outputs = model(images)
+        loss = criterion(outputs.float(), labels)
+        loss.backward()
+        model.zero_grad(set_to_none=True)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        if i > 0:  # first step is warmup (oneDNN primitive creation)
+            times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
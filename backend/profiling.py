@@ -0,0 +1,125 @@
+import os
+import json
+import uuid
+import torch
+from torch.profiler import profile, schedule, ProfilerActivity
+
+# Where runs without their own artifact folder (direct train_model calls) put profiles
+PROFILES_PATH = './profiles'
+# Steps skipped before the first cycle, then idle / warmup / recorded steps per cycle
+PROFILE_DEFAULTS = {'skip_first': 0, 'wait': 1, 'warmup': 1, 'active': 5, 'repeat': 1}
+TOP_OPS_ROWS = 30
+
+TRACE_FILE = 'trace.json'
+TABLE_FILE = 'top_ops.txt'
+SUMMARY_FILE = 'top_ops.json'
+
+
+def resolve_profile_settings(value):
+    """training_config['profile'] -> schedule dict, or None when profiling is off.
+
+    Accepts True (defaults) or a dict overriding any of PROFILE_DEFAULTS.
+    """
+    if not value:
+        return None
+    settings = dict(PROFILE_DEFAULTS)
+    if isinstance(value, dict):
+        settings.update({k: max(0, int(v)) for k, v in value.items() if k in PROFILE_DEFAULTS})
+    settings['active'] = max(1, settings['active'])
+    settings['repeat'] = max(1, settings['repeat'])
+    return settings
+
+
+class TrainingProfiler:
+    """torch.profiler over a bounded window of training steps.
+
+    Records CPU (and CUDA, if available) operator times, memory and input
+    shapes. When the window closes it writes a Chrome trace, a top-ops table
+    and a JSON summary to `output_dir` and switches itself off, so the rest of
+    the run isn't slowed down.
+    """
+    def __init__(self, output_dir, settings):
+        self.output_dir = output_dir
+        self.settings = settings
+        self.total_steps = settings['skip_first'] + settings['repeat'] * (
+            settings['wait'] + settings['warmup'] + settings['active'])
+        self.steps = 0
+        self.files = []
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self._profiler = profile(
+            activities=activities,
+            schedule=schedule(**settings),
+            on_trace_ready=self._write_artifacts,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._profiler.start()
+        self._running = True
+
+    def step(self):
+        """Call once per training step; stops the profiler after the last scheduled step."""
+        if not self._running:
+            return
+        self._profiler.step()
+        self.steps += 1
+        if self.steps >= self.total_steps:
+            self.stop()
+
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._profiler.stop()
+
+    def _write_artifacts(self, prof):
+        cycle = len(self.files) // 3
+        suffix = f'_{cycle}' if cycle else ''
+        trace_name = TRACE_FILE.replace('.json', f'{suffix}.json')
+        table_name = TABLE_FILE.replace('.txt', f'{suffix}.txt')
+        summary_name = SUMMARY_FILE.replace('.json', f'{suffix}.json')
+
+        prof.export_chrome_trace(os.path.join(self.output_dir, trace_name))
+
+        averages = prof.key_averages()
+        with open(os.path.join(self.output_dir, table_name), 'w') as f:
+            f.write(averages.table(sort_by='self_cpu_time_total', row_limit=TOP_OPS_ROWS))
+            f.write('\n\nBy input shape:\n')
+            f.write(prof.key_averages(group_by_input_shape=True).table(
+                sort_by='self_cpu_time_total', row_limit=TOP_OPS_ROWS))
+
+        top_ops = sorted(averages, key=lambda e: e.self_cpu_time_total, reverse=True)[:TOP_OPS_ROWS]
+        summary = [{
+            'name': e.key,
+            'calls': e.count,
+            'self_cpu_time_us': e.self_cpu_time_total,
+            'cpu_time_us': e.cpu_time_total,
+            'self_cpu_memory_bytes': e.self_cpu_memory_usage,
+        } for e in top_ops]
+        with open(os.path.join(self.output_dir, summary_name), 'w') as f:
+            json.dump({'settings': self.settings, 'top_ops': summary}, f, indent=2)
+
+        self.files.extend([trace_name, table_name, summary_name])
+        print(f"Profiler: wrote {trace_name}, {table_name} to {self.output_dir}")
+
+
+def list_profile_artifacts(output_dir):
+    """Names of the files in a run's profile folder (empty if it wasn't profiled)."""
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted(os.listdir(output_dir))
+
+
+def profile_dir_for(checkpoint_path=None):
+    """Profile folder of a run: next to its checkpoint (e.g. jobs/<id>/model_profile), else a new one."""
+    if checkpoint_path is None:
+        return os.path.join(PROFILES_PATH, uuid.uuid4().hex)
+    return f"{os.path.splitext(checkpoint_path)[0]}_profile"
@@ -0,0 +1,167 @@
+import os
+import heapq
+import threading
+from collections import deque, OrderedDict
+
+# Recent per-batch events replayed to a client that joins a run late
+REPLAY_BATCH_EVENTS = int(os.environ.get('PROGRESS_REPLAY_EVENTS', 50))
+# Per-client backlog of batch events; a slow client loses the oldest ones, never the run's time
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('PROGRESS_SUBSCRIBER_QUEUE', 256))
+# Finished runs whose events are still kept for replay
+MAX_CLOSED_RUNS = int(os.environ.get('PROGRESS_MAX_CLOSED_RUNS', 50))
+
+
+def is_batch_event(event):
+    """Per-batch progress is droppable; epoch/ingest/status events are always delivered."""
+    return event.get('stage') == 'train'
+
+
+class Subscription:
+    """One client's view of a run: get() returns events in order, then None once the run closes."""
+    def __init__(self, hub, run_id):
+        self.hub = hub
+        self.run_id = run_id
+        self.dropped = 0
+        self._events = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._waker = None
+
+    def set_waker(self, waker):
+        """waker() is called from the publishing thread whenever get() may have something new.
+
+        Lets an asyncio reader wait on an event loop instead of blocking a thread
+        in get(); it must be thread-safe (e.g. loop.call_soon_threadsafe).
+        """
+        with self._cond:
+            self._waker = waker
+            pending = bool(self._events) or self._closed
+        if pending:
+            waker()
+
+    def _push(self, event):
+        # Called by the publisher; never blocks on the client
+        with self._cond:
+            self._events.append(event)
+            if len(self._events) > SUBSCRIBER_QUEUE_SIZE:
+                for i, queued in enumerate(self._events):
+                    if is_batch_event(queued):
+                        del self._events[i]
+                        self.dropped += 1
+                        break
+            self._cond.notify()
+            waker = self._waker
+        if waker is not None:
+            waker()
+
+    def _close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            waker = self._waker
+        if waker is not None:
+            waker()
+
+    def get(self, timeout=None):
+        """Next event, None when the run is over, or raises TimeoutError after `timeout` seconds (0 = don't wait)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._events or self._closed, timeout):
+                raise TimeoutError
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class _Run:
+    def __init__(self):
+        self.milestones = []
+        self.recent_batches = deque(maxlen=REPLAY_BATCH_EVENTS)
+        self.subscribers = []
+        self.closed = False
+        self.published = 0
+
+    def add(self, event):
+        self.published += 1
+        item = (self.published, event)
+        if is_batch_event(event):
+            self.recent_batches.append(item)
+        else:
+            self.milestones.append(item)
+
+    def replay(self):
+        # Every milestone plus the latest batch events, merged back into publish order
+        return [event for _, event in heapq.merge(self.milestones, self.recent_batches, key=lambda item: item[0])]
+
+
+class ProgressHub:
+    """Fan-out of training progress events, keyed by run ID (the job ID).
+
+    publish() only appends to in-memory buffers, so any number of watchers
+    can attach to a run without slowing it down. New subscribers first get a
+    replay: every milestone event plus the most recent batch events.
+    """
+    def __init__(self):
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_run(self, run_id):
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._runs[run_id] = _Run()
+        return run
+
+    def publish(self, run_id, event):
+        with self._lock:
+            run = self._get_run(run_id)
+            run.add(event)
+            subscribers = list(run.subscribers)
+        for subscription in subscribers:
+            subscription._push(event)
+
+    def subscribe(self, run_id):
+        subscription = Subscription(self, run_id)
+        with self._lock:
+            run = self._get_run(run_id)
+            for event in run.replay():
+                subscription._events.append(event)
+            if run.closed:
+                subscription._closed = True
+            else:
+                run.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            run = self._runs.get(subscription.run_id)
+            if run is not None and subscription in run.subscribers:
+                run.subscribers.remove(subscription)
+
+    def close(self, run_id):
+        """Marks the run finished: current subscribers get None after their queued events."""
+        with self._lock:
+            run = self._get_run(run_id)
+            run.closed = True
+            subscribers, run.subscribers = run.subscribers, []
+            self._runs.move_to_end(run_id)
+            closed = [rid for rid, r in self._runs.items() if r.closed]
+            for rid in closed[:max(0, len(closed) - MAX_CLOSED_RUNS)]:
+                del self._runs[rid]
+        for subscription in subscribers:
+            subscription._close()
+
+    def discard(self, run_id):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                run_id: {"closed": run.closed, "subscribers": len(run.subscribers), "events": run.published}
+                for run_id, run in self._runs.items()
+            }
+
+
+PROGRESS_HUB = ProgressHub()
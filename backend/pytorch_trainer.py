@@ -10,99 +10,114 @@ matplotlib.use('Agg')
 import numpy as np
 import random
 import io
+import re
 import json
 import threading
-import queue
+import time
+import copy
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
 from PIL import Image
 import zipfile
 import pandas as pd
 from PIL import Image
 from torch.utils.data import Dataset
 import plotly.graph_objects as go
+from model_registry import ModelRegistry
+from inference_batcher import InferenceBatcher
+from classification_view import render_classification, denormalize_image
+from dataset_cache import (DATASET_CACHE_PATH, cache_build_lock, hash_file, load_cached_arrays, save_cached_arrays, CachedArrayDataset,
+                           LazyZipDataset, NORMALIZATION, LAZY_DATASET_THRESHOLD_BYTES, LAZY_CACHE_BYTES)
+from zip_ingest import ingest_zip, index_zip, split_entries
+from checkpoint_writer import CHECKPOINT_WRITER, RETENTION_POLICIES, snapshot_state_dict, snapshot_optimizer_state, atomic_save
+from profiling import TrainingProfiler, resolve_profile_settings, profile_dir_for
+from precision import resolve_precision, autocast, to_channels_last, apply_memory_format, measure_step_time, describe, bf16_supported
+from metrics import PHASE_SECONDS, Gauge, directory_size
+from onnx_export import EXPORT_ONNX, export_onnx, onnx_path_for
+from thread_budget import THREAD_BUDGET
+from quantization import QUANTIZE_INT8, quantize_int8, calibration_batches, int8_accuracy, serialize_int8, within_tolerance
+from data_pipeline import tensor_cache_bytes, TENSOR_DATASET_MAX_BYTES, dataset_to_tensors, dataset_labels, stratified_subsample, resolve_loader_settings, build_data_loader, build_tensor_loader
 
 TEMP_MODEL_PATH = './temp_model_state.pth'
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Seconds between per-batch progress events (training_config 'progress_interval'; 0 turns them off)
+PROGRESS_INTERVAL = float(os.environ.get('TRAINING_PROGRESS_INTERVAL', 1.0))
 CONFUSION_MATRIX_DATA = None
 
+# Rendered PNG for the current CONFUSION_MATRIX_DATA run: {'run_id', 'png'}
+_CONFUSION_MATRIX_PNG_CACHE = {}
+_CONFUSION_MATRIX_LOCK = threading.Lock()
+
+def confusion_matrix_etag():
+    """ETag for the confusion matrix image; changes once per training run."""
+    data = CONFUSION_MATRIX_DATA
+    return f'"cm-{data["run_id"]}"' if data is not None else '"cm-empty"'
+
+def get_confusion_matrix_data():
+    """Raw confusion matrix counts for the last run as a JSON-friendly dict, or None."""
+    data = CONFUSION_MATRIX_DATA
+    if data is None:
+        return None
+    return {
+        'matrix': data['matrix'].tolist(),
+        'class_names': _confusion_matrix_class_names(data),
+        'num_classes': data['num_classes'],
+        'run_id': data['run_id']
+    }
+
+def _confusion_matrix_class_names(data):
+    class_names = data.get('class_names')
+    num_classes = data['num_classes']
+    # Make sure we have the right number of class names
+    if not class_names or len(class_names) != num_classes:
+        print(f"Warning: Class names don't match num_classes ({num_classes}). Using numeric labels.")
+        class_names = [str(i) for i in range(num_classes)]
+    return class_names
+
 def plot_confusion_matrix():
-    """Creates and returns a Plotly confusion matrix as image bytes."""
-    global CONFUSION_MATRIX_DATA
-    
-    if CONFUSION_MATRIX_DATA is None:
-        # Return a simple "no data" image
-        fig = go.Figure()
-        fig.update_layout(
-            title="No confusion matrix data available. Train a model first.",
-            xaxis_title="Predicted Label",
-            yaxis_title="True Label",
-        )
-        img_bytes = fig.to_image(format="png")
-        return img_bytes
-    
-    predictions = CONFUSION_MATRIX_DATA['predictions']
-    labels = CONFUSION_MATRIX_DATA['labels']
-    num_classes = CONFUSION_MATRIX_DATA['num_classes']
-    
-    # Calculate confusion matrix
-    confusion_mat = np.zeros((num_classes, num_classes), dtype=int)
-    for true_label, pred_label in zip(labels, predictions):
-        confusion_mat[true_label, pred_label] += 1
-    
-    # Get class names from the same source as testing
-    global _TEST_DATASET_CACHE
+    """Creates and returns a Plotly confusion matrix as image bytes (rendered once per run)."""
+    data = CONFUSION_MATRIX_DATA
+    cache_key = data['run_id'] if data is not None else None
     
-    if _TEST_DATASET_CACHE is not None:
-        # Use cached class names from test dataset
-        _, class_names = _TEST_DATASET_CACHE
-        print(f"Using cached class names: {class_names}")
-    else:
-        # Get class names the same way test_model does
-        custom_dataset_path = './custom_data'
-        test_path = os.path.join(custom_dataset_path, 'test')
+    with _CONFUSION_MATRIX_LOCK:
+        if _CONFUSION_MATRIX_PNG_CACHE.get('run_id', 0) == cache_key:
+            return _CONFUSION_MATRIX_PNG_CACHE['png']
         
-        if os.path.exists(test_path):
-            test_dataset = datasets.ImageFolder(root=test_path)
-            class_names = test_dataset.classes
-            print(f"Using custom dataset classes: {class_names}")
+        if data is None:
+            # Return a simple "no data" image
+            fig = go.Figure()
+            fig.update_layout(
+                title="No confusion matrix data available. Train a model first.",
+                xaxis_title="Predicted Label",
+                yaxis_title="True Label",
+            )
         else:
-            # Use the same fallback as test_model
-            saved_data = torch.load(TEMP_MODEL_PATH, map_location=DEVICE)
-            input_channels = saved_data.get('input_channels', 1)
+            class_names = _confusion_matrix_class_names(data)
             
-            if input_channels == 1:
-                class_names = [str(i) for i in range(10)]
-                print("Using MNIST class names (0-9)")
-            else:
-                class_names = ['airplane', 'automobile', 'bird', 'cat', 'deer', 
-                              'dog', 'frog', 'horse', 'ship', 'truck']
-                print("Using CIFAR-10 class names")
-    
-    # Make sure we have the right number of class names
-    if len(class_names) != num_classes:
-        print(f"Warning: Class names count ({len(class_names)}) doesn't match num_classes ({num_classes}). Using numeric labels.")
-        class_names = [str(i) for i in range(num_classes)]
-    
-    # Create Plotly heatmap
-    fig = go.Figure(data=go.Heatmap(
-        z=confusion_mat,
-        x=class_names,  # Use actual class names instead of numeric indices
-        y=class_names,  # Use actual class names instead of numeric indices
-        colorscale='Viridis',
-        hoverongaps=False,
-        hovertemplate='True: %{y}<br>Predicted: %{x}<br>Count: %{z}<extra></extra>'
-    ))
-    
-    fig.update_layout(
-        title='Confusion Matrix',
-        xaxis_title='Predicted Label',
-        yaxis_title='True Label',
-        width=600,
-        height=600
-    )
-    
-    # Convert to image bytes
-    img_bytes = fig.to_image(format="png")
-    return img_bytes
+            # Create Plotly heatmap
+            fig = go.Figure(data=go.Heatmap(
+                z=data['matrix'],
+                x=class_names,  # Use actual class names instead of numeric indices
+                y=class_names,  # Use actual class names instead of numeric indices
+                colorscale='Viridis',
+                hoverongaps=False,
+                hovertemplate='True: %{y}<br>Predicted: %{x}<br>Count: %{z}<extra></extra>'
+            ))
+            
+            fig.update_layout(
+                title='Confusion Matrix',
+                xaxis_title='Predicted Label',
+                yaxis_title='True Label',
+                width=600,
+                height=600
+            )
+        
+        # Convert to image bytes
+        with PHASE_SECONDS.time('render'):
+            img_bytes = fig.to_image(format="png")
+        _CONFUSION_MATRIX_PNG_CACHE.clear()
+        _CONFUSION_MATRIX_PNG_CACHE.update({'run_id': cache_key, 'png': img_bytes})
+        return img_bytes
 
 def build_dynamic_cnn(layers, input_channels=1, input_size=28, num_classes=10):
     model_layers = []
@@ -187,14 +202,132 @@ def calculate_input_size(layers, input_size=28):
     
     return current_size
 
-def train_model(layers, config, progress_callback=None):
-    """Loads data, builds model, and runs a basic PyTorch training loop."""
+def default_class_names(input_channels, num_classes=10):
+    """Class names for checkpoints saved without them (same fallback as test_model)."""
+    test_path = os.path.join('./custom_data', 'test')
+    if os.path.exists(test_path):
+        return datasets.ImageFolder(root=test_path).classes
+    if input_channels == 1:
+        return [str(i) for i in range(10)]
+    return ['airplane', 'automobile', 'bird', 'cat', 'deer',
+            'dog', 'frog', 'horse', 'ship', 'truck']
 
-    global _TEST_DATASET_CACHE
-    global CONFUSION_MATRIX_DATA  # Access global variable
-    
+# Process-wide cache of the built model for TEMP_MODEL_PATH
+MODEL_REGISTRY = ModelRegistry(TEMP_MODEL_PATH, build_dynamic_cnn, DEVICE, class_names_fn=default_class_names)
+
+# Groups concurrent /test_custom requests into one forward pass
+INFERENCE_BATCHER = InferenceBatcher(DEVICE)
+
+def _model_bytes(entry):
+    if entry is None:
+        return 0
+    tensors = list(entry.model.parameters()) + list(entry.model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def _cache_sizes():
+    return {
+        ('model',): _model_bytes(MODEL_REGISTRY.loaded_entry),
+        ('dataset_disk',): directory_size(DATASET_CACHE_PATH),
+        ('tensor_dataset',): tensor_cache_bytes(),
+        ('confusion_png',): len(_CONFUSION_MATRIX_PNG_CACHE.get('png') or b''),
+    }
+
+CACHE_BYTES_GAUGE = Gauge('neuralforge_cache_bytes', 'Size of the in-process and on-disk caches.',
+                          _cache_sizes, ['cache'])
+INFERENCE_QUEUE_GAUGE = Gauge('neuralforge_inference_queue_depth', 'Requests waiting for the inference batcher.',
+                              lambda: INFERENCE_BATCHER.stats()['queue_depth'])
+
+def resolve_checkpoint_path(warm_start):
+    """Maps training_config['warm_start'] to a checkpoint file, or None if there isn't one.
+
+    Only server-written checkpoints are accepted: True or TEMP_MODEL_PATH, or
+    a training job ID, which resolves to that job's checkpoint inside the jobs
+    folder. Arbitrary paths from the request are rejected.
+    """
+    from jobs import JOBS_PATH  # jobs imports this module
+
+    if warm_start is True or warm_start == TEMP_MODEL_PATH:
+        path = TEMP_MODEL_PATH
+    elif isinstance(warm_start, str) and re.fullmatch(r'[0-9a-f]{32}', warm_start):
+        jobs_dir = os.path.realpath(JOBS_PATH)
+        path = os.path.realpath(os.path.join(jobs_dir, warm_start, 'model.pth'))
+        if os.path.dirname(os.path.dirname(path)) != jobs_dir:
+            return None
+    else:
+        return None
+    return path if os.path.isfile(path) else None
+
+def warm_start_model(model, saved_state):
+    """Copies every saved tensor whose name and shape match the new model.
+
+    Returns (loaded, total). Appending/removing later layers shifts their
+    indices, so those are simply left at their fresh initialization.
+    """
+    own_state = model.state_dict()
+    matched = {k: v for k, v in saved_state.items() if k in own_state and own_state[k].shape == v.shape}
+    model.load_state_dict(matched, strict=False)
+    return len(matched), len(own_state)
+
+def split_feature_prefix(model):
+    """Splits a build_dynamic_cnn model into (conv prefix, head) at the Flatten layer."""
+    for i, layer in enumerate(model):
+        if isinstance(layer, nn.Flatten):
+            return model[:i], model[i:]
+    return model[:0], model
+
+def compute_features(prefix, images, batch_size=1000):
+    """Runs the frozen prefix over a whole in-memory dataset once."""
+    features = []
+    with torch.no_grad():
+        for start in range(0, len(images), batch_size):
+            features.append(prefix(images[start:start + batch_size].to(DEVICE)).cpu())
+    return torch.cat(features)
+
+def confusion_counts(labels, predicted, num_classes):
+    """Flattened (C * C) confusion matrix of one batch (row = true label, column = prediction), on its device."""
+    return torch.bincount(labels * num_classes + predicted, minlength=num_classes * num_classes)
+
+class TrainingCancelled(Exception):
+    """Raised inside train_model when its cancel_event is set."""
+    pass
+
+def train_model(layers, config, progress_callback=None, cancel_event=None, checkpoint_path=None,
+                warm_start_path=None, run_results=None):
+    """Loads data, builds model, and runs a basic PyTorch training loop.
+
+    cancel_event (threading.Event) is checked between batches; when set the
+    run stops with TrainingCancelled. checkpoint_path defaults to TEMP_MODEL_PATH.
+    warm_start_path lets internal callers (sweeps) resume from a checkpoint
+    outside the jobs folder; requests go through config['warm_start'].
+    run_results (dict) receives the run's confusion matrix and test set; they
+    only become the server-wide ones through publish_run_results, which
+    happens here when training straight into TEMP_MODEL_PATH and otherwise
+    when the job's checkpoint is promoted.
+    The run holds a share of THREAD_BUDGET while it trains.
+    """
+    if run_results is None:
+        run_results = {}
+    with THREAD_BUDGET.training(checkpoint_path or TEMP_MODEL_PATH) as thread_lease:
+        result = _train_model(layers, config, progress_callback, cancel_event, checkpoint_path, warm_start_path,
+                              thread_lease, run_results)
+    if (checkpoint_path or TEMP_MODEL_PATH) == TEMP_MODEL_PATH:
+        publish_run_results(run_results)
+    return result
+
+def publish_run_results(run_results):
+    """Makes a run's confusion matrix and test set the ones /confusion_matrix and /test use.
+
+    Concurrent jobs each fill their own run_results, so one run never
+    overwrites what another is serving.
+    """
+    global CONFUSION_MATRIX_DATA, _TEST_DATASET_CACHE
+    if run_results.get('test_dataset') is not None:
+        _remember_test_dataset(*run_results['test_dataset'])
     _TEST_DATASET_CACHE = None
-    CONFUSION_MATRIX_DATA = None  # Reset confusion matrix data
+    CONFUSION_MATRIX_DATA = run_results.get('confusion_matrix')
+
+def _train_model(layers, config, progress_callback, cancel_event, checkpoint_path, warm_start_path, thread_lease,
+                 run_results):
     
     # Check if custom dataset exists
     custom_dataset_path = './custom_data'
@@ -203,13 +336,21 @@ def train_model(layers, config, progress_callback=None):
     if has_custom_dataset:
         print("Custom dataset detected - loading from ZIP file...")
         try:
-            train_dataset, test_dataset, dataset_info = load_custom_zip_dataset(custom_dataset_path)
+            lazy_cache_mb = config.get('lazy_cache_mb')
+            train_dataset, test_dataset, dataset_info = load_custom_zip_dataset(
+                custom_dataset_path, progress_callback,
+                lazy=config.get('lazy_dataset'),
+                cache_bytes=int(lazy_cache_mb * 1024 * 1024) if lazy_cache_mb else None,
+                num_workers=thread_lease.cpu_share
+            )
             print(f"✅ Custom dataset loaded: {dataset_info}")
             
             # Use detected parameters
             input_channels = dataset_info['channels']
             input_size = dataset_info['image_size']
             num_classes = dataset_info['num_classes']
+            class_names = dataset_info['class_names']
+            dataset_source = dataset_info['source']
             
             print(f"Detected input size: {input_size}x{input_size}, channels: {input_channels}, classes: {num_classes}")
                 
@@ -224,6 +365,8 @@ def train_model(layers, config, progress_callback=None):
             train_dataset = datasets.MNIST('./data', train=True, download=True, transform=transform)
             test_dataset = datasets.MNIST('./data', train=False, transform=transform)
             input_channels, input_size, num_classes = 1, 28, 10
+            class_names = [str(i) for i in range(10)]
+            dataset_source = 'mnist'
     else:
         # Use MNIST as default
         transform = transforms.Compose([
@@ -233,6 +376,10 @@ def train_model(layers, config, progress_callback=None):
         train_dataset = datasets.MNIST('./data', train=True, download=True, transform=transform)
         test_dataset = datasets.MNIST('./data', train=False, transform=transform)
         input_channels, input_size, num_classes = 1, 28, 10
+        class_names = [str(i) for i in range(10)]
+        dataset_source = 'mnist'
+    # Kept so /test can look samples up by index without reloading it (once published)
+    run_results['test_dataset'] = (dataset_source, test_dataset)
     
     # Build model with detected parameters
     try:
@@ -240,6 +387,35 @@ def train_model(layers, config, progress_callback=None):
     except Exception as e:
         return [f"ERROR: Could not build model. Details: {e}"], 0.0, 0.0
     
+    # Warm start: reuse matching tensors (and optimizer state) from an earlier checkpoint
+    warm_start_data = None
+    warm_start_log = None
+    if warm_start_path is None:
+        warm_start_path = resolve_checkpoint_path(config.get('warm_start'))
+    if config.get('warm_start') and warm_start_path is None:
+        warm_start_log = (f"Warm start: '{config.get('warm_start')}' is not a finished job ID or {TEMP_MODEL_PATH}, "
+                          "training from scratch")
+    elif warm_start_path is not None:
+        try:
+            # Checkpoints only hold tensors and plain Python values
+            warm_start_data = torch.load(warm_start_path, map_location=DEVICE, weights_only=True)
+            loaded, total = warm_start_model(model, warm_start_data['state_dict'])
+            warm_start_log = f"Warm start: loaded {loaded}/{total} tensors from {warm_start_path}"
+            if loaded < total:
+                warm_start_data = None  # optimizer state only fits an identical model
+        except Exception as e:
+            warm_start_data = None
+            warm_start_log = f"Warm start: could not load {warm_start_path} ({e}), training from scratch"
+        print(warm_start_log)
+    
+    # Partial fine-tuning: freeze everything before Flatten and train only the head
+    freeze_features = bool(config.get('freeze_features', False))
+    feature_prefix, head = split_feature_prefix(model)
+    if freeze_features:
+        for param in feature_prefix.parameters():
+            param.requires_grad = False
+        feature_prefix.eval()
+    
     # Rest of the function remains exactly the same...
     subset_indices = torch.randperm(len(train_dataset))
     
@@ -247,107 +423,505 @@ def train_model(layers, config, progress_callback=None):
     if config.get('demo_mode', False):
         print("⚠️ DEMO MODE: Using only 5000 samples")
         subset_indices = subset_indices[:5000] #[:5000] # for demo mode, use only 5000
-    train_subset = torch.utils.data.Subset(train_dataset, subset_indices)
+    num_train_samples = len(subset_indices)
     
     batch_size = config.get('batchSize', 64)
     epochs = config.get('epochs', 3)
     
-    train_loader = DataLoader(train_subset, batch_size=batch_size, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=1000, shuffle=False)
+    # Tensor-resident fast path: whole dataset normalized once, batches by indexing
+    train_tensors = test_tensors = None
+    if config.get('tensor_dataset', True):
+        train_tensors = dataset_to_tensors(train_dataset)
+        test_tensors = dataset_to_tensors(test_dataset) if train_tensors is not None else None
+    
+    loader_settings = resolve_loader_settings(config, DEVICE, cpu_count=thread_lease.cpu_share)
+    # The network the loop runs: just the head when frozen features are cached
+    train_net = model
+    cached_features = False
+    if freeze_features and len(feature_prefix) > 0 and train_tensors is not None and test_tensors is not None:
+        sample_features = compute_features(feature_prefix, train_tensors[0][:1])
+        feature_bytes = sample_features[0].numel() * 4 * (num_train_samples + len(test_tensors[1]))
+        if feature_bytes <= TENSOR_DATASET_MAX_BYTES:
+            print("Caching frozen conv features for the whole dataset")
+            train_tensors = (compute_features(feature_prefix, train_tensors[0][subset_indices]),
+                             train_tensors[1][subset_indices])
+            test_tensors = (compute_features(feature_prefix, test_tensors[0]), test_tensors[1])
+            subset_indices = None
+            train_net = head
+            cached_features = True
+    
+    if train_tensors is not None and test_tensors is not None:
+        print("Using tensor-resident dataset (no per-sample transforms)")
+        train_loader = build_tensor_loader(*train_tensors, batch_size, True, loader_settings, indices=subset_indices)
+        test_loader = build_tensor_loader(*test_tensors, 1000, False, loader_settings)
+        pipeline_desc = f"in-memory tensors, prefetch_thread={loader_settings['prefetch_thread']}"
+        thread_lease.set_loader_threads(1 if loader_settings['prefetch_thread'] else 0)
+    else:
+        train_subset = torch.utils.data.Subset(train_dataset, subset_indices)
+        train_loader = build_data_loader(train_subset, batch_size, True, loader_settings)
+        test_loader = build_data_loader(test_dataset, 1000, False, loader_settings)
+        pipeline_desc = (f"DataLoader, workers={loader_settings['num_workers']}, "
+                         f"prefetch={loader_settings['prefetch_factor']}, "
+                         f"persistent={loader_settings['persistent_workers']}")
+        thread_lease.set_loader_threads(loader_settings['num_workers'])
+    non_blocking = loader_settings['pin_memory']
     
     criterion = nn.CrossEntropyLoss()
+    
+    # Precision / memory layout: bf16 autocast and/or channels_last (weights and optimizer stay fp32)
+    precision, channels_last = resolve_precision(config)
+    precision_log = None
+    if precision != 'fp32' or channels_last:
+        if train_tensors is not None:
+            sample_images, sample_labels = train_tensors[0][:batch_size], train_tensors[1][:batch_size]
+        else:
+            sample_images, sample_labels = next(iter(train_loader))
+        sample_images, sample_labels = sample_images.to(DEVICE), sample_labels.to(DEVICE)
+        fp32_step = measure_step_time(train_net, sample_images, sample_labels, criterion, 'fp32', False, DEVICE)
+        mode_step = measure_step_time(train_net, sample_images, sample_labels, criterion,
+                                      precision, channels_last, DEVICE)
+        precision_log = (f"Precision: {describe(precision, channels_last)}; step {mode_step * 1000:.2f}ms "
+                         f"vs {fp32_step * 1000:.2f}ms fp32 contiguous ({fp32_step / mode_step:.2f}x)")
+        if precision == 'bf16' and DEVICE.type == 'cpu' and not bf16_supported():
+            precision_log += ", no native bf16 on this CPU"
+        print(precision_log)
+        apply_memory_format(train_net, channels_last)
     optimizer_name = config.get('optimizer', 'Adam')
     
+    trainable_params = [p for p in model.parameters() if p.requires_grad]
+    
     if optimizer_name == 'Adam':
-        optimizer = optim.Adam(model.parameters(), lr=0.001)
+        optimizer = optim.Adam(trainable_params, lr=0.001)
     elif optimizer_name == 'SGD':
-        optimizer = optim.SGD(model.parameters(), lr=0.01)
+        optimizer = optim.SGD(trainable_params, lr=0.01)
     else:
-        optimizer = optim.Adam(model.parameters(), lr=0.001)
+        optimizer = optim.Adam(trainable_params, lr=0.001)
+    
+    if (warm_start_data is not None and not freeze_features
+            and warm_start_data.get('optimizer') == optimizer_name
+            and warm_start_data.get('optimizer_state') is not None):
+        try:
+            optimizer.load_state_dict(warm_start_data['optimizer_state'])
+            warm_start_log += ", optimizer state restored"
+        except Exception as e:
+            print(f"Warm start: optimizer state not restored: {e}")
 
     output_log = ["=================================================="]
     output_log.append(f"Model built with PyTorch on device: {DEVICE}")
     output_log.append(f"Training Config: Epochs={epochs}, Batch={batch_size}, Opt={optimizer_name}")
     output_log.append(f"Input: {input_channels} channel(s), {input_size}x{input_size} images")
     output_log.append(f"Architecture: Input → {len(layers)} user layers → Output({num_classes} classes)")
+    output_log.append(f"Input pipeline: {pipeline_desc}, pin_memory={loader_settings['pin_memory']}")
+    output_log.append(f"Threads: {THREAD_BUDGET.intra_op_threads} intra-op of a {THREAD_BUDGET.total}-thread budget "
+                      f"(run share {thread_lease.cpu_share}, {thread_lease.loader_threads} for input)")
+    if warm_start_log:
+        output_log.append(warm_start_log)
+    if precision_log:
+        output_log.append(precision_log)
+    if freeze_features:
+        output_log.append(f"Fine-tuning head only ({len(trainable_params)} trainable tensors), "
+                          f"cached features={cached_features}")
     
     final_loss, final_accuracy = 0.0, 0.0
+    
+    # Checkpoints are written in the background; see checkpoint_writer.RETENTION_POLICIES
+    save_path = checkpoint_path or TEMP_MODEL_PATH
+    retention = config.get('checkpoint_retention', 'last')
+    if retention not in RETENTION_POLICIES:
+        retention = 'last'
+    keep_last = int(config.get('checkpoint_keep_last', 0))
+    history_paths, pruned_paths = [], []
+    final_save_data = None  # what ends up at save_path
+    best_accuracy = None
+    output_log.append(f"Checkpointing: retention={retention}, keep_last={keep_last}")
+    
+    # Evaluation schedule: every eval_every epochs (0 = final epoch only). Intermediate
+    # evals can use a fixed stratified subsample and/or run on a weight snapshot in the
+    # background; the final eval is always exact.
+    eval_every = int(config.get('eval_every', 1))
+    eval_subsample = config.get('eval_subsample')
+    # 'best' retention needs each epoch's accuracy before deciding what to save
+    eval_async = bool(config.get('eval_async', False)) and retention != 'best'
+    
+    intermediate_test_loader = test_loader
+    if eval_subsample:
+        if test_tensors is not None:
+            eval_indices = stratified_subsample(test_tensors[1], eval_subsample)
+            intermediate_test_loader = build_tensor_loader(test_tensors[0][eval_indices], test_tensors[1][eval_indices],
+                                                           1000, False, loader_settings)
+        else:
+            test_labels = dataset_labels(test_dataset)
+            if test_labels is None:
+                test_labels = torch.zeros(len(test_dataset), dtype=torch.long)  # plain random subset
+            eval_indices = stratified_subsample(test_labels, eval_subsample)
+            intermediate_test_loader = build_data_loader(torch.utils.data.Subset(test_dataset, eval_indices.tolist()),
+                                                         1000, False, loader_settings)
+        eval_desc = f"{len(eval_indices)}-sample stratified subset"
+    else:
+        eval_desc = "full test set"
+    eval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-eval') if eval_async else None
+    eval_schedule = f"every {eval_every} epoch(s)" if eval_every > 0 else "final epoch only"
+    output_log.append(f"Evaluation: {eval_schedule} on {eval_desc}, async={eval_async}")
+    
+    # Opt-in torch.profiler window; when 'profile' isn't set there is no profiler and no per-step work
+    profile_settings = resolve_profile_settings(config.get('profile'))
+    profiler = None
+    if profile_settings is not None:
+        profiler = TrainingProfiler(profile_dir_for(checkpoint_path), profile_settings)
+        output_log.append(f"Profiling: {profiler.total_steps} steps "
+                          f"(wait={profile_settings['wait']}, warmup={profile_settings['warmup']}, "
+                          f"active={profile_settings['active']}) -> {profiler.output_dir}")
+    
+    # int8 copy of the final weights (conv stack static, Linear head dynamic), see quantization.py
+    quantize = bool(config.get('quantize', QUANTIZE_INT8))
+    quantization_log = None
+    # Final-epoch accuracy with the run's precision vs fp32 (set on the final epoch when precision isn't fp32)
+    precision_accuracy_log = None
+    retention_log = None
+    
+    # Per-batch progress: rate limited, so the cost is one clock read per step
+    progress_interval = float(config.get('progress_interval', PROGRESS_INTERVAL))
+    report_batches = progress_callback is not None and progress_interval > 0
+    steps_per_epoch = len(train_loader)
+    total_steps = steps_per_epoch * epochs
+    training_start = time.perf_counter()
+    
+    def evaluate(net, loader, collect=False, eval_precision=None):
+        """Returns (accuracy, confusion matrix, outputs).
 
-    for epoch in range(1, epochs + 1):
-        model.train()
-        running_loss = 0.0
-        
-        for images, labels in train_loader:
-            images, labels = images.to(DEVICE), labels.to(DEVICE)
-            
-            optimizer.zero_grad()
-            outputs = model(images)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            
-            running_loss += loss.item() * images.size(0)
-            
-        epoch_loss = running_loss / len(train_subset)
-        
-        model.eval()
+        With collect=True the (C, C) confusion matrix and the (N, C) model
+        outputs in test-set order are returned too, otherwise both are None.
+        eval_precision overrides the run's precision (used for the fp32 comparison).
+        """
+        eval_precision = eval_precision or precision
         correct = 0
         total = 0
-        
-        # Collect predictions for confusion matrix (only on last epoch)
-        if epoch == epochs:
-            all_predictions = []
-            all_labels = []
-        
-        with torch.no_grad():
-            for images, labels in test_loader:
-                images, labels = images.to(DEVICE), labels.to(DEVICE)
-                outputs = model(images)
+        confusion = torch.zeros(num_classes * num_classes, dtype=torch.long, device=DEVICE) if collect else None
+        all_outputs = [] if collect else None
+        with torch.no_grad(), PHASE_SECONDS.time('eval'):
+            for images, labels in loader:
+                images = images.to(DEVICE, non_blocking=non_blocking)
+                labels = labels.to(DEVICE, non_blocking=non_blocking)
+                if channels_last:
+                    images = to_channels_last(images)
+                with autocast(eval_precision, DEVICE):
+                    outputs = net(images)
+                outputs = outputs.float()
                 _, predicted = torch.max(outputs.data, 1)
                 total += labels.size(0)
                 correct += (predicted == labels).sum().item()
                 
-                # Store predictions and labels for confusion matrix (only on last epoch)
-                if epoch == epochs:
-                    all_predictions.extend(predicted.cpu().numpy())
-                    all_labels.extend(labels.cpu().numpy())
+                # Accumulate the confusion matrix on the fly: row = true label, column = prediction
+                if collect:
+                    confusion += confusion_counts(labels, predicted, num_classes)
+                    all_outputs.append(outputs.float().cpu())
+        if collect:
+            confusion = confusion.view(num_classes, num_classes).cpu().numpy()
+            all_outputs = torch.cat(all_outputs) if all_outputs else torch.zeros(0, num_classes)
+        return (correct / total if total else 0.0), confusion, all_outputs
+    
+    # (epoch, loss, accuracy or Future or None, data_wait, compute) in epoch order
+    pending_reports = []
+    
+    def flush_epoch_reports(wait=False):
+        """Reports finished epochs in order; async evals are waited for only if `wait`."""
+        nonlocal final_loss, final_accuracy
+        while pending_reports:
+            report_epoch, report_loss, accuracy, report_wait, report_compute = pending_reports[0]
+            if isinstance(accuracy, Future):
+                if not wait and not accuracy.done():
+                    return
+                accuracy = accuracy.result()[0]
+            pending_reports.pop(0)
+            
+            final_loss = report_loss
+            if accuracy is not None:
+                final_accuracy = accuracy
+            
+            # Call optional progress callback for real-time streaming (e.g., SSE or websocket)
+            if progress_callback is not None:
+                try:
+                    progress_callback({"epoch": report_epoch, "loss": report_loss, "accuracy": accuracy,
+                                       "data_wait": report_wait, "compute": report_compute})
+                except Exception:
+                    # Don't let callback errors break training; just continue
+                    pass
+            
+            # Print to stdout with flush so console shows updates in real time
+            accuracy_text = f"{accuracy:.4f}" if accuracy is not None else "not evaluated"
+            epoch_line = f"Epoch {report_epoch}/{epochs} - Loss: {report_loss:.4f}, Accuracy: {accuracy_text}"
+            print(epoch_line, flush=True)
+            output_log.append(epoch_line)
+            
+            wait_share = report_wait / (report_wait + report_compute) if report_wait + report_compute > 0 else 0.0
+            timing_line = (f"  Data wait: {report_wait:.2f}s, Compute: {report_compute:.2f}s "
+                           f"({wait_share:.0%} input-bound)")
+            print(timing_line, flush=True)
+            output_log.append(timing_line)
+
+    try:
+        if profiler is not None:
+            profiler.start()
         
-        epoch_accuracy = correct / total
-        final_loss, final_accuracy = epoch_loss, epoch_accuracy
-
-        # Store confusion matrix data on final epoch
-        if epoch == epochs:
-            CONFUSION_MATRIX_DATA = {
-                'predictions': all_predictions,
-                'labels': all_labels,
-                'num_classes': num_classes
-            }
-
-        # Call optional progress callback for real-time streaming (e.g., SSE or websocket)
-        if progress_callback is not None:
-            try:
-                progress_callback({"epoch": epoch, "loss": final_loss, "accuracy": final_accuracy})
-            except Exception:
-                # Don't let callback errors break training; just continue
-                pass
-
-        # Print to stdout with flush so console shows updates in real time
-        epoch_line = f"Epoch {epoch}/{epochs} - Loss: {final_loss:.4f}, Accuracy: {final_accuracy:.4f}"
-        print(epoch_line, flush=True)
-        output_log.append(epoch_line)
-
-        save_data = {
-            'state_dict': model.state_dict(),
-            'layers': layers,
-            'input_channels': input_channels,
-            'input_size': input_size,
-            'num_classes': num_classes
-        }
-        torch.save(save_data, TEMP_MODEL_PATH)
+        for epoch in range(1, epochs + 1):
+            train_net.train()
+            if freeze_features:
+                feature_prefix.eval()
+            running_loss = 0.0
+            
+            # Time spent waiting on the input pipeline vs. running the model
+            data_wait, compute_time = 0.0, 0.0
+            step_start = time.perf_counter()
+            epoch_start = last_progress = step_start
+            samples_seen = 0
+            
+            for step, (images, labels) in enumerate(train_loader, 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise TrainingCancelled(f"Training cancelled during epoch {epoch}")
+                fetched = time.perf_counter()
+                data_wait += fetched - step_start
+                
+                images = images.to(DEVICE, non_blocking=non_blocking)
+                labels = labels.to(DEVICE, non_blocking=non_blocking)
+                if channels_last:
+                    images = to_channels_last(images)
+                
+                optimizer.zero_grad()
+                with autocast(precision, DEVICE):
+                    outputs = train_net(images)
+                # Loss always in fp32
+                loss = criterion(outputs.float(), labels)
+                forward_done = time.perf_counter()
+                loss.backward()
+                backward_done = time.perf_counter()
+                optimizer.step()
+                step_done = time.perf_counter()
+                
+                # On CUDA these are launch times; the sync happens in loss.item() below
+                PHASE_SECONDS.observe(fetched - step_start, 'data_fetch')
+                PHASE_SECONDS.observe(forward_done - fetched, 'forward')
+                PHASE_SECONDS.observe(backward_done - forward_done, 'backward')
+                PHASE_SECONDS.observe(step_done - backward_done, 'optimizer_step')
+                
+                running_loss += loss.item() * images.size(0)
+                samples_seen += images.size(0)
+                
+                step_start = time.perf_counter()
+                compute_time += step_start - fetched
+                
+                if report_batches and step_start - last_progress >= progress_interval:
+                    last_progress = step_start
+                    steps_done = (epoch - 1) * steps_per_epoch + step
+                    seconds_per_step = (step_start - training_start) / steps_done
+                    try:
+                        # No 'epoch' key: clients treat messages with one as end-of-epoch results
+                        progress_callback({"stage": "train", "current_epoch": epoch, "step": step,
+                                           "steps": steps_per_epoch, "running_loss": running_loss / samples_seen,
+                                           "samples_per_sec": samples_seen / max(step_start - epoch_start, 1e-9),
+                                           "eta": seconds_per_step * (total_steps - steps_done),
+                                           "data_wait": data_wait, "compute": compute_time})
+                    except Exception:
+                        pass
+                
+                if profiler is not None:
+                    profiler.step()
+                
+            epoch_loss = running_loss / num_train_samples
+            epoch_accuracy = None
+            
+            if epoch == epochs:
+                # Final eval is always synchronous and on the full test set (confusion matrix needs it)
+                flush_epoch_reports(wait=True)
+                epoch_accuracy, confusion, test_outputs = evaluate(train_net, test_loader, collect=True)
+                # The weights that end up at save_path: with 'best' retention and no improvement this
+                # epoch that's an earlier epoch, and the stored predictions / int8 model must match them
+                kept_model, kept_net, kept_accuracy = model, train_net, epoch_accuracy
+                keeps_earlier = (retention == 'best' and final_save_data is not None
+                                 and best_accuracy is not None and epoch_accuracy <= best_accuracy)
+                if keeps_earlier:
+                    kept_model = copy.deepcopy(model)
+                    kept_model.load_state_dict(final_save_data['state_dict'])
+                    kept_net = split_feature_prefix(kept_model)[1] if cached_features else kept_model
+                    kept_accuracy, confusion, test_outputs = evaluate(kept_net, test_loader, collect=True)
+                fp32_accuracy = kept_accuracy
+                if precision != 'fp32':
+                    fp32_accuracy, _, _ = evaluate(kept_net, test_loader, eval_precision='fp32')
+                    precision_accuracy_log = (f"Precision: final accuracy {kept_accuracy:.4f} with {precision} "
+                                              f"vs {fp32_accuracy:.4f} in fp32 (delta {kept_accuracy - fp32_accuracy:+.4f})")
+                test_predictions = build_test_predictions(dataset_source, test_outputs, test_dataset)
+                
+                int8_info = None
+                if quantize:
+                    # Calibrated and scored on test images (the cached-features loader only has features)
+                    quantize_loader = (build_data_loader(test_dataset, 1000, False, loader_settings)
+                                       if cached_features else test_loader)
+                    int8_info, quantization_log = quantize_checkpoint_model(kept_model, quantize_loader, fp32_accuracy)
+                
+                if keeps_earlier:
+                    # Rewrite the kept checkpoint with the extras computed for its weights
+                    final_save_data = dict(final_save_data, test_predictions=test_predictions, int8=int8_info)
+                    CHECKPOINT_WRITER.submit(save_path, final_save_data,
+                                             MODEL_REGISTRY.publish if save_path == TEMP_MODEL_PATH else None)
+                    retention_log = (f"Checkpoint: kept epoch {final_save_data['epoch']} (accuracy {kept_accuracy:.4f}); "
+                                     f"test predictions and int8 model computed for its weights")
+                
+                # Store confusion matrix data on final epoch; run_id keys the rendered PNG cache
+                run_results['confusion_matrix'] = {
+                    'matrix': confusion,
+                    'num_classes': num_classes,
+                    'class_names': class_names,
+                    'run_id': uuid.uuid4().hex
+                }
+                pending_reports.append((epoch, epoch_loss, epoch_accuracy, data_wait, compute_time))
+            elif eval_every > 0 and epoch % eval_every == 0:
+                if eval_executor is not None:
+                    # Evaluate a snapshot of the weights while the next epoch trains
+                    snapshot_net = copy.deepcopy(train_net)
+                    future = eval_executor.submit(evaluate, snapshot_net, intermediate_test_loader)
+                    pending_reports.append((epoch, epoch_loss, future, data_wait, compute_time))
+                else:
+                    epoch_accuracy, _, _ = evaluate(train_net, intermediate_test_loader)
+                    pending_reports.append((epoch, epoch_loss, epoch_accuracy, data_wait, compute_time))
+            else:
+                pending_reports.append((epoch, epoch_loss, None, data_wait, compute_time))
+            
+            flush_epoch_reports(wait=epoch == epochs)
+
+            improved = epoch_accuracy is not None and (best_accuracy is None or epoch_accuracy > best_accuracy)
+            if improved:
+                best_accuracy = epoch_accuracy
+            
+            should_save = (retention == 'last'
+                           or (retention == 'best' and improved)
+                           or (retention == 'final' and epoch == epochs))
+            if should_save:
+                save_data = {
+                    # CPU snapshot, so the next epoch can keep updating the live weights
+                    'state_dict': snapshot_state_dict(model.state_dict()),
+                    'layers': layers,
+                    'input_channels': input_channels,
+                    'input_size': input_size,
+                    'num_classes': num_classes,
+                    'class_names': class_names,
+                    'epoch': epoch,
+                    'accuracy': epoch_accuracy,
+                    'optimizer': optimizer_name,
+                    'optimizer_state': snapshot_optimizer_state(optimizer.state_dict()) if not freeze_features else None,
+                    # Whole-test-set outputs of these weights (final epoch only), so /test is a lookup
+                    'test_predictions': test_predictions if epoch == epochs else None,
+                    # {'model': TorchScript bytes (uint8 tensor), 'accuracy', 'fp32_accuracy'} (final epoch only)
+                    'int8': int8_info if epoch == epochs else None
+                }
+                # Written on the checkpoint thread; the inference model is hot-swapped once it's on disk
+                on_written = MODEL_REGISTRY.publish if save_path == TEMP_MODEL_PATH else None
+                CHECKPOINT_WRITER.submit(save_path, save_data, on_written)
+                final_save_data = save_data
+                
+                if keep_last > 0:
+                    history_path = f"{os.path.splitext(save_path)[0]}_epoch{epoch}.pth"
+                    CHECKPOINT_WRITER.submit(history_path, save_data)
+                    history_paths.append(history_path)
+                    while len(history_paths) > keep_last:
+                        pruned_path = history_paths.pop(0)
+                        CHECKPOINT_WRITER.remove(pruned_path)
+                        pruned_paths.append(pruned_path)
+    finally:
+        # Also when cancelled or failing: no profiler left recording, no idle async-eval thread left behind
+        if profiler is not None:
+            profiler.stop()  # no-op if the profiling window already closed
+        if eval_executor is not None:
+            eval_executor.shutdown(wait=False)
         
+    if precision_accuracy_log:
+        print(precision_accuracy_log)
+        output_log.append(precision_accuracy_log)
+    if retention_log:
+        print(retention_log)
+        output_log.append(retention_log)
+    if quantization_log:
+        print(quantization_log)
+        output_log.append(quantization_log)
+    # Make sure the final checkpoint is on disk before callers (e.g. /test, job promotion) read it
+    for path in [save_path] + history_paths + pruned_paths:
+        CHECKPOINT_WRITER.flush(path)
+    
+    # ONNX copy of the finished checkpoint, for onnx_inference.py replicas and the 'onnx' backend
+    if config.get('export_onnx', EXPORT_ONNX) and final_save_data is not None:
+        onnx_log = export_checkpoint_onnx(final_save_data, save_path)
+        print(onnx_log)
+        output_log.append(onnx_log)
+    
     return output_log, final_loss, final_accuracy
 
 
+def quantize_checkpoint_model(model, loader, fp32_accuracy):
+    """(int8 entry for the checkpoint or None, log line) for `model`, calibrated and scored on `loader`."""
+    try:
+        with PHASE_SECONDS.time('quantize'):
+            int8_model = quantize_int8(*split_feature_prefix(model), calibration_batches(loader))
+        int8_info = {
+            'model': serialize_int8(int8_model),
+            'accuracy': int8_accuracy(int8_model, loader),
+            'fp32_accuracy': fp32_accuracy,
+        }
+    except Exception as e:
+        return None, f"Quantization: int8 export failed: {e}"
+    fp32_bytes = sum(t.numel() * t.element_size() for t in model.state_dict().values())
+    return int8_info, (f"Quantization: int8 accuracy {int8_info['accuracy']:.4f} vs "
+                       f"{fp32_accuracy:.4f} fp32 (delta {int8_info['accuracy'] - fp32_accuracy:+.4f}), "
+                       f"{len(int8_info['model']) / 1024:.0f}KB vs {fp32_bytes / 1024:.0f}KB; "
+                       f"{'within' if within_tolerance(int8_info) else 'outside'} the int8 serving tolerance")
+
+def export_checkpoint_onnx(save_data, save_path):
+    """Exports the weights in `save_data` to onnx_path_for(save_path); returns the log line."""
+    onnx_path = onnx_path_for(save_path)
+    try:
+        export_model = build_dynamic_cnn(save_data['layers'], save_data['input_channels'], save_data['input_size'],
+                                         save_data['num_classes'])
+        export_model.load_state_dict(save_data['state_dict'])
+        with PHASE_SECONDS.time('onnx_export'):
+            max_diff = export_onnx(export_model, onnx_path, save_data['input_channels'], save_data['input_size'],
+                                   save_data['class_names'],
+                                   {'epoch': save_data['epoch'], 'accuracy': save_data['accuracy']})
+    except ImportError as e:
+        return f"ONNX: export skipped ({e})"
+    except Exception as e:
+        return f"ONNX: export failed: {e}"
+    return f"ONNX: exported {onnx_path}" + (f", max |onnxruntime - torch| {max_diff:.2g}" if max_diff is not None
+                                           else ", onnxruntime not installed for the parity check")
+
+def finalize_checkpoint(checkpoint_path, quantize=True, export=True):
+    """Adds the int8 model and/or ONNX export to a checkpoint trained without them.
+
+    Used for a sweep's winning trial (trials skip both). The int8 model is
+    calibrated on the test set the checkpoint's predictions were computed on.
+    Returns the log lines.
+    """
+    saved_data = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+    log = []
+    if quantize:
+        test_predictions = saved_data.get('test_predictions')
+        test_dataset = _test_dataset_for(test_predictions['source']) if test_predictions else None
+        if test_dataset is None:
+            log.append("Quantization: skipped, the checkpoint's test set isn't available")
+        else:
+            model = build_dynamic_cnn(saved_data['layers'], saved_data['input_channels'], saved_data['input_size'],
+                                      saved_data['num_classes'])
+            model.load_state_dict(saved_data['state_dict'])
+            model.eval()
+            loader = DataLoader(test_dataset, batch_size=1000, shuffle=False)
+            # int8_accuracy scores any CPU module
+            saved_data['int8'], quantization_log = quantize_checkpoint_model(model, loader,
+                                                                             int8_accuracy(model, loader))
+            log.append(quantization_log)
+            atomic_save(saved_data, checkpoint_path)
+    if export:
+        log.append(export_checkpoint_onnx(saved_data, checkpoint_path))
+    for line in log:
+        print(line)
+    return log
+
+
 # ===== SIMPLE CUSTOM DATASET LOADING =====
 
 class SimpleCustomDataset(torch.utils.data.Dataset):
@@ -369,12 +943,17 @@ class SimpleCustomDataset(torch.utils.data.Dataset):
             
         return image, label
 
-def load_custom_zip_dataset(custom_dataset_path):
-    """Load dataset from ZIP file - handles any folder names."""
-    import zipfile
-    from PIL import Image
-    import io
-    
+def load_custom_zip_dataset(custom_dataset_path, progress_callback=None, lazy=None, cache_bytes=None,
+                            build_cache=True, num_workers=None):
+    """Load dataset from ZIP file - handles any folder names.
+
+    The first load decodes every image and writes a uint8 array cache keyed by
+    the ZIP's content hash; later loads memory-map that cache instead.
+    With lazy=True (or lazy=None and an archive too big to decode into RAM)
+    images are decoded on demand from the ZIP by LazyZipDataset instead.
+    build_cache=False never decodes the whole ZIP: without a cache it loads lazily.
+    num_workers sizes the decode pool (see ingest_zip); training passes its thread share.
+    """
     # Find the first ZIP file in custom_data folder
     zip_files = [f for f in os.listdir(custom_dataset_path) if f.endswith('.zip')]
     if not zip_files:
@@ -383,216 +962,269 @@ def load_custom_zip_dataset(custom_dataset_path):
     zip_path = os.path.join(custom_dataset_path, zip_files[0])
     print(f"Loading from ZIP: {zip_files[0]}")
     
-    train_images = []
-    train_labels = []
-    test_images = []
-    test_labels = []
+    zip_hash = hash_file(zip_path)
+    cached = None if lazy else load_cached_arrays(zip_hash)
+    if cached is None:
+        index = index_zip(zip_path)
+        entries, _, image_size, channels = index
+        decoded_bytes = len(entries) * image_size[0] * image_size[1] * channels
+        if lazy is None and decoded_bytes > LAZY_DATASET_THRESHOLD_BYTES:
+            print(f"Dataset would decode to {decoded_bytes / (1024 * 1024):.0f} MB, streaming it from the ZIP instead")
+            lazy = True
+        if lazy or not build_cache:
+            train_dataset, test_dataset, dataset_info = _load_lazy_zip_dataset(zip_path, index, cache_bytes)
+            dataset_info['source'] = f'custom:{zip_hash}'
+            return train_dataset, test_dataset, dataset_info
+        
+        with cache_build_lock(zip_hash):
+            # A concurrent job or sweep worker may have built it while this one waited
+            cached = load_cached_arrays(zip_hash)
+            if cached is None:
+                print(f"No dataset cache for {zip_hash[:12]}, decoding images...")
+                _build_dataset_cache(zip_path, zip_hash, index, progress_callback=progress_callback,
+                                     num_workers=num_workers)
+                cached = load_cached_arrays(zip_hash)
+        if cached is None:
+            raise Exception("Could not read back the dataset cache")
+    else:
+        print(f"Using cached dataset {zip_hash[:12]} (skipping decode)")
     
-    # Dynamic class mapping - will be built as we encounter folder names
-    class_to_label = {}
-    next_label = 0
+    meta = cached['meta']
+    class_to_label = meta['class_to_label']
+    train_labels = cached['train_labels']
+    test_labels = cached['test_labels']
     
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        # Get all files in the ZIP
-        file_list = zip_ref.namelist()
-        print(f"Files in ZIP: {len(file_list)}")
-        print(f"First few files: {file_list[:10]}")  # Debug: show first 10 files
-        
-        # Look for training/ and testing/ folders 
-        for file_path in file_list:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                # Parse the path to get label and split type
-                parts = file_path.split('/')
-                
-                # Debug: print the path structure
-                if len(train_images) < 5:  # Only print first few for debugging
-                    print(f"Processing: {file_path}, Parts: {parts}")
-                
-                # Find the class folder name (the folder containing the image)
-                class_name = None
-                for i, part in enumerate(parts):
-                    if i < len(parts) - 1:  # Not the last part (filename)
-                        if parts[i+1].lower().endswith(('.png', '.jpg', '.jpeg')):
-                            class_name = part
-                            break
-                
-                # If we couldn't find class name, try the folder before the file
-                if class_name is None and len(parts) >= 2:
-                    class_name = parts[-2]  # Folder containing the image file
-                
-                if class_name:
-                    # Add to class mapping if new class
-                    if class_name not in class_to_label:
-                        class_to_label[class_name] = next_label
-                        next_label += 1
-                    
-                    label = class_to_label[class_name]
-                    
-                    # Determine if it's train or test
-                    is_train = any(x in file_path.lower() for x in ['training', 'train'])
-                    is_test = any(x in file_path.lower() for x in ['testing', 'test'])
-                    
-                    # If no clear train/test, use folder structure or default to train
-                    if not is_train and not is_test:
-                        # Check if file is in a train/test folder
-                        for part in parts:
-                            if 'train' in part.lower():
-                                is_train = True
-                                break
-                            elif 'test' in part.lower():
-                                is_test = True
-                                break
-                        # If still not clear, default to train
-                        if not is_train and not is_test:
-                            is_train = True
-                    
-                    try:
-                        with zip_ref.open(file_path) as file:
-                            image_data = file.read()
-                            # Try to detect if image is RGB or grayscale
-                            image = Image.open(io.BytesIO(image_data))
-                            
-                            # Convert to RGB if it's not grayscale
-                            if image.mode != 'L':
-                                image = image.convert('RGB')
-                            
-                            if is_train:
-                                train_images.append(image)
-                                train_labels.append(label)
-                            else:  # is_test
-                                test_images.append(image)
-                                test_labels.append(label)
-                    except Exception as e:
-                        print(f"Warning: Could not load {file_path}: {e}")
-        
-        # If we found images but no test images, split train 80/20
-        if train_images and not test_images:
-            print("No test folder found, splitting train data 80/20")
-            split_idx = int(0.8 * len(train_images))
-            test_images = train_images[split_idx:]
-            test_labels = train_labels[split_idx:]
-            train_images = train_images[:split_idx]
-            train_labels = train_labels[:split_idx]
-    
-    if not train_images:
-        # Print debug info about what files were found
-        image_files = [f for f in file_list if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        print(f"Found {len(image_files)} image files but couldn't load any")
-        print(f"Image files: {image_files[:20]}")  # Show first 20 image files
-        raise Exception("No training images found in ZIP file")
-    
-    print(f"Loaded {len(train_images)} training images, {len(test_images)} test images")
+    print(f"Loaded {len(train_labels)} training images, {len(test_labels)} test images")
     
     # Print class mapping for debugging
     print(f"Class mapping: {class_to_label}")
     
     # Print label distribution for debugging
-    if train_labels:
-        unique_labels = sorted(set(train_labels + test_labels))
-        print(f"Unique labels found: {unique_labels}")
-        print(f"Number of classes: {len(class_to_label)}")
-        print(f"Train label distribution: {np.bincount(train_labels)}")
-        if test_labels:
-            print(f"Test label distribution: {np.bincount(test_labels)}")
+    print(f"Number of classes: {len(class_to_label)}")
+    print(f"Train label distribution: {np.bincount(train_labels)}")
+    if len(test_labels):
+        print(f"Test label distribution: {np.bincount(test_labels)}")
     
     # Get dataset info for model building
-    if train_images:
-        sample_image = train_images[0]
-        if isinstance(sample_image, Image.Image):
-            image_size = sample_image.size[0]  # Assuming square images
-            channels = 3 if sample_image.mode == 'RGB' else 1
-        else:
-            image_size = sample_image.shape[0]
-            channels = sample_image.shape[2] if len(sample_image.shape) == 3 else 1
-    else:
-        image_size = 28
-        channels = 1
-    
-    # Create appropriate transform based on image type
-    if channels == 1:
-        transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize((0.1307,), (0.3081,))
-        ])
-    else:
-        transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
-        ])
+    channels = meta['channels']
+    image_size = meta['image_size']
+    mean, std = NORMALIZATION[channels]
     
-    train_dataset = SimpleCustomDataset(train_images, train_labels, transform)
-    test_dataset = SimpleCustomDataset(test_images, test_labels, transform)
+    train_dataset = CachedArrayDataset(cached['train_images'], train_labels, mean, std)
+    test_dataset = CachedArrayDataset(cached['test_images'], test_labels, mean, std)
     
     dataset_info = {
         'channels': channels,
         'image_size': image_size,
-        'num_classes': len(class_to_label)
+        'num_classes': len(class_to_label),
+        'class_names': sorted(class_to_label, key=class_to_label.get),
+        'source': f'custom:{zip_hash}'
     }
     
     return train_dataset, test_dataset, dataset_info
 
+def _build_dataset_cache(zip_path, zip_hash, index, progress_callback=None, num_workers=None):
+    """Decodes every image in the ZIP once (in parallel) and writes the packed array cache."""
+    arrays = ingest_zip(zip_path, num_workers=num_workers, progress_callback=progress_callback, index=index)
+    save_cached_arrays(
+        zip_hash,
+        arrays['train_images'], arrays['train_labels'],
+        arrays['test_images'], arrays['test_labels'],
+        arrays['class_to_label']
+    )
 
-def train_generator(layers, config):
-    """Generator that runs train_model in a background thread and yields
-    Server-Sent Events (SSE) formatted messages (text/event-stream).
+def _load_lazy_zip_dataset(zip_path, index, cache_bytes=None):
+    """Out-of-core variant: keeps only the member index, decodes in __getitem__."""
+    entries, class_to_label, image_size, channels = index
+    train_entries, test_entries = split_entries(entries)
+    mean, std = NORMALIZATION[channels]
+    if cache_bytes is None:
+        cache_bytes = LAZY_CACHE_BYTES
+    
+    train_dataset = LazyZipDataset(zip_path, train_entries, image_size, channels, mean, std, cache_bytes)
+    test_dataset = LazyZipDataset(zip_path, test_entries, image_size, channels, mean, std, cache_bytes)
+    print(f"Lazy dataset: {len(train_dataset)} training images, {len(test_dataset)} test images, "
+          f"{cache_bytes / (1024 * 1024):.0f} MB decode cache per process")
+    
+    dataset_info = {
+        'channels': channels,
+        'image_size': image_size[0],
+        'num_classes': len(class_to_label),
+        'class_names': sorted(class_to_label, key=class_to_label.get)
+    }
+    
+    return train_dataset, test_dataset, dataset_info
 
-    Yields lines like: 'data: {json}\n\n' for each epoch and a final message
-    with done=True when training completes.
+
+def sse_message(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+def job_summary(job):
+    """The done=True message that ends a job's event stream."""
+    if job.result is not None:
+        output, final_loss, final_accuracy = job.result
+        return {"done": True, "job_id": job.id, "loss": final_loss, "accuracy": final_accuracy, "output": output}
+    return {"done": True, "job_id": job.id, "status": job.status, "error": job.error,
+            "loss": None, "accuracy": None}
+
+def stream_job_events(job):
+    """Yields SSE messages for a job: its replayed and live progress events, then a done=True summary.
+
+    Any number of clients can stream the same job; each one only reads from the
+    progress hub, so watching never blocks training. (asgi.py has the async version.)
     """
-    q = queue.Queue()
-    sentinel = object()
+    subscription = job.subscribe()
+    try:
+        while True:
+            item = subscription.get()
+            if item is None:
+                break
+            yield sse_message(item)
+    finally:
+        job.unsubscribe(subscription)
 
-    def callback(data):
-        try:
-            q.put(json.dumps(data))
-        except Exception:
-            pass
+    # send final summary
+    yield sse_message(job_summary(job))
 
-    def worker():
-        output, final_loss, final_accuracy = train_model(layers, config, progress_callback=callback)
-        # send final summary
-        try:
-            q.put(json.dumps({"done": True, "loss": final_loss, "accuracy": final_accuracy, "output": output}))
-        except Exception:
-            pass
-        q.put(sentinel)
+def train_generator(layers, config):
+    """Submits a training job and yields its progress as Server-Sent Events
+    (SSE) formatted messages (text/event-stream).
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
+    The first message carries the job_id, then one 'data: {json}\n\n' line per
+    progress event, and a final message with done=True when the job ends.
+    Disconnecting doesn't stop the job; it can still be watched (GET
+    /jobs/<id>/events) or cancelled through the /jobs endpoints.
+    """
+    from jobs import SCHEDULER  # jobs imports this module
 
-    while True:
-        item = q.get()
-        if item is sentinel:
-            break
-        yield f"data: {item}\n\n"
+    job = SCHEDULER.submit(layers, config, priority=config.get('priority', 0))
+    yield sse_message({'job_id': job.id, 'status': job.status})
+    yield from stream_job_events(job)
+
+def load_model_entry():
+    """Returns the registry entry (model + metadata) for the saved checkpoint, or None."""
+    return MODEL_REGISTRY.get()
 
 def load_temp_model():
-    """Loads the model state from the temporary file and rebuilds the model."""
-    if not os.path.exists(TEMP_MODEL_PATH):
+    """Returns the eval-mode model for the saved checkpoint, or None if there isn't one."""
+    entry = MODEL_REGISTRY.get()
+    if entry is None:
+        return None
+    return entry.model
+
+# Global variable to cache the test dataset
+_TEST_DATASET_CACHE = None
+
+# (source, test_dataset) of the dataset the last model was trained on; source is 'mnist' or 'custom:<zip sha256>'
+_EVAL_TEST_DATASET = None
+_EVAL_TEST_DATASET_LOCK = threading.Lock()
+
+def _remember_test_dataset(source, test_dataset):
+    global _EVAL_TEST_DATASET
+    with _EVAL_TEST_DATASET_LOCK:
+        _EVAL_TEST_DATASET = (source, test_dataset)
+
+def build_test_predictions(source, outputs, test_dataset):
+    """Compact record of the model outputs over the whole test set, saved inside the checkpoint.
+
+    Plain tensors (float16 outputs, int16 predictions), so the checkpoint still
+    loads with torch.load(weights_only=True).
+    """
+    labels = dataset_labels(test_dataset)
+    index_dtype = torch.int16 if outputs.shape[1] < 2 ** 15 else torch.int32
+    return {
+        'source': source,
+        'outputs': outputs.half(),
+        'predictions': outputs.argmax(dim=1).to(index_dtype),
+        'labels': labels.to(index_dtype) if labels is not None else None
+    }
+
+def _test_dataset_for(source):
+    """The test set a checkpoint's predictions were computed on, or None if it can't be rebuilt."""
+    global _EVAL_TEST_DATASET
+    with _EVAL_TEST_DATASET_LOCK:
+        if _EVAL_TEST_DATASET is not None and _EVAL_TEST_DATASET[0] == source:
+            return _EVAL_TEST_DATASET[1]
+        
+        # E.g. after a server restart. Runs under the lock on a request thread, so it never
+        # decodes the whole ZIP: the on-disk cache if there is one, else the lazy dataset
+        try:
+            if source == 'mnist':
+                transform = transforms.Compose([
+                    transforms.ToTensor(),
+                    transforms.Normalize((0.1307,), (0.3081,))
+                ])
+                test_dataset = datasets.MNIST('./data', train=False, transform=transform)
+            elif source.startswith('custom:'):
+                _, test_dataset, dataset_info = load_custom_zip_dataset('./custom_data', build_cache=False)
+                if dataset_info['source'] != source:
+                    return None  # the ZIP changed since this model was trained
+            else:
+                return None
+        except Exception as e:
+            print(f"Could not load test dataset {source}: {e}")
+            return None
+        _EVAL_TEST_DATASET = (source, test_dataset)
+        return test_dataset
+
+def test_model_precomputed(entry, response_format='png'):
+    """test_model via the predictions stored with the checkpoint: one random index, one sample lookup.
+
+    Returns None when the checkpoint has no stored predictions or its test set
+    isn't available, so the caller can fall back to running the model.
+    """
+    test_predictions = entry.test_predictions
+    if not test_predictions or not len(test_predictions['outputs']):
+        return None
+    test_dataset = _test_dataset_for(test_predictions['source'])
+    if test_dataset is None or len(test_dataset) != len(test_predictions['outputs']):
         return None
     
-    saved_data = torch.load(TEMP_MODEL_PATH, map_location=DEVICE)
+    class_names = entry.class_names
+    image_number = random.randrange(len(test_predictions['outputs']))
+    image, actual_label_idx = test_dataset[image_number]
+    actual_label_idx = int(actual_label_idx)
     
-    # Use saved parameters if available, otherwise use defaults
-    input_channels = saved_data.get('input_channels', 1)
-    input_size = saved_data.get('input_size', 28)
-    num_classes = saved_data.get('num_classes', 10)
+    outputs = test_predictions['outputs'][image_number].float().unsqueeze(0)
+    probabilities = torch.nn.functional.softmax(outputs, dim=1).squeeze(0)
+    predicted_label_idx = int(test_predictions['predictions'][image_number])
     
-    model = build_dynamic_cnn(saved_data['layers'], input_channels, input_size, num_classes).to(DEVICE)
-    model.load_state_dict(saved_data['state_dict'])
-    model.eval()
-    return model
+    actual_class = class_names[actual_label_idx]
+    predicted_class = class_names[predicted_label_idx]
+    print(f"Actual: {actual_class} ({actual_label_idx}), Predicted: {predicted_class} ({predicted_label_idx}) "
+          f"[precomputed, test image {image_number}]")
+    
+    if response_format == 'json':
+        result = classification_result(probabilities, class_names, predicted_label_idx)
+        result.update({'actual_class': actual_class, 'actual_index': actual_label_idx})
+        return result
+    
+    mean, std = NORMALIZATION[entry.input_channels]
+    return render_classification(denormalize_image(image, mean, std), probabilities.numpy(), class_names,
+                                 f'Actual: {actual_class}\nPredicted: {predicted_class}')
 
-# Global variable to cache the test dataset
-_TEST_DATASET_CACHE = None
+def classification_result(probabilities, class_names, predicted_label_idx):
+    """JSON-friendly prediction: class name, index and the full probability vector."""
+    return {
+        'predicted_class': class_names[predicted_label_idx],
+        'predicted_index': predicted_label_idx,
+        'probabilities': [float(p) for p in probabilities.reshape(-1).tolist()],
+        'class_names': list(class_names),
+    }
 
-def test_model(model):
+def test_model(entry, response_format='png'):
+    """Classifies a random test image; returns PNG bytes, or a result dict when response_format='json'."""
     global _TEST_DATASET_CACHE
     
+    # Fast path: the checkpoint already holds the outputs for every test image
+    result = test_model_precomputed(entry, response_format)
+    if result is not None:
+        return result
+    
     # Get the model parameters
-    saved_data = torch.load(TEMP_MODEL_PATH, map_location=DEVICE)
-    input_size = saved_data.get('input_size', 28)
-    input_channels = saved_data.get('input_channels', 1)
+    model = entry.model
+    input_size = entry.input_size
+    input_channels = entry.input_channels
     
     # Use cached dataset if available
     if _TEST_DATASET_CACHE is None:
@@ -640,43 +1272,6 @@ def test_model(model):
     
     model.eval()
     
-    def view_classification(image, probabilities, actual_class, predicted_class):
-        if matplotlib.pyplot.get_fignums():
-            matplotlib.pyplot.close('all')
-
-        probabilities = probabilities.cpu().data.numpy().squeeze()
-        fig, (ax1, ax2) = plt.subplots(figsize=(8, 6), ncols=2)
-        
-        # Denormalize based on input channels
-        if input_channels == 1:
-            mean = 0.1307
-            std = 0.3081
-            image_denorm = image.cpu() * std + mean
-            ax1.imshow(image_denorm.squeeze(), cmap='gray')
-        else:
-            mean = 0.5
-            std = 0.5
-            image_denorm = image.cpu() * std + mean
-            image_display = image_denorm.permute(1, 2, 0)
-            ax1.imshow(image_display)
-        
-        ax1.axis('off')
-        ax1.set_title(f'Actual: {actual_class}\nPredicted: {predicted_class}', fontsize=12)
-        
-        ax2.barh(np.arange(len(class_names)), probabilities)
-        ax2.set_aspect(0.1)
-        ax2.set_yticks(np.arange(len(class_names)))
-        ax2.set_yticklabels(class_names)
-        ax2.set_title('Class Probability')
-        ax2.set_xlim(0, 1.1)
-        plt.tight_layout()
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf.getvalue()
-
     # Get a batch and find correct channels
     for images, labels in test_loader:
         if images.shape[1] == input_channels:
@@ -716,14 +1311,21 @@ def test_model(model):
     if probabilities.dim() == 0:
         probabilities = torch.nn.functional.softmax(outputs, dim=1).squeeze(0)
         
+    if response_format == 'json':
+        result = classification_result(probabilities, class_names, predicted_label_idx)
+        result.update({'actual_class': actual_class, 'actual_index': actual_label_idx})
+        return result
+        
     # Return the image bytes
-    return view_classification(image, probabilities, actual_class, predicted_class)
+    mean, std = NORMALIZATION[input_channels]
+    return render_classification(denormalize_image(image, mean, std), probabilities.cpu().numpy(), class_names,
+                                 f'Actual: {actual_class}\nPredicted: {predicted_class}')
 
-def test_model_custom_image(model, image):
+def test_model_custom_image(entry, image, response_format='png'):
+    """Classifies an uploaded image; returns PNG bytes, or a result dict when response_format='json'."""
     # Get the model parameters
-    saved_data = torch.load(TEMP_MODEL_PATH, map_location=DEVICE)
-    input_size = saved_data.get('input_size', 28)
-    input_channels = saved_data.get('input_channels', 1)
+    input_size = entry.input_size
+    input_channels = entry.input_channels
     
     # FIX: Get class names from the same source as test_model
     global _TEST_DATASET_CACHE
@@ -732,23 +1334,8 @@ def test_model_custom_image(model, image):
         # Use cached class names from test_model
         _, class_names = _TEST_DATASET_CACHE
     else:
-        # Get class names the same way test_model does
-        custom_dataset_path = './custom_data'
-        test_path = os.path.join(custom_dataset_path, 'test')
-        
-        if os.path.exists(test_path):
-            test_dataset = datasets.ImageFolder(root=test_path)
-            class_names = test_dataset.classes
-            print(f"Using custom dataset classes: {class_names}")
-        else:
-            # Use the same fallback as test_model
-            if input_channels == 1:
-                class_names = [str(i) for i in range(10)]
-                print("Using MNIST class names (0-9)")
-            else:
-                class_names = ['airplane', 'automobile', 'bird', 'cat', 'deer', 
-                              'dog', 'frog', 'horse', 'ship', 'truck']
-                print("Using CIFAR-10 class names")
+        # Class names saved with the checkpoint (falls back to MNIST/CIFAR names)
+        class_names = entry.class_names
     
     # Convert image if needed
     if isinstance(image, np.ndarray):
@@ -786,50 +1373,8 @@ def test_model_custom_image(model, image):
     elif input_channels == 3 and image_tensor.shape[0] == 1:
         image_tensor = image_tensor.repeat(3, 1, 1)
     
-    model.eval()
-    
-    def view_classification(image, probabilities, predicted_class):
-        if matplotlib.pyplot.get_fignums():
-            matplotlib.pyplot.close('all')
-
-        probabilities = probabilities.cpu().data.numpy().squeeze()
-        fig, (ax1, ax2) = plt.subplots(figsize=(8, 6), ncols=2)
-        
-        # Denormalize based on input channels
-        if input_channels == 1:
-            mean = 0.1307
-            std = 0.3081
-            image_denorm = image.cpu() * std + mean
-            ax1.imshow(image_denorm.squeeze(), cmap='gray')
-        else:
-            mean = 0.5
-            std = 0.5
-            image_denorm = image.cpu() * std + mean
-            image_display = image_denorm.permute(1, 2, 0)
-            ax1.imshow(image_display)
-        
-        ax1.axis('off')
-        ax1.set_title(f'Predicted: {predicted_class}', fontsize=12)
-        
-        ax2.barh(np.arange(len(class_names)), probabilities)
-        ax2.set_aspect(0.1)
-        ax2.set_yticks(np.arange(len(class_names)))
-        ax2.set_yticklabels(class_names)
-        ax2.set_title('Class Probability')
-        ax2.set_xlim(0, 1.1)
-        plt.tight_layout()
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf.getvalue()
-
-    # Prepare image for model
-    batched_image = image_tensor.unsqueeze(0).to(DEVICE)
-
-    with torch.no_grad():
-        outputs = model(batched_image)
+    # Run through the micro-batcher so concurrent requests share one forward pass
+    outputs = INFERENCE_BATCHER.predict(entry, image_tensor).unsqueeze(0)
     
     probabilities = torch.nn.functional.softmax(outputs, dim=1).squeeze()
     predicted_label_idx = torch.argmax(probabilities).item()
@@ -844,18 +1389,35 @@ def test_model_custom_image(model, image):
     if probabilities.dim() == 0:
         probabilities = torch.nn.functional.softmax(outputs, dim=1).squeeze(0)
         
+    if response_format == 'json':
+        return classification_result(probabilities, class_names, predicted_label_idx)
+        
     # Return the image bytes
-    return view_classification(image_tensor, probabilities, predicted_class)
+    mean, std = NORMALIZATION[input_channels]
+    return render_classification(denormalize_image(image_tensor, mean, std), probabilities.cpu().numpy(), class_names,
+                                 f'Predicted: {predicted_class}')
 
 
 # ---------------
 
-def download_model():
-    """Returns the bytes of the saved model file for download."""
-    if not os.path.exists(TEMP_MODEL_PATH):
+def download_model(variant='fp32'):
+    """Returns the bytes of the saved model file for download.
+
+    variant='int8' returns the quantized TorchScript model instead (None if the
+    checkpoint has none); it loads with torch.jit.load, without this code.
+    variant='onnx' returns the ONNX export (see onnx_inference.py).
+    """
+    if variant == 'int8':
+        entry = MODEL_REGISTRY.get()
+        if entry is None or entry.int8 is None:
+            return None
+        return entry.int8['model'].numpy().tobytes()
+    
+    path = onnx_path_for(TEMP_MODEL_PATH) if variant == 'onnx' else TEMP_MODEL_PATH
+    if not os.path.exists(path):
         return None
     
-    with open(TEMP_MODEL_PATH, 'rb') as f:
+    with open(path, 'rb') as f:
         model_bytes = f.read()
     
     return model_bytes
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+import io
+import copy
+import warnings
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+# Quantize after training only if the run sets training_config['quantize'] = True (or QUANTIZE_INT8=1)
+QUANTIZE_INT8 = os.environ.get('QUANTIZE_INT8', '0') == '1'
+# Largest accuracy drop (fp32 - int8, accuracies in 0..1) at which the server still serves int8
+INT8_ACCURACY_TOLERANCE = float(os.environ.get('INT8_ACCURACY_TOLERANCE', 0.01))
+# Test images used to calibrate the activation ranges of the conv stack
+CALIBRATION_SAMPLES = 512
+
+
+def _quantize_prefix(prefix, calibration_batches, engine):
+    """Static post-training quantization of the conv stack (FX graph mode)."""
+    prepared = prepare_fx(prefix, get_default_qconfig_mapping(engine), (calibration_batches[0][:1],))
+    with torch.no_grad():
+        for images in calibration_batches:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def quantize_int8(prefix, head, calibration_batches):
+    """int8 TorchScript copy of a build_dynamic_cnn model split by split_feature_prefix (CPU only).
+
+    The conv stack `prefix` is statically quantized with activation ranges
+    observed on `calibration_batches`; the Linear `head` is dynamically
+    quantized (weights int8, activations quantized per batch).
+    """
+    engine = torch.backends.quantized.engine
+    prefix, head = (copy.deepcopy(part).cpu().to(memory_format=torch.contiguous_format).float().eval()
+                    for part in (prefix, head))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # torch.ao.quantization / torch.jit deprecation notices
+        parts = []
+        if len(prefix) > 0:
+            parts.append(_quantize_prefix(prefix, calibration_batches, engine))
+        parts.append(quantize_dynamic(head, {nn.Linear}, dtype=torch.qint8))
+        quantized = nn.Sequential(*parts).eval()
+        with torch.no_grad():
+            return torch.jit.freeze(torch.jit.trace(quantized, calibration_batches[0][:1]))
+
+
+def calibration_batches(loader, samples=CALIBRATION_SAMPLES):
+    """First `samples` images of `loader`, as CPU batches."""
+    batches, seen = [], 0
+    for images, _ in loader:
+        batches.append(images[:samples - seen].cpu().contiguous())
+        seen += len(batches[-1])
+        if seen >= samples:
+            break
+    return batches
+
+
+def int8_accuracy(module, loader):
+    correct, total = 0, 0
+    with torch.no_grad():
+        for images, labels in loader:
+            predicted = module(images.cpu().contiguous()).argmax(1)
+            correct += (predicted == labels.cpu()).sum().item()
+            total += labels.size(0)
+    return correct / total if total else 0.0
+
+
+def serialize_int8(module):
+    """TorchScript bytes as a uint8 tensor (plain bytes aren't allowed by torch.load(weights_only=True))."""
+    buffer = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        torch.jit.save(module, buffer)
+    return torch.frombuffer(bytearray(buffer.getvalue()), dtype=torch.uint8)
+
+
+def load_int8(model_bytes):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return torch.jit.load(io.BytesIO(model_bytes), map_location='cpu')
+
+
+def within_tolerance(int8_info, tolerance=None):
+    """True if the recorded int8 accuracy is close enough to the fp32 accuracy to serve int8."""
+    tolerance = INT8_ACCURACY_TOLERANCE if tolerance is None else tolerance
+    return int8_info['fp32_accuracy'] - int8_info['accuracy'] <= tolerance
@@ -0,0 +1,303 @@
+import os
+import copy
+import math
+import time
+import uuid
+import random
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SWEEPS_PATH = './sweeps'
+CUSTOM_DATASET_PATH = './custom_data'
+# Trials running at once; each gets cpu_count // parallel intra-op threads
+DEFAULT_PARALLEL_TRIALS = int(os.environ.get('SWEEP_PARALLEL_TRIALS', max(1, (os.cpu_count() or 1) // 2)))
+MAX_TRIALS = 64
+
+
+def expand_search_space(space, mode='grid', num_samples=8, seed=None):
+    """Turns a search space into a list of (model_layers, training_config) candidates.
+
+    space = {
+        "model_layers": [[...layers A...], [...layers B...]],
+        "training_config": {"batchSize": [32, 64], "optimizer": ["Adam", "SGD"], "epochs": [3]}
+    }
+    'grid' takes the full cartesian product, 'random' samples num_samples of it.
+    Plain (non-list) training_config values are passed through unchanged.
+    """
+    layer_options = space.get('model_layers') or [[]]
+    config_space = space.get('training_config', {})
+    keys = sorted(config_space)
+    value_options = [v if isinstance(v, list) else [v] for v in (config_space[k] for k in keys)]
+
+    if mode == 'random':
+        rng = random.Random(seed)
+        combos = []
+        for _ in range(num_samples):
+            layers = rng.choice(layer_options)
+            values = [rng.choice(options) for options in value_options]
+            combos.append((layers, values))
+    else:
+        combos = [(layers, list(values))
+                  for layers in layer_options
+                  for values in itertools.product(*value_options)]
+
+    candidates = []
+    for layers, values in combos:
+        config = dict(zip(keys, values))
+        candidates.append((copy.deepcopy(layers), config))
+    return candidates[:MAX_TRIALS]
+
+
+def _init_worker(num_threads):
+    import torch
+    torch.set_num_threads(num_threads)
+    # Training runs size themselves from the thread budget; cap it at this worker's share
+    from thread_budget import THREAD_BUDGET
+    THREAD_BUDGET.set_total(num_threads)
+
+
+def _run_trial(trial_id, layers, config, epochs, epochs_trained, checkpoint_path):
+    """Pool worker: trains one candidate up to `epochs` total and reports its metrics.
+
+    Trials promoted from an earlier rung resume from their own checkpoint
+    (weights + optimizer state) and only train the extra epochs.
+    """
+    from pytorch_trainer import train_model
+
+    # Serving artifacts and profiling are skipped per trial; the winner gets int8/ONNX in _finalize_trial
+    trial_config = dict(config, epochs=epochs - epochs_trained, quantize=False, export_onnx=False,
+                        profile=None, progress_interval=0)
+    warm_start_path = None
+    if epochs_trained > 0 and os.path.exists(checkpoint_path):
+        warm_start_path = checkpoint_path
+    else:
+        trial_config['epochs'] = epochs
+    start_time = time.time()
+    output, final_loss, final_accuracy = train_model(layers, trial_config, checkpoint_path=checkpoint_path,
+                                                     warm_start_path=warm_start_path)
+    error = output[0] if output and str(output[0]).startswith('ERROR') else None
+    return {
+        "trial_id": trial_id,
+        "loss": final_loss,
+        "accuracy": final_accuracy,
+        "epochs": epochs,
+        "wall_time": time.time() - start_time,
+        "error": error,
+    }
+
+
+def _finalize_trial(checkpoint_path, config):
+    """Pool worker: int8 model and ONNX export for the winning trial's checkpoint, as a normal run would have."""
+    from pytorch_trainer import finalize_checkpoint
+    from quantization import QUANTIZE_INT8
+    from onnx_export import EXPORT_ONNX
+
+    return finalize_checkpoint(checkpoint_path, quantize=bool(config.get('quantize', QUANTIZE_INT8)),
+                               export=bool(config.get('export_onnx', EXPORT_ONNX)))
+
+
+class Trial:
+    def __init__(self, trial_id, layers, config):
+        self.id = trial_id
+        self.layers = layers
+        self.config = config
+        self.max_epochs = int(config.get('epochs', 3))
+        self.epochs_trained = 0
+        self.accuracy = None
+        self.loss = None
+        self.wall_time = 0.0
+        self.status = 'pending'
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "trial_id": self.id,
+            "model_layers": self.layers,
+            "training_config": self.config,
+            "status": self.status,
+            "epochs_trained": self.epochs_trained,
+            "accuracy": self.accuracy,
+            "loss": self.loss,
+            "wall_time": self.wall_time,
+            "error": self.error,
+        }
+
+
+class SweepRun:
+    """Successive halving over a set of candidates, trained on a process pool.
+
+    Rung i trains every surviving trial to min(min_epochs * eta**i, its own
+    epochs); after each rung only the best 1/eta (by accuracy) continue.
+    """
+    def __init__(self, candidates, parallel=DEFAULT_PARALLEL_TRIALS, min_epochs=1, eta=3):
+        self.id = uuid.uuid4().hex
+        self.trials = [Trial(i, layers, config) for i, (layers, config) in enumerate(candidates)]
+        self.parallel = max(1, min(parallel, len(self.trials)))
+        self.threads_per_trial = max(1, (os.cpu_count() or 1) // self.parallel)
+        self.min_epochs = max(1, int(min_epochs))
+        self.eta = max(2, int(eta))
+        self.status = 'queued'
+        self.rung = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.artifact_dir = os.path.join(SWEEPS_PATH, self.id)
+        # Best trial once the sweep completes, and the log of its int8/ONNX step
+        self.winner = None
+        self.winner_log = None
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f'sweep-{self.id[:8]}', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def leaderboard(self):
+        ranked = sorted(self.trials, key=lambda t: (t.epochs_trained, t.accuracy or 0.0), reverse=True)
+        return [t.to_dict() for t in ranked]
+
+    def to_dict(self):
+        return {
+            "sweep_id": self.id,
+            "status": self.status,
+            "rung": self.rung,
+            "parallel": self.parallel,
+            "threads_per_trial": self.threads_per_trial,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "winner": self.winner,
+            "winner_log": self.winner_log,
+            "leaderboard": self.leaderboard(),
+        }
+
+    def _rung_epochs(self, trial):
+        return min(self.min_epochs * self.eta ** self.rung, trial.max_epochs)
+
+    def _checkpoint_path(self, trial):
+        return os.path.join(self.artifact_dir, f'trial_{trial.id}.pth')
+
+    def _prepare_dataset(self):
+        """Builds the custom dataset cache once, here, so trial workers only memory-map it.
+
+        Otherwise every rung-0 trial would decode the same ZIP at the same time.
+        Failures are only logged; each trial then reports its own error.
+        """
+        if not (os.path.isdir(CUSTOM_DATASET_PATH) and os.listdir(CUSTOM_DATASET_PATH)):
+            return
+        lazy_settings = {t.config.get('lazy_dataset') for t in self.trials}
+        if lazy_settings == {True}:
+            return  # every trial streams from the ZIP; there is no cache to share
+        from pytorch_trainer import load_custom_zip_dataset
+        try:
+            load_custom_zip_dataset(CUSTOM_DATASET_PATH, lazy=False if False in lazy_settings else None)
+        except Exception as e:
+            print(f"Sweep {self.id[:8]}: could not prepare the custom dataset: {e}")
+
+    def _finalize_winner(self, pool):
+        finished = [t for t in self.trials if t.status != 'failed' and t.accuracy is not None]
+        if not finished:
+            return
+        winner = max(finished, key=lambda t: (t.epochs_trained, t.accuracy))
+        self.winner = winner.id
+        print(f"Sweep {self.id[:8]}: exporting winning trial {winner.id}")
+        try:
+            self.winner_log = pool.submit(_finalize_trial, self._checkpoint_path(winner), winner.config).result()
+        except Exception as e:
+            self.winner_log = [f"Exporting trial {winner.id} failed: {e}"]
+
+    def _run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        self._prepare_dataset()
+        ctx = multiprocessing.get_context('spawn')
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.parallel, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(self.threads_per_trial,)) as pool:
+                alive = list(self.trials)
+                while alive and not self._cancel.is_set():
+                    to_run = [t for t in alive if t.epochs_trained < self._rung_epochs(t)]
+                    if not to_run:
+                        break
+                    print(f"Sweep {self.id[:8]} rung {self.rung}: training {len(to_run)} trial(s)")
+
+                    futures = {}
+                    for trial in to_run:
+                        trial.status = 'running'
+                        futures[pool.submit(_run_trial, trial.id, trial.layers, trial.config,
+                                            self._rung_epochs(trial), trial.epochs_trained,
+                                            self._checkpoint_path(trial))] = trial
+
+                    for future in as_completed(futures):
+                        trial = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            trial.status, trial.error = 'failed', str(e)
+                            continue
+                        trial.epochs_trained = result['epochs']
+                        trial.accuracy, trial.loss = result['accuracy'], result['loss']
+                        trial.wall_time += result['wall_time']
+                        trial.error = result['error']
+                        trial.status = 'failed' if trial.error else 'running'
+                        if self._cancel.is_set():
+                            break
+
+                    if self._cancel.is_set():
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        break
+
+                    # Successive halving: keep the best 1/eta of this rung
+                    ranked = sorted((t for t in alive if t.status != 'failed'),
+                                    key=lambda t: t.accuracy or 0.0, reverse=True)
+                    keep = max(1, math.ceil(len(ranked) / self.eta))
+                    for trial in ranked[keep:]:
+                        trial.status = 'completed' if trial.epochs_trained >= trial.max_epochs else 'stopped'
+                    alive = ranked[:keep]
+                    self.rung += 1
+
+                    if all(t.epochs_trained >= t.max_epochs for t in alive):
+                        break
+
+                for trial in alive:
+                    if trial.status == 'running':
+                        trial.status = 'completed' if trial.epochs_trained >= trial.max_epochs else 'stopped'
+
+                if not self._cancel.is_set():
+                    self._finalize_winner(pool)
+        except Exception as e:
+            print(f"Sweep {self.id[:8]} failed: {e}")
+            self.error = str(e)
+            self.status = 'failed'
+        else:
+            self.status = 'cancelled' if self._cancel.is_set() else 'completed'
+        finally:
+            self.finished_at = time.time()
+        print(f"Sweep {self.id[:8]} {self.status}")
+
+
+_SWEEPS = {}
+_SWEEPS_LOCK = threading.Lock()
+
+
+def start_sweep(space, mode='grid', num_samples=8, parallel=None, min_epochs=1, eta=3, seed=None):
+    candidates = expand_search_space(space, mode, num_samples, seed)
+    if not candidates:
+        raise ValueError("Search space produced no candidates")
+    sweep = SweepRun(candidates, parallel or DEFAULT_PARALLEL_TRIALS, min_epochs, eta)
+    with _SWEEPS_LOCK:
+        _SWEEPS[sweep.id] = sweep
+    sweep.start()
+    return sweep
+
+
+def get_sweep(sweep_id):
+    with _SWEEPS_LOCK:
+        return _SWEEPS.get(sweep_id)
@@ -0,0 +1,45 @@
+import io
+import zipfile
+import numpy as np
+import pytest
+from PIL import Image
+
+# One conv block + output layer: trains in well under a second on the tiny dataset
+TINY_LAYERS = [{'type': 'Convolutional', 'outputChannels': 4}]
+
+
+def make_image_zip(path, classes=('cat', 'dog', 'fox'), train_per_class=12, test_per_class=4, size=8, seed=0):
+    """Random grayscale PNGs in the layout /upload_dataset expects: data/<split>/<class>/<n>.png."""
+    rng = np.random.default_rng(seed)
+    with zipfile.ZipFile(path, 'w') as archive:
+        for split, count in (('train', train_per_class), ('test', test_per_class)):
+            for class_name in classes:
+                for i in range(count):
+                    buffer = io.BytesIO()
+                    Image.fromarray((rng.random((size, size)) * 255).astype(np.uint8)).save(buffer, 'PNG')
+                    archive.writestr(f'data/{split}/{class_name}/{i}.png', buffer.getvalue())
+    return path
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Runs each test in its own folder; checkpoints, jobs and caches live at cwd-relative paths."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def custom_dataset(workdir):
+    """./custom_data/ds.zip, so training never falls back to downloading MNIST."""
+    (workdir / 'custom_data').mkdir()
+    return make_image_zip(workdir / 'custom_data' / 'ds.zip')
+
+
+@pytest.fixture
+def train(custom_dataset):
+    """train_model on the tiny dataset; ONNX export is off unless the config turns it on."""
+    from pytorch_trainer import train_model
+
+    def run(config=None, layers=TINY_LAYERS, **kwargs):
+        return train_model(layers, {'epochs': 1, 'export_onnx': False, **(config or {})}, **kwargs)
+    return run
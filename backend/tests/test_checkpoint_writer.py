@@ -0,0 +1,89 @@
+import os
+import pytest
+import torch
+import checkpoint_writer
+from checkpoint_writer import CheckpointWriter, atomic_save
+from pytorch_trainer import TEMP_MODEL_PATH
+
+
+def test_atomic_save_replaces_without_leftovers(workdir):
+    atomic_save({'version': 1}, 'model.pth')
+    atomic_save({'version': 2}, 'model.pth')
+
+    assert torch.load('model.pth', weights_only=True) == {'version': 2}
+    assert os.listdir(workdir) == ['model.pth']
+
+
+def test_failed_save_keeps_previous_checkpoint(workdir, monkeypatch):
+    atomic_save({'version': 1}, 'model.pth')
+
+    def crash_mid_write(obj, path):
+        with open(path, 'wb') as f:
+            f.write(b'torn')
+        raise OSError("disk full")
+    monkeypatch.setattr(checkpoint_writer.torch, 'save', crash_mid_write)
+
+    with pytest.raises(OSError):
+        atomic_save({'version': 2}, 'model.pth')
+    assert torch.load('model.pth', weights_only=True) == {'version': 1}
+    assert os.listdir(workdir) == ['model.pth']
+
+
+def test_writer_coalesces_to_newest_data(workdir):
+    writer = CheckpointWriter()
+    for version in range(20):
+        writer.submit('model.pth', {'version': version})
+    assert writer.flush('model.pth', timeout=30)
+
+    assert torch.load('model.pth', weights_only=True) == {'version': 19}
+    # Every submit was either written or replaced by a newer one before it started
+    assert writer.writes + writer.coalesced == 20
+
+
+def test_writer_callback_runs_after_rename_and_remove_runs_last(workdir):
+    writer = CheckpointWriter()
+    seen = []
+    writer.submit('model.pth', {'version': 1},
+                  lambda data: seen.append((data, torch.load('model.pth', weights_only=True))))
+    assert writer.flush(timeout=30)
+    assert seen == [({'version': 1}, {'version': 1})]
+
+    writer.submit('old.pth', {'version': 1})
+    writer.remove('old.pth')
+    assert writer.flush(timeout=30)
+    assert not os.path.exists('old.pth')
+
+
+def saved_epochs(train, config, epochs=3):
+    accuracies = {}
+    def record(event):
+        if event.get('epoch') is not None:
+            accuracies[event['epoch']] = event['accuracy']
+    train({'epochs': epochs, **config}, progress_callback=record)
+    return torch.load(TEMP_MODEL_PATH, weights_only=True), accuracies
+
+
+@pytest.mark.parametrize('retention', ['last', 'final'])
+def test_last_and_final_retention_keep_final_epoch(train, retention):
+    saved, _ = saved_epochs(train, {'checkpoint_retention': retention})
+
+    assert saved['epoch'] == 3
+    assert saved['test_predictions'] is not None
+
+
+def test_best_retention_keeps_best_epoch_with_its_predictions(train):
+    saved, accuracies = saved_epochs(train, {'checkpoint_retention': 'best', 'quantize': True}, epochs=4)
+
+    assert saved['accuracy'] == max(accuracies.values())
+    assert accuracies[saved['epoch']] == saved['accuracy']
+    # Also when the best epoch isn't the last one: the extras describe the kept weights
+    assert saved['test_predictions'] is not None
+    assert saved['int8'] is not None
+
+
+def test_keep_last_prunes_history(train, workdir):
+    train({'epochs': 4, 'checkpoint_keep_last': 2})
+
+    history = sorted(name for name in os.listdir(workdir) if '_epoch' in name)
+    assert history == ['temp_model_state_epoch3.pth', 'temp_model_state_epoch4.pth']
+    assert not [name for name in os.listdir(workdir) if name.endswith('.tmp')]
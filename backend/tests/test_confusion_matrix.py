@@ -0,0 +1,50 @@
+import numpy as np
+import torch
+import pytorch_trainer
+from pytorch_trainer import confusion_counts, TEMP_MODEL_PATH
+
+
+def loop_confusion_matrix(labels, predictions, num_classes):
+    """Per-sample loop the matrix used to be built with."""
+    matrix = np.zeros((num_classes, num_classes), dtype=int)
+    for true_label, pred_label in zip(labels.tolist(), predictions.tolist()):
+        matrix[true_label, pred_label] += 1
+    return matrix
+
+
+def test_batched_counts_match_loop():
+    generator = torch.Generator().manual_seed(0)
+    num_classes = 7
+    labels = torch.randint(0, num_classes, (1000,), generator=generator)
+    predictions = torch.randint(0, num_classes, (1000,), generator=generator)
+
+    confusion = torch.zeros(num_classes * num_classes, dtype=torch.long)
+    for batch_labels, batch_predictions in zip(labels.split(64), predictions.split(64)):
+        confusion += confusion_counts(batch_labels, batch_predictions, num_classes)
+
+    expected = loop_confusion_matrix(labels, predictions, num_classes)
+    assert np.array_equal(confusion.view(num_classes, num_classes).numpy(), expected)
+
+
+def test_counts_keep_full_shape_for_unseen_classes():
+    labels = torch.tensor([0, 0, 1])
+    predictions = torch.tensor([1, 0, 1])
+
+    confusion = confusion_counts(labels, predictions, 5).view(5, 5)
+
+    assert confusion.shape == (5, 5)
+    assert confusion.sum() == 3
+    assert np.array_equal(confusion.numpy(), loop_confusion_matrix(labels, predictions, 5))
+
+
+def test_training_run_matrix_matches_saved_predictions(train):
+    run_results = {}
+    train(run_results=run_results)
+
+    saved = torch.load(TEMP_MODEL_PATH, weights_only=True)
+    predictions = saved['test_predictions']
+    expected = loop_confusion_matrix(predictions['labels'].long(), predictions['predictions'].long(),
+                                     saved['num_classes'])
+    assert np.array_equal(run_results['confusion_matrix']['matrix'], expected)
+    # Trained straight into TEMP_MODEL_PATH, so the run's matrix is the one served
+    assert pytorch_trainer.get_confusion_matrix_data()['run_id'] == run_results['confusion_matrix']['run_id']
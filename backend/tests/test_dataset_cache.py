@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import multiprocessing
+import numpy as np
+import pytest
+import pytorch_trainer
+import zip_ingest
+from dataset_cache import DATASET_CACHE_PATH, hash_file, save_cached_arrays, load_cached_arrays, cache_dir_for
+from thread_budget import THREAD_BUDGET
+from conftest import make_image_zip
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Counts how often a ZIP is actually decoded (i.e. the cache missed)."""
+    calls = []
+    build = pytorch_trainer._build_dataset_cache
+    def counting_build(zip_path, zip_hash, *args, **kwargs):
+        calls.append(zip_hash)
+        return build(zip_path, zip_hash, *args, **kwargs)
+    monkeypatch.setattr(pytorch_trainer, '_build_dataset_cache', counting_build)
+    return calls
+
+
+def load():
+    return pytorch_trainer.load_custom_zip_dataset('./custom_data')
+
+
+def load_in_worker(barrier, results):
+    """Sweep-worker stand-in: loads the dataset in its own process, recording whether it decoded."""
+    decoded = []
+    build = pytorch_trainer._build_dataset_cache
+    def counting_build(*args, **kwargs):
+        decoded.append(True)
+        return build(*args, **kwargs)
+    pytorch_trainer._build_dataset_cache = counting_build
+    barrier.wait()
+    _, test_dataset, info = load()
+    results.put((info['source'], len(test_dataset), len(decoded)))
+
+
+def sample_arrays():
+    rng = np.random.default_rng(0)
+    return (rng.integers(0, 255, (6, 4, 4, 1), dtype=np.uint8), [0, 1, 2, 0, 1, 2],
+            rng.integers(0, 255, (3, 4, 4, 1), dtype=np.uint8), [2, 1, 0], {'a': 0, 'b': 1, 'c': 2})
+
+
+def test_round_trip_is_memory_mapped(workdir):
+    train_images, train_labels, test_images, test_labels, class_to_label = sample_arrays()
+    save_cached_arrays('key', train_images, train_labels, test_images, test_labels, class_to_label)
+
+    cached = load_cached_arrays('key')
+    assert isinstance(cached['train_images'], np.memmap)
+    assert np.array_equal(cached['train_images'], train_images)
+    assert np.array_equal(cached['test_labels'], test_labels)
+    assert cached['meta']['class_to_label'] == class_to_label
+    assert cached['meta']['image_size'] == 4 and cached['meta']['channels'] == 1
+
+
+def test_cache_is_keyed_by_zip_content(custom_dataset, decodes):
+    _, _, first = load()
+    assert first['source'] == f"custom:{hash_file(custom_dataset)}"
+
+    # Same bytes under another name: still a hit
+    os.rename(custom_dataset, custom_dataset.with_name('renamed.zip'))
+    _, test_dataset, second = load()
+    assert second['source'] == first['source']
+    assert decodes == [hash_file(custom_dataset.with_name('renamed.zip'))]
+    assert len(test_dataset) == 12
+
+
+def test_changed_zip_misses_the_cache(custom_dataset, decodes):
+    _, _, first = load()
+    make_image_zip(custom_dataset, seed=1)
+    _, _, second = load()
+
+    assert second['source'] != first['source']
+    assert len(decodes) == 2
+
+
+@pytest.mark.parametrize('damage', ['old_version', 'missing_array'])
+def test_unusable_cache_is_ignored(workdir, damage):
+    save_cached_arrays('key', *sample_arrays())
+    cache_dir = cache_dir_for('key')
+    if damage == 'old_version':
+        meta_path = os.path.join(cache_dir, 'meta.json')
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['version'] = 0
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    else:
+        os.remove(os.path.join(cache_dir, 'test_images.npy'))
+
+    assert load_cached_arrays('key') is None
+
+
+def test_missing_cache_is_rebuilt(custom_dataset, decodes):
+    _, _, info = load()
+    shutil.rmtree(cache_dir_for(info['source'].split(':', 1)[1]))
+    load()
+
+    assert len(decodes) == 2
+
+
+def test_existing_cache_is_kept_not_rewritten(workdir):
+    save_cached_arrays('key', *sample_arrays())
+    meta_path = os.path.join(cache_dir_for('key'), 'meta.json')
+    written = os.stat(meta_path).st_ino
+
+    save_cached_arrays('key', *sample_arrays())
+    assert os.stat(meta_path).st_ino == written
+    assert sorted(os.listdir(DATASET_CACHE_PATH)) == ['key']
+
+
+def test_concurrent_processes_decode_once(custom_dataset):
+    context = multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(2), context.Queue()
+    workers = [context.Process(target=load_in_worker, args=(barrier, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    loaded = [results.get(timeout=120) for _ in workers]
+    for worker in workers:
+        worker.join(30)
+
+    assert {(source, size) for source, size, _ in loaded} == {(f"custom:{hash_file(custom_dataset)}", 12)}
+    assert sum(decoded for _, _, decoded in loaded) == 1
+    assert not [name for name in os.listdir(DATASET_CACHE_PATH) if '.tmp' in name]
+
+
+def test_decode_pool_is_sized_from_thread_budget(custom_dataset, monkeypatch):
+    monkeypatch.setattr(zip_ingest, 'DECODE_CHUNK_SIZE', 4)
+    monkeypatch.setattr(zip_ingest, 'MIN_PARALLEL_IMAGES', 0)
+    monkeypatch.setattr(zip_ingest, 'ProcessPoolExecutor', None)  # any pool would fail
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    monkeypatch.setattr(THREAD_BUDGET, 'total', 1)  # e.g. a sweep worker's share of those 8
+
+    arrays = zip_ingest.ingest_zip(str(custom_dataset))
+    assert len(arrays['train_images']) == 36 and len(arrays['test_images']) == 12
+
+
+def test_training_decodes_with_its_thread_share(train, monkeypatch):
+    pool_sizes = []
+    ingest = pytorch_trainer.ingest_zip
+    def recording_ingest(*args, num_workers=None, **kwargs):
+        pool_sizes.append(num_workers)
+        return ingest(*args, num_workers=num_workers, **kwargs)
+    monkeypatch.setattr(pytorch_trainer, 'ingest_zip', recording_ingest)
+    train()
+
+    assert len(pool_sizes) == 1 and 1 <= pool_sizes[0] <= THREAD_BUDGET.total
@@ -0,0 +1,22 @@
+import torch
+import torch.nn as nn
+from inference_batcher import InferenceBatcher
+from model_registry import ModelEntry
+
+
+def tiny_entry(workdir):
+    model = nn.Sequential(nn.Flatten(), nn.Linear(16, 3)).eval()
+    return ModelEntry(model, (1, 1), 1, 4, 3, ['a', 'b', 'c'], [], checkpoint_path=str(workdir / 'model.pth'))
+
+
+def test_stats_report_compiled_backend_only_while_it_serves(workdir):
+    batcher = InferenceBatcher(torch.device('cpu'), window_ms=0, backend='torchscript')
+    entry = tiny_entry(workdir)
+    batcher.predict(entry, torch.zeros(1, 4, 4), timeout=60)
+    assert batcher.stats()['compiled']['backend'] == 'torchscript'
+
+    batcher.configure(backend='eager')
+    assert batcher.stats()['compiled'] is None
+    batcher.predict(entry, torch.zeros(1, 4, 4), timeout=60)
+    assert batcher.stats()['last_served_by'] == 'eager'
+    assert batcher.stats()['compiled'] is None
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import filecmp
+import threading
+import pytest
+import torch
+import pytorch_trainer
+from jobs import JobScheduler, promote_checkpoint
+from onnx_export import onnx_path_for
+from pytorch_trainer import TEMP_MODEL_PATH
+from conftest import TINY_LAYERS
+
+# Far more epochs than a test waits for; these jobs are always cancelled
+ENDLESS = {'epochs': 100000, 'export_onnx': False}
+QUICK = {'epochs': 1, 'export_onnx': False}
+# Async evaluation plus a profiling window longer than any run here
+BACKGROUND_WORK = {'eval_async': True, 'profile': {'wait': 0, 'warmup': 1, 'active': 100000}}
+
+
+def wait_until(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def eval_threads():
+    return [t for t in threading.enumerate() if t.name.startswith('async-eval')]
+
+
+def test_cancel_queued_job_never_runs(custom_dataset):
+    scheduler = JobScheduler(max_concurrent=1)
+    running = scheduler.submit(TINY_LAYERS, ENDLESS)
+    wait_until(lambda: running.status == 'running')
+    queued = scheduler.submit(TINY_LAYERS, QUICK)
+
+    scheduler.cancel(queued.id)
+    assert queued.status == 'cancelled' and queued.finished
+    assert scheduler.stats()['queued'] == 0
+
+    scheduler.cancel(running.id)
+    assert running.wait(60)
+    assert running.status == 'cancelled'
+    assert queued.started_at is None
+    # Nothing finished, so nothing was promoted
+    assert not os.path.exists(TEMP_MODEL_PATH)
+
+
+def test_cancel_releases_eval_thread_and_profiler(custom_dataset):
+    scheduler = JobScheduler(max_concurrent=1)
+    job = scheduler.submit(TINY_LAYERS, dict(ENDLESS, **BACKGROUND_WORK))
+    wait_until(eval_threads)
+
+    scheduler.cancel(job.id)
+    assert job.wait(60)
+    assert job.status == 'cancelled'
+    wait_until(lambda: not eval_threads(), timeout=30)
+    assert not torch.autograd._profiler_enabled()
+
+
+def test_failed_run_releases_eval_thread_and_profiler(train, monkeypatch):
+    def disk_full(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(pytorch_trainer.CHECKPOINT_WRITER, 'submit', disk_full)
+
+    with pytest.raises(OSError):
+        train(dict(BACKGROUND_WORK, epochs=3))
+    assert not torch.autograd._profiler_enabled()
+    wait_until(lambda: not eval_threads(), timeout=30)
+
+
+def test_completed_job_is_promoted(custom_dataset):
+    scheduler = JobScheduler(max_concurrent=1)
+    job = scheduler.submit(TINY_LAYERS, QUICK)
+
+    assert job.wait(120)
+    assert job.status == 'completed'
+    assert filecmp.cmp(job.checkpoint_path, TEMP_MODEL_PATH, shallow=False)
+    assert pytorch_trainer.CONFUSION_MATRIX_DATA['run_id'] == job.run_results['confusion_matrix']['run_id']
+    with open(os.path.join(job.artifact_dir, 'result.json')) as f:
+        assert json.load(f)['accuracy'] == job.result[2]
+
+
+def test_running_job_does_not_replace_promoted_results(custom_dataset):
+    scheduler = JobScheduler(max_concurrent=2)
+    finished = scheduler.submit(TINY_LAYERS, QUICK)
+    running = scheduler.submit(TINY_LAYERS, ENDLESS)
+    assert finished.wait(120)
+    wait_until(lambda: 'confusion_matrix' in finished.run_results)
+
+    promoted_run = finished.run_results['confusion_matrix']['run_id']
+    assert pytorch_trainer.CONFUSION_MATRIX_DATA['run_id'] == promoted_run
+
+    scheduler.cancel(running.id)
+    assert running.wait(60)
+    assert running.status == 'cancelled'
+    assert pytorch_trainer.CONFUSION_MATRIX_DATA['run_id'] == promoted_run
+
+
+def test_promotion_replaces_or_removes_onnx_export(workdir):
+    checkpoint = workdir / 'model.pth'
+    checkpoint.write_bytes(b'new checkpoint')
+    stale_export = onnx_path_for(TEMP_MODEL_PATH)
+    with open(stale_export, 'w') as f:
+        f.write('export of the previous model')
+
+    promote_checkpoint(str(checkpoint))
+    assert open(TEMP_MODEL_PATH, 'rb').read() == b'new checkpoint'
+    assert not os.path.exists(stale_export)
+
+    with open(onnx_path_for(str(checkpoint)), 'w') as f:
+        f.write('export of this model')
+    promote_checkpoint(str(checkpoint))
+    assert open(stale_export).read() == 'export of this model'
@@ -0,0 +1,82 @@
+import pytest
+import progress_hub
+from progress_hub import ProgressHub
+
+
+def epoch_event(epoch):
+    return {'epoch': epoch, 'loss': 1.0, 'accuracy': 0.5}
+
+
+def batch_event(step):
+    return {'stage': 'train', 'step': step}
+
+
+def drain(subscription):
+    events = []
+    while True:
+        try:
+            event = subscription.get(timeout=0)
+        except TimeoutError:
+            return events
+        if event is None:
+            return events + [None]
+        events.append(event)
+
+
+def test_full_queue_drops_oldest_batch_events_first(monkeypatch):
+    monkeypatch.setattr(progress_hub, 'SUBSCRIBER_QUEUE_SIZE', 5)
+    hub = ProgressHub()
+    subscription = hub.subscribe('run')
+
+    published = [epoch_event(1)] + [batch_event(step) for step in range(6)] + [epoch_event(2), batch_event(6)]
+    for event in published:
+        hub.publish('run', event)
+
+    events = drain(subscription)
+    assert len(events) == 5
+    assert subscription.dropped == len(published) - 5
+    # Every epoch event survives; the batch events left are the newest ones, still in order
+    assert [e for e in events if 'epoch' in e] == [epoch_event(1), epoch_event(2)]
+    assert [e['step'] for e in events if 'step' in e] == [4, 5, 6]
+    assert events == [e for e in published if e in events]
+
+
+def test_epoch_events_are_never_dropped(monkeypatch):
+    monkeypatch.setattr(progress_hub, 'SUBSCRIBER_QUEUE_SIZE', 3)
+    hub = ProgressHub()
+    subscription = hub.subscribe('run')
+
+    for epoch in range(10):
+        hub.publish('run', epoch_event(epoch))
+
+    assert drain(subscription) == [epoch_event(epoch) for epoch in range(10)]
+    assert subscription.dropped == 0
+
+
+def test_late_subscriber_replays_milestones_and_recent_batches(monkeypatch):
+    monkeypatch.setattr(progress_hub, 'REPLAY_BATCH_EVENTS', 2)
+    hub = ProgressHub()
+    hub.publish('run', {'status': 'started'})
+    for step in range(5):
+        hub.publish('run', batch_event(step))
+    hub.publish('run', epoch_event(1))
+    hub.close('run')
+
+    events = drain(hub.subscribe('run'))
+    assert events == [{'status': 'started'}, batch_event(3), batch_event(4), epoch_event(1), None]
+
+
+def test_close_ends_live_subscriptions_after_queued_events():
+    hub = ProgressHub()
+    subscription = hub.subscribe('run')
+    woken = []
+    subscription.set_waker(lambda: woken.append(True))
+
+    hub.publish('run', epoch_event(1))
+    hub.close('run')
+
+    assert subscription.get(timeout=0) == epoch_event(1)
+    assert subscription.get(timeout=0) is None
+    assert len(woken) == 2
+    with pytest.raises(TimeoutError):
+        hub.subscribe('other').get(timeout=0)
@@ -0,0 +1,18 @@
+import os
+from dataset_cache import hash_file, load_cached_arrays
+from sweep import SweepRun
+from conftest import TINY_LAYERS
+
+
+def test_dataset_cache_is_built_before_trials_start(custom_dataset):
+    sweep = SweepRun([(TINY_LAYERS, {'epochs': 1}), (TINY_LAYERS, {'epochs': 1, 'batchSize': 8})], parallel=2)
+    sweep._prepare_dataset()
+
+    assert load_cached_arrays(hash_file(custom_dataset)) is not None
+
+
+def test_all_lazy_trials_build_no_cache(custom_dataset):
+    sweep = SweepRun([(TINY_LAYERS, {'epochs': 1, 'lazy_dataset': True})])
+    sweep._prepare_dataset()
+
+    assert not os.path.exists('dataset_cache')
@@ -0,0 +1,34 @@
+import shutil
+import pytest
+import torch
+import pytorch_trainer
+from dataset_cache import CachedArrayDataset, LazyZipDataset, cache_dir_for
+from data_pipeline import dataset_labels
+from pytorch_trainer import TEMP_MODEL_PATH
+
+
+@pytest.fixture
+def stored_predictions(train, monkeypatch):
+    """test_predictions of a freshly trained checkpoint, as a restarted server sees it (no test set in memory)."""
+    train()
+    monkeypatch.setattr(pytorch_trainer, '_EVAL_TEST_DATASET', None)
+    def no_decode(*args, **kwargs):
+        raise AssertionError("the ZIP was decoded on the request path")
+    monkeypatch.setattr(pytorch_trainer, '_build_dataset_cache', no_decode)
+    saved = torch.load(TEMP_MODEL_PATH, weights_only=True)
+    return saved['test_predictions']
+
+
+def test_restart_uses_the_existing_cache(stored_predictions):
+    test_dataset = pytorch_trainer._test_dataset_for(stored_predictions['source'])
+
+    assert isinstance(test_dataset, CachedArrayDataset)
+    assert torch.equal(dataset_labels(test_dataset), stored_predictions['labels'].long())
+
+
+def test_evicted_cache_falls_back_to_lazy_dataset(stored_predictions):
+    shutil.rmtree(cache_dir_for(stored_predictions['source'].split(':', 1)[1]))
+    test_dataset = pytorch_trainer._test_dataset_for(stored_predictions['source'])
+
+    assert isinstance(test_dataset, LazyZipDataset)
+    assert torch.equal(dataset_labels(test_dataset), stored_predictions['labels'].long())
@@ -0,0 +1,23 @@
+import pytest
+import torch
+from pytorch_trainer import TEMP_MODEL_PATH
+
+
+@pytest.mark.parametrize('channels_last', [False, True])
+@pytest.mark.parametrize('precision', ['fp32', 'bf16'])
+def test_zero_epochs(train, precision, channels_last):
+    output, final_loss, final_accuracy = train({'epochs': 0, 'precision': precision,
+                                                'channels_last': channels_last})
+
+    assert (final_loss, final_accuracy) == (0.0, 0.0)
+    assert not any(line.startswith('ERROR') for line in output)
+
+
+@pytest.mark.parametrize('precision', ['fp32', 'bf16'])
+def test_one_epoch(train, precision):
+    output, _, final_accuracy = train({'precision': precision})
+
+    assert 0.0 <= final_accuracy <= 1.0
+    assert torch.load(TEMP_MODEL_PATH, weights_only=True)['epoch'] == 1
+    compared = [line for line in output if line.startswith('Precision: final accuracy')]
+    assert len(compared) == (1 if precision == 'bf16' else 0)
@@ -0,0 +1,139 @@
+import os
+import threading
+import torch
+from contextlib import contextmanager
+from metrics import Gauge
+
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# CPU threads shared by training runs, the inference batcher and DataLoader workers
+CPU_THREAD_BUDGET = int(os.environ.get('CPU_THREAD_BUDGET', 0)) or _available_cpus()
+# Inter-op pool size; torch only lets this be set once, before the first parallel op
+INTEROP_THREADS = int(os.environ.get('INTEROP_THREADS', 0)) or min(2, CPU_THREAD_BUDGET)
+# Inference stops counting as a consumer after this many seconds without requests
+INFERENCE_IDLE_SECONDS = float(os.environ.get('INFERENCE_IDLE_SECONDS', 10))
+
+
+class TrainingLease:
+    """One training run's claim on the budget (see ThreadBudget.training)."""
+    def __init__(self, budget, name, cpu_share):
+        self.budget = budget
+        self.name = name
+        # Threads this run could use if it shares the budget evenly; sizes its DataLoader workers
+        self.cpu_share = cpu_share
+        self.loader_threads = 0
+
+    def set_loader_threads(self, count):
+        """Records the run's DataLoader workers / prefetch thread, which come out of the budget."""
+        self.loader_threads = count
+        self.budget.rebalance()
+
+
+class ThreadBudget:
+    """Splits a fixed number of CPU threads between training, inference and input pipelines.
+
+    PyTorch's intra-op pool size is process-wide, and every thread running ops
+    in parallel uses that many threads. So the budget left after DataLoader
+    workers is divided by the number of active compute consumers (training
+    runs, plus inference while it has recent requests), and the pool is
+    resized whenever one starts or stops. The pool never grows past the size
+    it had when the budget was created, so a cap set before (e.g. by a sweep
+    worker, see set_total) is respected.
+    """
+    def __init__(self, total, interop_threads=INTEROP_THREADS):
+        self.total = max(1, total)
+        self.max_intra_op_threads = torch.get_num_threads()
+        self._lock = threading.Lock()
+        self._leases = []
+        self._inference_active = False
+        self.intra_op_threads = None
+        self.rebalances = 0
+        try:
+            torch.set_num_interop_threads(max(1, interop_threads))
+        except RuntimeError as e:
+            print(f"Thread budget: inter-op threads already fixed at {torch.get_num_interop_threads()} ({e})")
+        self.rebalance()
+
+    def _consumers(self):
+        return len(self._leases) + (1 if self._inference_active else 0)
+
+    def rebalance(self):
+        with self._lock:
+            loader_threads = sum(lease.loader_threads for lease in self._leases)
+            intra_op = max(1, (self.total - loader_threads) // max(1, self._consumers()))
+            intra_op = min(intra_op, self.max_intra_op_threads)
+            if intra_op != self.intra_op_threads:
+                torch.set_num_threads(intra_op)
+                self.intra_op_threads = intra_op
+                self.rebalances += 1
+                print(f"Thread budget: {intra_op} intra-op threads ({len(self._leases)} training, "
+                      f"inference {'active' if self._inference_active else 'idle'}, "
+                      f"{loader_threads} loader threads, budget {self.total})")
+
+    def set_total(self, total):
+        """Resizes the budget, e.g. to one sweep worker process's share of the CPUs."""
+        with self._lock:
+            self.total = max(1, total)
+            self.max_intra_op_threads = min(self.max_intra_op_threads, self.total)
+        self.rebalance()
+
+    @contextmanager
+    def training(self, name):
+        """Holds a TrainingLease for the duration of a training run."""
+        with self._lock:
+            cpu_share = max(1, self.total // (self._consumers() + 1))
+            lease = TrainingLease(self, name, cpu_share)
+            self._leases.append(lease)
+        self.rebalance()
+        try:
+            yield lease
+        finally:
+            with self._lock:
+                self._leases.remove(lease)
+            self.rebalance()
+
+    def set_inference_active(self, active):
+        """Called by the inference batcher per batch (True) and after INFERENCE_IDLE_SECONDS idle (False)."""
+        if active == self._inference_active:
+            return
+        with self._lock:
+            self._inference_active = active
+        self.rebalance()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget": self.total,
+                "intra_op_threads": self.intra_op_threads,
+                "max_intra_op_threads": self.max_intra_op_threads,
+                "interop_threads": torch.get_num_interop_threads(),
+                "inference_active": self._inference_active,
+                "training_runs": [{"name": lease.name, "cpu_share": lease.cpu_share,
+                                   "loader_threads": lease.loader_threads} for lease in self._leases],
+                "loader_threads": sum(lease.loader_threads for lease in self._leases),
+                "rebalances": self.rebalances,
+            }
+
+
+THREAD_BUDGET = ThreadBudget(CPU_THREAD_BUDGET)
+
+
+def _thread_counts():
+    stats = THREAD_BUDGET.stats()
+    return {('budget',): stats['budget'], ('intra_op',): stats['intra_op_threads'],
+            ('interop',): stats['interop_threads'], ('loader',): stats['loader_threads']}
+
+
+def _consumer_counts():
+    stats = THREAD_BUDGET.stats()
+    return {('training',): len(stats['training_runs']), ('inference',): int(stats['inference_active'])}
+
+
+THREADS_GAUGE = Gauge('neuralforge_threads', 'CPU thread budget and its current split.', _thread_counts, ['pool'])
+THREAD_CONSUMERS_GAUGE = Gauge('neuralforge_thread_budget_consumers',
+                               'Active consumers sharing the intra-op thread pool.', _consumer_counts, ['kind'])
@@ -0,0 +1,248 @@
+import io
+import time
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
+from metrics import PHASE_SECONDS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Images per worker task, and the archive size below which a pool isn't worth starting
+DECODE_CHUNK_SIZE = 512
+MIN_PARALLEL_IMAGES = 2000
+
+
+def index_zip_members(file_list):
+    """Single pass over the ZIP paths: assigns each image a class label and a split.
+
+    Returns (entries, class_to_label) where entries is a list of
+    (member_name, label, is_train) in archive order. No image data is read.
+    """
+    entries = []
+    class_to_label = {}
+    next_label = 0
+
+    for file_path in file_list:
+        if not file_path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+
+        # Parse the path to get label and split type
+        parts = file_path.split('/')
+
+        # Debug: print the path structure
+        if len(entries) < 5:  # Only print first few for debugging
+            print(f"Processing: {file_path}, Parts: {parts}")
+
+        # Find the class folder name (the folder containing the image)
+        class_name = None
+        for i, part in enumerate(parts):
+            if i < len(parts) - 1:  # Not the last part (filename)
+                if parts[i+1].lower().endswith(IMAGE_EXTENSIONS):
+                    class_name = part
+                    break
+
+        # If we couldn't find class name, try the folder before the file
+        if class_name is None and len(parts) >= 2:
+            class_name = parts[-2]  # Folder containing the image file
+
+        if not class_name:
+            continue
+
+        # Add to class mapping if new class
+        if class_name not in class_to_label:
+            class_to_label[class_name] = next_label
+            next_label += 1
+
+        # Determine if it's train or test
+        is_train = any(x in file_path.lower() for x in ['training', 'train'])
+        is_test = any(x in file_path.lower() for x in ['testing', 'test'])
+
+        # If no clear train/test, use folder structure or default to train
+        if not is_train and not is_test:
+            # Check if file is in a train/test folder
+            for part in parts:
+                if 'train' in part.lower():
+                    is_train = True
+                    break
+                elif 'test' in part.lower():
+                    is_test = True
+                    break
+            # If still not clear, default to train
+            if not is_train and not is_test:
+                is_train = True
+
+        entries.append((file_path, class_to_label[class_name], is_train))
+
+    return entries, class_to_label
+
+
+def decode_image(data):
+    """Decodes image bytes the same way the training loader always has: keep 'L', else RGB."""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'L':
+        image = image.convert('RGB')
+    return image
+
+
+def image_to_array(image, image_size, channels):
+    """Converts a decoded image to a uint8 (H, W, C) array of the packed size/mode."""
+    mode = 'L' if channels == 1 else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    if image.size != image_size:
+        image = image.resize(image_size)
+    return np.asarray(image, dtype=np.uint8).reshape(image_size[1], image_size[0], channels)
+
+
+def _decode_chunk(zip_path, members, image_size, channels):
+    """Worker: decodes `members` with its own ZIP handle into one packed array.
+
+    Returns (chunk_array, ok_mask, warnings); rows for failed images are skipped.
+    """
+    arrays = []
+    ok = np.zeros(len(members), dtype=bool)
+    warnings = []
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for i, member in enumerate(members):
+            try:
+                image = decode_image(zip_ref.read(member))
+                arrays.append(image_to_array(image, image_size, channels))
+                ok[i] = True
+            except Exception as e:
+                warnings.append(f"Warning: Could not load {member}: {e}")
+
+    if arrays:
+        packed = np.stack(arrays)
+    else:
+        packed = np.empty((0, image_size[1], image_size[0], channels), dtype=np.uint8)
+    return packed, ok, warnings
+
+
+def probe_format(zip_ref, entries):
+    """Size and channel count of the first decodable training image."""
+    for member, _, is_train in entries:
+        if not is_train:
+            continue
+        try:
+            image = decode_image(zip_ref.read(member))
+        except Exception:
+            continue
+        return image.size, (3 if image.mode == 'RGB' else 1)
+    return None, None
+
+
+def index_zip(zip_path):
+    """Returns (entries, class_to_label, image_size, channels) without decoding the archive."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # Get all files in the ZIP
+        file_list = zip_ref.namelist()
+        print(f"Files in ZIP: {len(file_list)}")
+        print(f"First few files: {file_list[:10]}")  # Debug: show first 10 files
+
+        entries, class_to_label = index_zip_members(file_list)
+        image_size, channels = probe_format(zip_ref, entries)
+
+    if image_size is None:
+        print(f"Found {len(entries)} image files but couldn't load any")
+        print(f"Image files: {[e[0] for e in entries[:20]]}")  # Show first 20 image files
+        raise Exception("No training images found in ZIP file")
+
+    return entries, class_to_label, image_size, channels
+
+
+def split_entries(entries):
+    """Train/test entries, with the same 80/20 fallback when there is no test set."""
+    train_entries = [e for e in entries if e[2]]
+    test_entries = [e for e in entries if not e[2]]
+    if train_entries and not test_entries:
+        print("No test folder found, splitting train data 80/20")
+        split_idx = int(0.8 * len(train_entries))
+        test_entries = train_entries[split_idx:]
+        train_entries = train_entries[:split_idx]
+    return train_entries, test_entries
+
+
+def ingest_zip(zip_path, num_workers=None, progress_callback=None, index=None):
+    """Indexes and decodes an image ZIP into packed uint8 arrays.
+
+    Decoding runs on a process pool (one ZIP handle per worker) for large
+    archives. The result matches the serial loader: archive order, images that
+    fail to decode are dropped, and train is split 80/20 if there is no test set.
+    Pass `index` (the result of index_zip) to skip re-indexing the archive.
+    num_workers defaults to the process's CPU thread budget (THREAD_BUDGET.total),
+    which a sweep worker has already capped at its share.
+    Returns a dict with train/test images (N, H, W, C), labels and class_to_label.
+    """
+    if index is None:
+        index = index_zip(zip_path)
+    entries, class_to_label, image_size, channels = index
+
+    members = [e[0] for e in entries]
+    chunks = [members[i:i + DECODE_CHUNK_SIZE] for i in range(0, len(members), DECODE_CHUNK_SIZE)]
+    if num_workers is None:
+        # Imported here: decode workers import this module and don't need torch
+        from thread_budget import THREAD_BUDGET
+        num_workers = THREAD_BUDGET.total
+    num_workers = max(1, min(num_workers, len(chunks)))
+
+    results = [None] * len(chunks)
+    done = 0
+    start_time = time.time()
+
+    def report(chunk_idx, result):
+        nonlocal done
+        results[chunk_idx] = result
+        for warning in result[2]:
+            print(warning)
+        done += len(chunks[chunk_idx])
+        print(f"Decoded {done}/{len(members)} images ({100.0 * done / len(members):.0f}%)", flush=True)
+        if progress_callback is not None:
+            try:
+                progress_callback({"stage": "ingest", "done": done, "total": len(members)})
+            except Exception:
+                pass
+
+    if num_workers == 1 or len(members) < MIN_PARALLEL_IMAGES:
+        for idx, chunk in enumerate(chunks):
+            report(idx, _decode_chunk(zip_path, chunk, image_size, channels))
+    else:
+        # spawn: forking a process that already runs torch/Flask threads isn't safe
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx) as pool:
+            futures = {
+                pool.submit(_decode_chunk, zip_path, chunk, image_size, channels): idx
+                for idx, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                report(futures[future], future.result())
+
+    PHASE_SECONDS.observe(time.time() - start_time, 'zip_ingest')
+    print(f"Decoded {len(members)} images with {num_workers} worker(s) in {time.time() - start_time:.1f}s")
+
+    images = np.concatenate([r[0] for r in results])
+    ok = np.concatenate([r[1] for r in results])
+    labels = np.array([e[1] for e in entries], dtype=np.int64)[ok]
+    is_train = np.array([e[2] for e in entries], dtype=bool)[ok]
+
+    train_images, train_labels = images[is_train], labels[is_train]
+    test_images, test_labels = images[~is_train], labels[~is_train]
+
+    # If we found images but no test images, split train 80/20
+    if len(train_images) and not len(test_images):
+        print("No test folder found, splitting train data 80/20")
+        split_idx = int(0.8 * len(train_images))
+        test_images, test_labels = train_images[split_idx:], train_labels[split_idx:]
+        train_images, train_labels = train_images[:split_idx], train_labels[:split_idx]
+
+    if not len(train_images):
+        raise Exception("No training images found in ZIP file")
+
+    return {
+        'train_images': train_images,
+        'train_labels': train_labels,
+        'test_images': test_images,
+        'test_labels': test_labels,
+        'class_to_label': class_to_label,
+    }